@@ -1,13 +1,19 @@
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+import argparse
+import datetime
+import json
 import pickle
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
+from logs import get_logger
+from token_store import get_token_store
+
 load_dotenv()
 
+log = get_logger('auth')
+
 SCOPES = [
     'https://www.googleapis.com/auth/documents',
     'https://www.googleapis.com/auth/drive',
@@ -22,34 +28,240 @@ SCOPES = [
 CREDENTIALS_FILE =  "/Users/sujannandikolsunilkumar/docs mcp/creds.json"
 
 
-#Your token file will be generated after you login, so run the server.py and then your token.pickle file will be generated
+#Tokens now live in the token store (see token_store.py). A token.pickle left
+#here by an older version is moved into the store the first time it is needed
 
 TOKEN_FILE = "/Users/sujannandikolsunilkumar/docs mcp/docs-mcp/token.pickle"
 
+# The user the server acts as when a request doesn't name one (e.g. under stdio)
+DEFAULT_USER = os.getenv('DEFAULT_USER_ID', 'default')
+
+
+
+
+# Refresh the access token this many seconds before it expires
+REFRESH_MARGIN_SECONDS = int(os.getenv('TOKEN_REFRESH_MARGIN', 300))
+
+# Wait this long before trying again when a background refresh fails
+REFRESH_RETRY_SECONDS = 30
+
+
+class MissingTokenError(RuntimeError):
+    """Raised when a user has no stored token and can't be sent through the browser flow."""
+
+
+def _creds_from_info(info: dict):
+    from google.oauth2.credentials import Credentials
+
+    return Credentials.from_authorized_user_info(info, SCOPES)
+
+
+def _migrate_token_file(token_file):
+    """Read a token.pickle written by an older version, once, so it can go into the token store"""
+    if not token_file or not os.path.exists(token_file):
+        return None
+    with open(token_file, 'rb') as token:
+        creds = pickle.load(token)
+    log.info("Moved the token in %s into the token store; the file is no longer used", token_file)
+    return creds
+
+
+class CredentialManager:
+    """One user's credentials, shared by every Google service acting for that user.
+
+    The token is loaded once from the token store, refreshed on a background
+    thread shortly before it expires, and written back in one transaction.
+    Refreshes are single-flight: if several callers find the token expired at
+    once, one refreshes and the rest wait for it and reuse the result.
+
+    Args:
+        user_id (str): Key of the user's token in the store
+        credentials_file (str): OAuth client secrets, for the browser flow
+        interactive (bool): Run the browser flow when the user has no usable
+            token; otherwise raise MissingTokenError
+        store: TokenStore to use instead of the process-wide one
+    """
+
+    def __init__(self, user_id: str = DEFAULT_USER, credentials_file: str = None, interactive: bool = True, store=None):
+        self.user_id = user_id
+        self.credentials_file = credentials_file or CREDENTIALS_FILE
+        self.interactive = interactive
+        self._store = store
+        self._creds = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._refresher = None
+        self._closed = False
+        self.refresh_count = 0
+        self.last_refresh = None
+        self.last_error = None
+
+    def get(self):
+        """Return valid credentials, loading or refreshing them only if needed"""
+        creds = self._creds
+        if creds is not None and creds.valid:
+            return creds
+
+        with self._lock:
+            if self._creds is None or not self._creds.valid:
+                self._creds = self._load()
+                # Let the refresher reschedule around the new expiry
+                self._wake.set()
+            self._start_refresher()
+            return self._creds
+
+    def reset(self):
+        """Forget the in-memory token so the next get() reads the token store again"""
+        with self._lock:
+            self._creds = None
+        self._wake.set()
 
+    @property
+    def store(self):
+        # Opened on first use, so importing this module (or forking workers) touches no files
+        return self._store or get_token_store()
+
+    def close(self):
+        """Stop the background refresher, e.g. when the user's clients are evicted"""
+        self._closed = True
+        self._wake.set()
+
+    def _save(self, creds):
+        self.store.save(self.user_id, json.loads(creds.to_json()))
+
+    def _stored(self):
+        info = self.store.load(self.user_id)
+        return _creds_from_info(info) if info else None
+
+    def _load(self):
+        from google.auth.transport.requests import Request
+        from google_auth_oauthlib.flow import InstalledAppFlow
+
+        creds = self._creds
+        if creds is None:
+            creds = self._stored()
+            if creds is None and self.user_id == DEFAULT_USER:
+                creds = _migrate_token_file(TOKEN_FILE)
+                if creds is not None:
+                    self._save(creds)
+
+        if not creds or not creds.valid:
+            if creds and creds.expired and creds.refresh_token:
+                creds.refresh(Request())
+                self._mark_refreshed()
+            elif not self.interactive:
+                raise MissingTokenError(
+                    f"No Google token stored for user {self.user_id!r}; "
+                    f"authorize them with: python authentication.py --user {self.user_id}"
+                )
+            else:
+                if not self.credentials_file or not os.path.exists(self.credentials_file):
+                    raise FileNotFoundError(f"Credentials file not found: {self.credentials_file}")
+                flow = InstalledAppFlow.from_client_secrets_file(
+                    self.credentials_file, SCOPES)
+                creds = flow.run_local_server(port=0)
+
+            self._save(creds)
+
+        return creds
+
+    def _adopt(self, stored):
+        # Update in place: transports and services hold on to this object
+        self._creds.token = stored.token
+        self._creds.expiry = stored.expiry
+        self._mark_refreshed()
+
+    def _mark_refreshed(self):
+        self.refresh_count += 1
+        self.last_refresh = time.time()
+        self.last_error = None
+
+    def _seconds_until_refresh(self) -> float:
+        creds = self._creds
+        if creds is None or not creds.refresh_token:
+            return None
+        if creds.expiry is None:
+            return None
+        # google-auth keeps expiry as a naive UTC datetime
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return (creds.expiry - now).total_seconds() - REFRESH_MARGIN_SECONDS
+
+    def _start_refresher(self):
+        if self._closed:
+            return
+        if self._refresher is None or not self._refresher.is_alive():
+            self._refresher = threading.Thread(target=self._refresh_loop, name='token-refresher', daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        from google.auth.transport.requests import Request
+
+        while not self._closed:
+            wait = self._seconds_until_refresh()
+            if wait is None:
+                # Nothing we can refresh (yet); sleep until reset() or a new token
+                self._wake.wait()
+                self._wake.clear()
+                continue
+
+            if wait > 0:
+                if self._wake.wait(wait):
+                    self._wake.clear()
+                    continue
+
+            try:
+                with self._lock:
+                    # Someone may have refreshed while we were waiting for the lock
+                    if self._creds is not None and self._seconds_until_refresh() <= 0:
+                        # Another worker process may have refreshed it already
+                        stored = self._stored()
+                        if stored is not None and stored.expiry and stored.expiry > self._creds.expiry:
+                            self._adopt(stored)
+                        else:
+                            self._creds.refresh(Request())
+                            self._save(self._creds)
+                            self._mark_refreshed()
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                log.warning("Background token refresh failed, retrying in %ss: %s", REFRESH_RETRY_SECONDS, e)
+                if self._wake.wait(REFRESH_RETRY_SECONDS):
+                    self._wake.clear()
+
+    def status(self) -> dict:
+        creds = self._creds
+        return {
+            'user': self.user_id,
+            'loaded': creds is not None,
+            'valid': bool(creds is not None and creds.valid),
+            'expiry': creds.expiry.isoformat() + 'Z' if creds is not None and creds.expiry else None,
+            'refresh_count': self.refresh_count,
+            'last_refresh': self.last_refresh,
+            'last_error': self.last_error,
+        }
+
+
+# Shared by every client in this process
+credential_manager = CredentialManager()
 
 
 def authenticate():
-    creds = None
-    if not CREDENTIALS_FILE or not os.path.exists(CREDENTIALS_FILE):
-        raise FileNotFoundError(f"Credentials file not found: {CREDENTIALS_FILE}")
-    if os.path.exists(TOKEN_FILE):
-        with open(TOKEN_FILE, 'rb') as token:
-            creds = pickle.load(token)
-    
-    
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            
-            flow = InstalledAppFlow.from_client_secrets_file(
-                CREDENTIALS_FILE, SCOPES)
-            creds = flow.run_local_server(port=0)
-        
-        
-        with open(TOKEN_FILE, 'wb') as token:
-            pickle.dump(creds, token)
-    
+    return credential_manager.get()
+
+
+def authorize(user_id: str, credentials_file: str = None):
+    """Run the browser OAuth flow for a user and keep their token in the token store"""
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
+    flow = InstalledAppFlow.from_client_secrets_file(credentials_file or CREDENTIALS_FILE, SCOPES)
+    creds = flow.run_local_server(port=0)
+    get_token_store().save(user_id, json.loads(creds.to_json()))
     return creds
 
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Authorize a Google account for the MCP server")
+    parser.add_argument('--user', default=DEFAULT_USER, help="User id the token is stored under")
+    parser.add_argument('--credentials', help="OAuth client secrets file (defaults to CREDENTIALS_FILE)")
+    args = parser.parse_args()
+    authorize(args.user, args.credentials)
+    print(f"Stored a token for {args.user!r} in {get_token_store().path}")
@@ -0,0 +1,453 @@
+import datetime
+import email.parser
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs, urlparse
+
+import httplib2
+
+
+def _response(status: int, body, headers: dict = None):
+    info = {'status': str(status), 'content-type': 'application/json; charset=UTF-8'}
+    info.update(headers or {})
+    content = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+    return httplib2.Response(info), content
+
+
+def _error(status: int, message: str, reason: str = None):
+    error = {'code': status, 'message': message}
+    if reason:
+        error['errors'] = [{'reason': reason, 'message': message}]
+    return {'error': error}
+
+
+def _apply_fields(result: dict, fields: str) -> dict:
+    """The subset of partial-response masks we send: top-level names and items(a,b,...)"""
+    keep, item_fields = set(), None
+    for part in re.findall(r'\w+\([^)]*\)|\w+', fields):
+        if part.startswith('items('):
+            keep.add('items')
+            item_fields = set(part[len('items('):-1].split(','))
+        else:
+            keep.add(part)
+    masked = {k: v for k, v in result.items() if k in keep}
+    if item_fields is not None and 'items' in masked:
+        masked['items'] = [{k: v for k, v in item.items() if k in item_fields} for item in masked['items']]
+    return masked
+
+
+class FakeGoogleHttp:
+    """In-process stand-in for the Docs, Drive and Calendar REST endpoints.
+
+    Has the httplib2.Http request() signature, so googleapiclient talks to it
+    exactly as it would to Google, batch calls included: pass `lambda: fake`
+    as PooledHttp's http_factory and hand the PooledHttp to the clients. Only
+    the calls this server makes are implemented, with just enough of a
+    document model to keep indexes and revisions honest. Thread-safe.
+
+    Args:
+        latency (float): Seconds each call takes (per batch, for batch calls)
+        error_rate (float): Share of calls answered with a 503
+        quota_rate (float): Share of calls answered with a 429
+        retry_after (float): Retry-After sent with 429s, in seconds
+        seed (int): Seed for the error draws, so runs are repeatable
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, quota_rate: float = 0.0, retry_after: float = 0.01, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.quota_rate = quota_rate
+        self.retry_after = retry_after
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.documents = {}
+        self.events = {}
+        self._sync_generation = 0
+        self._expired_before = 0
+
+        self.round_trips = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.calls = {}
+
+    # httplib2.Http interface
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5, connection_type=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        body = body or b''
+
+        with self._lock:
+            self.round_trips += 1
+            self.bytes_sent += len(body)
+            failure = self._draw_failure()
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if failure is not None:
+            resp, content = failure
+        elif urlparse(uri).path.endswith('/batch') or '/batch/' in urlparse(uri).path:
+            resp, content = self._batch(headers or {}, body)
+        else:
+            resp, content = self._dispatch(method, uri, body, headers or {})
+
+        with self._lock:
+            self.bytes_received += len(content)
+        return resp, content
+
+    def close(self):
+        pass
+
+    # Bookkeeping
+
+    def _draw_failure(self):
+        draw = self._random.random()
+        if draw < self.quota_rate:
+            return _response(429, _error(429, 'Quota exceeded', 'rateLimitExceeded'), {'retry-after': str(self.retry_after)})
+        if draw < self.quota_rate + self.error_rate:
+            return _response(503, _error(503, 'Backend error', 'backendError'))
+        return None
+
+    def _count(self, name: str):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def reset_counters(self):
+        with self._lock:
+            self.round_trips = 0
+            self.bytes_sent = 0
+            self.bytes_received = 0
+            self.calls = {}
+
+    def counters(self) -> dict:
+        with self._lock:
+            return {
+                'round_trips': self.round_trips,
+                'bytes_sent': self.bytes_sent,
+                'bytes_received': self.bytes_received,
+                'calls': dict(self.calls),
+            }
+
+    # Routing
+
+    def _dispatch(self, method: str, uri: str, body: bytes, headers: dict = None):
+        url = urlparse(uri)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        payload = json.loads(body) if body else {}
+        path = url.path
+
+        match = re.search(r'/v1/documents/([^/:]+):batchUpdate$', path)
+        if match and method == 'POST':
+            return self._batch_update(match.group(1), payload)
+        match = re.search(r'/v1/documents/([^/:]+)$', path)
+        if match and method == 'GET':
+            return self._get_document(match.group(1))
+        if path.endswith('/v1/documents') and method == 'POST':
+            return self._create_document(payload)
+        if path.endswith('/drive/v3/files') and method == 'GET':
+            return self._drive_list(query)
+        match = re.search(r'/drive/v3/files/([^/]+)$', path)
+        if match and method == 'GET':
+            return self._drive_file(match.group(1))
+        match = re.search(r'/drive/v3/files/([^/]+)/export$', path)
+        if match and method == 'GET':
+            return self._drive_export(match.group(1), headers or {})
+        match = re.search(r'/drive/v3/files/([^/]+)/copy$', path)
+        if match and method == 'POST':
+            return self._drive_copy(match.group(1), payload)
+        if re.search(r'/calendar/v3/calendars/[^/]+/events$', path):
+            if method == 'GET':
+                return self._list_events(query)
+            if method == 'POST':
+                return self._insert_event(payload)
+
+        return _response(404, _error(404, f"Fake API has no {method} {path}"))
+
+    def _batch(self, headers: dict, body: bytes):
+        """Answer a multipart/mixed batch by running each part through _dispatch"""
+        content_type = next(v for k, v in headers.items() if k.lower() == 'content-type')
+        message = email.parser.BytesParser().parsebytes(
+            b'Content-Type: ' + content_type.encode('utf-8') + b'\r\n\r\n' + body
+        )
+
+        boundary = uuid.uuid4().hex
+        parts = []
+        for part in message.get_payload():
+            content_id = part['Content-ID']
+            request = part.get_payload()
+            head, _, inner_body = request.partition('\r\n\r\n') if '\r\n\r\n' in request else request.partition('\n\n')
+            method, target, _ = head.splitlines()[0].split(' ', 2)
+
+            resp, content = self._dispatch(method, 'https://fake.googleapis.com' + target, inner_body.encode('utf-8'))
+            parts.append(
+                f"--{boundary}\r\n"
+                f"Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id[1:-1]}>\r\n\r\n"
+                f"HTTP/1.1 {resp.status} {resp.reason}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{content.decode('utf-8')}\r\n"
+            )
+        text = ''.join(parts) + f"--{boundary}--\r\n"
+        return _response(200, text.encode('utf-8'), {'content-type': f'multipart/mixed; boundary={boundary}'})
+
+    # Docs
+
+    def _new_revision(self) -> str:
+        return f"rev-{next(self._ids)}"
+
+    def _create_document(self, payload: dict):
+        self._count('docs.documents.create')
+        with self._lock:
+            document_id = f"doc-{next(self._ids)}"
+            doc = {
+                'documentId': document_id,
+                'title': payload.get('title', 'Untitled document'),
+                'revisionId': self._new_revision(),
+                'text': '\n',
+                'version': 1,
+            }
+            self.documents[document_id] = doc
+        return _response(200, self._render(doc))
+
+    def _render(self, doc: dict) -> dict:
+        content = [{'endIndex': 1, 'sectionBreak': {}}]
+        index = 1
+        for line in doc['text'].splitlines(keepends=True):
+            content.append({
+                'startIndex': index,
+                'endIndex': index + len(line),
+                'paragraph': {'elements': [{
+                    'startIndex': index,
+                    'endIndex': index + len(line),
+                    'textRun': {'content': line, 'textStyle': {}}
+                }], 'paragraphStyle': {'namedStyleType': 'NORMAL_TEXT'}}
+            })
+            index += len(line)
+        return {
+            'documentId': doc['documentId'],
+            'title': doc['title'],
+            'revisionId': doc['revisionId'],
+            'body': {'content': content},
+        }
+
+    def _get_document(self, document_id: str):
+        self._count('docs.documents.get')
+        with self._lock:
+            doc = self.documents.get(document_id)
+            if doc is None:
+                return _response(404, _error(404, 'Requested entity was not found.'))
+            return _response(200, self._render(doc))
+
+    def _batch_update(self, document_id: str, payload: dict):
+        self._count('docs.documents.batchUpdate')
+        with self._lock:
+            doc = self.documents.get(document_id)
+            if doc is None:
+                return _response(404, _error(404, 'Requested entity was not found.'))
+
+            required = payload.get('writeControl', {}).get('requiredRevisionId')
+            if required and required != doc['revisionId']:
+                return _response(400, _error(400, 'The required revision ID does not match the latest revision.'))
+
+            text = doc['text']
+            replies = []
+            for request in payload.get('requests', []):
+                replies.append({})
+                replace = request.get('replaceAllText')
+                if replace is not None:
+                    target = replace['containsText']['text']
+                    replies[-1] = {'replaceAllText': {'occurrencesChanged': text.count(target)}}
+                    text = text.replace(target, replace.get('replaceText', ''))
+                    continue
+                delete = request.get('deleteContentRange')
+                if delete is not None:
+                    start, end = delete['range']['startIndex'], delete['range']['endIndex']
+                    if not 1 <= start < end <= len(text):
+                        return _response(400, _error(400, f"Invalid deletion range {start}-{end}: the segment ends at {len(text) + 1} and its final newline can't be deleted."))
+                    text = text[:start - 1] + text[end - 1:]
+                    continue
+                insert = request.get('insertText')
+                if insert is None:
+                    # Styles, tables and bullets don't change the plain text we model
+                    continue
+                index = insert['location']['index']
+                if not 1 <= index < len(text) + 1:
+                    return _response(400, _error(400, f"Index {index} must be less than the end index of the referenced segment, {len(text) + 1}."))
+                text = text[:index - 1] + insert['text'] + text[index - 1:]
+
+            doc['text'] = text
+            doc['revisionId'] = self._new_revision()
+            doc['version'] += 1
+            return _response(200, {
+                'documentId': document_id,
+                'replies': replies,
+                'writeControl': {'requiredRevisionId': doc['revisionId']},
+            })
+
+    # Drive
+
+    def _drive_file(self, file_id: str):
+        self._count('drive.files.get')
+        with self._lock:
+            doc = self.documents.get(file_id)
+            if doc is None:
+                return _response(404, _error(404, 'File not found.'))
+            return _response(200, self._drive_meta(doc))
+
+    def _drive_meta(self, doc: dict) -> dict:
+        # modifiedTime moves forward with every edit, like Drive's
+        modified = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc) + datetime.timedelta(seconds=doc['version'])
+        return {
+            'id': doc['documentId'],
+            'name': doc['title'],
+            'version': str(doc['version']),
+            'modifiedTime': modified.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+        }
+
+    def _drive_list(self, query: dict):
+        """Every document, paged; the q filter is assumed to ask for non-trashed Docs"""
+        self._count('drive.files.list')
+        page_size = int(query.get('pageSize', 100))
+        start = int(query.get('pageToken', 0))
+        with self._lock:
+            docs = list(self.documents.values())[start:start + page_size + 1]
+            result = {'files': [self._drive_meta(doc) for doc in docs[:page_size]]}
+        if len(docs) > page_size:
+            result['nextPageToken'] = str(start + page_size)
+        if 'fields' in query:
+            fields = query['fields']
+            item_fields = set(re.search(r'files\(([^)]*)\)', fields).group(1).split(','))
+            result['files'] = [{k: v for k, v in item.items() if k in item_fields} for item in result['files']]
+        return _response(200, result)
+
+    def _drive_export(self, file_id: str, headers: dict):
+        """The document's text, honouring Range like Drive's media downloads"""
+        self._count('drive.files.export')
+        with self._lock:
+            doc = self.documents.get(file_id)
+            if doc is None:
+                return _response(404, _error(404, 'File not found.'))
+            content = doc['text'].encode('utf-8')
+        requested = next((v for k, v in headers.items() if k.lower() == 'range'), None)
+        if requested is None:
+            return _response(200, content, {'content-type': 'text/plain'})
+        first, last = (int(n) for n in re.match(r'bytes=(\d+)-(\d+)', requested).groups())
+        piece = content[first:last + 1]
+        return _response(206, piece, {
+            'content-type': 'text/plain',
+            'content-range': f"bytes {first}-{first + len(piece) - 1}/{len(content)}",
+        })
+
+    def _drive_copy(self, file_id: str, payload: dict):
+        self._count('drive.files.copy')
+        with self._lock:
+            source = self.documents.get(file_id)
+            if source is None:
+                return _response(404, _error(404, 'File not found.'))
+            document_id = f"doc-{next(self._ids)}"
+            self.documents[document_id] = dict(
+                source,
+                documentId=document_id,
+                title=payload.get('name') or f"Copy of {source['title']}",
+                revisionId=self._new_revision(),
+                version=1,
+            )
+            return _response(200, {'id': document_id, 'name': self.documents[document_id]['title']})
+
+    def seed_document(self, title: str, text: str) -> str:
+        """Add a document with this text (e.g. a template) and return its id"""
+        with self._lock:
+            document_id = f"doc-{next(self._ids)}"
+            self.documents[document_id] = {
+                'documentId': document_id,
+                'title': title,
+                'revisionId': self._new_revision(),
+                'text': text if text.endswith('\n') else text + '\n',
+                'version': 1,
+            }
+        return document_id
+
+    # Calendar
+
+    def seed_events(self, count: int, start: datetime.datetime = None):
+        """Add `count` one-hour events, one per hour from `start` (default: now)"""
+        start = start or datetime.datetime.now(tz=datetime.timezone.utc)
+        for i in range(count):
+            begin = start + datetime.timedelta(hours=i + 1)
+            self._store_event({
+                'summary': f"Event {i}",
+                'start': {'dateTime': begin.isoformat()},
+                'end': {'dateTime': (begin + datetime.timedelta(hours=1)).isoformat()},
+            })
+
+    def _store_event(self, payload: dict) -> dict:
+        with self._lock:
+            self._sync_generation += 1
+            event_id = f"evt{next(self._ids)}"
+            event = dict(
+                payload,
+                id=event_id,
+                status='confirmed',
+                htmlLink=f"https://www.google.com/calendar/event?eid={event_id}",
+                updated=self._sync_generation,
+            )
+            self.events[event['id']] = event
+            return event
+
+    def cancel_event(self, event_id: str):
+        """Delete an event the way another client would; syncs see it as cancelled"""
+        with self._lock:
+            self._sync_generation += 1
+            self.events[event_id] = dict(self.events[event_id], status='cancelled', updated=self._sync_generation)
+
+    def expire_sync_tokens(self):
+        """Make every sync token handed out so far answer 410 Gone"""
+        with self._lock:
+            self._expired_before = self._sync_generation + 1
+
+    def _list_events(self, query: dict):
+        self._count('calendar.events.list')
+        with self._lock:
+            events = sorted(self.events.values(), key=lambda e: e['start'].get('dateTime') or e['start'].get('date'))
+            generation = self._sync_generation
+
+        if query.get('syncToken'):
+            since = int(query['syncToken'].split('-')[1])
+            if since < self._expired_before:
+                return _response(410, _error(410, 'Sync token is no longer valid, a full sync is required.', 'fullSyncRequired'))
+            events = [e for e in events if e['updated'] > since]
+        else:
+            # Only incremental syncs report deletions
+            events = [e for e in events if e['status'] != 'cancelled']
+            if query.get('timeMin'):
+                time_min = query['timeMin']
+                events = [e for e in events if (e['end'].get('dateTime') or e['end'].get('date')) > time_min]
+        if query.get('timeMax'):
+            time_max = query['timeMax']
+            events = [e for e in events if (e['start'].get('dateTime') or e['start'].get('date')) < time_max]
+
+        size = int(query.get('maxResults', 250))
+        offset = int(query.get('pageToken', 0))
+        page = events[offset:offset + size]
+        result = {'items': [{k: v for k, v in e.items() if k != 'updated'} for e in page]}
+        if offset + size < len(events):
+            result['nextPageToken'] = str(offset + size)
+        else:
+            result['nextSyncToken'] = f"sync-{generation}"
+        if query.get('fields'):
+            result = _apply_fields(result, query['fields'])
+        return _response(200, result)
+
+    def _insert_event(self, payload: dict):
+        self._count('calendar.events.insert')
+        event = self._store_event(payload)
+        event = {k: v for k, v in event.items() if k != 'updated'}
+        return _response(200, event)
@@ -0,0 +1,293 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Benchmarks measure our overhead, not Google's quotas, and must not touch
+# the real search index or event store. Set before any server module loads.
+for _name in ('DOCS_READ_QPM', 'DOCS_WRITE_QPM', 'CALENDAR_READ_QPM', 'CALENDAR_WRITE_QPM', 'DRIVE_READ_QPM', 'DRIVE_WRITE_QPM'):
+    os.environ.setdefault(_name, '100000000')
+os.environ.setdefault('DOCS_SEARCH_INDEX_PATH', '')
+os.environ.setdefault('CALENDAR_STORE_PATH', '')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.setdefault('DOCS_EXPORT_DIR', tempfile.mkdtemp(prefix='docs-mcp-bench-'))
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.fake_google import FakeGoogleHttp
+
+
+PARAGRAPH = "The quick brown fox jumps over the lazy dog. " * 8
+
+MARKDOWN = """# Weekly notes
+
+Some **bold** text, some *italic* text and a [link](https://example.com).
+
+- first point
+  - nested point
+- second point
+
+| Owner | Task |
+|-------|------|
+| Ana | Draft |
+"""
+
+TEMPLATE = ("Proposal for {{client}}\n\nPrepared on {{date}}.\n\n" + PARAGRAPH + "\n") * 20
+
+# A long document and a lightly edited version of it, for replace_doc_content
+REWRITE = "".join(f"Section {i}. {PARAGRAPH}\n" for i in range(200))
+REWRITE_EDITED = REWRITE.replace("Section 10.", "Section 10 (revised).").replace("Section 150. The quick", "Section 150. A slow")
+
+EVENT = {
+    'summary': 'Benchmark sync',
+    'start': {'dateTime': '2030-01-01T10:00:00+00:00'},
+    'end': {'dateTime': '2030-01-01T11:00:00+00:00'},
+}
+
+
+def percentiles(samples: list) -> dict:
+    """p50/p90/p99/mean/max of latency samples, in milliseconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] * 1000
+
+    return {
+        'p50_ms': round(pick(0.50), 3),
+        'p90_ms': round(pick(0.90), 3),
+        'p99_ms': round(pick(0.99), 3),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+def install_fake_clients(fake: FakeGoogleHttp):
+    """Point the server's clients at the fake, through the normal transport and discovery path"""
+    import server
+    from transport import PooledHttp
+    from docs import GoogleDocsClient
+    from cal import CalendarClient
+
+    http = PooledHttp(None, http_factory=lambda: fake)
+    server.docs_client = GoogleDocsClient(http=http)
+    server.calendar_client = CalendarClient(http=http)
+    return server
+
+
+def tool_scenarios(server, doc_id: str, template_id: str, rewrite_id: str) -> dict:
+    """Name -> zero-argument coroutine factory, one MCP tool call each"""
+    rewrites = itertools.cycle([REWRITE_EDITED, REWRITE])
+    return {
+        'create_google_doc': lambda: server.create_google_doc("Benchmark doc"),
+        'create_doc_with_content': lambda: server.create_doc_with_content("Benchmark doc", PARAGRAPH),
+        'create_doc_with_content[markdown]': lambda: server.create_doc_with_content("Benchmark doc", MARKDOWN, format="markdown"),
+        'add_content_to_doc': lambda: server.add_content_to_doc(doc_id, PARAGRAPH),
+        'add_content_to_doc[markdown]': lambda: server.add_content_to_doc(doc_id, MARKDOWN, format="markdown"),
+        'replace_doc_content': lambda: server.replace_doc_content(rewrite_id, next(rewrites)),
+        'read_doc': lambda: server.read_doc(doc_id),
+        'create_docs_batch[10]': lambda: server.create_docs_batch([{'title': f"Doc {i}", 'content': PARAGRAPH} for i in range(10)]),
+        'create_doc_from_template': lambda: server.create_doc_from_template(template_id, "Proposal", {'client': "Acme", 'date': "1 May"}),
+        'export_docs[unchanged]': lambda: server.export_docs(),
+        'search_docs': lambda: server.search_docs("quick fox"),
+        'get_calendar_events': lambda: server.get_calendar_events(10),
+        'get_calendar_events[api window]': lambda: server.get_calendar_events(100, time_min="2000-01-01T00:00:00Z"),
+        'create_calendar_event': lambda: server.create_calendar_event(dict(EVENT)),
+        'create_calendar_events[120]': lambda: server.create_calendar_events([dict(EVENT, summary=f"Session {i}") for i in range(120)]),
+    }
+
+
+async def bench_tools(server, fake: FakeGoogleHttp, iterations: int, only: list = None) -> dict:
+    """Run each tool `iterations` times in sequence, so API counters are attributable"""
+    created = server.docs_client.create_doc("Benchmark target")
+    template_id = fake.seed_document("Proposal template", TEMPLATE)
+    rewrite_id = fake.seed_document("Rewrite target", REWRITE)
+    scenarios = tool_scenarios(server, created['doc_id'], template_id, rewrite_id)
+
+    results = {}
+    for name, call in scenarios.items():
+        if only and name not in only:
+            continue
+        # One untimed call warms discovery, caches and connections
+        await call()
+        fake.reset_counters()
+
+        samples = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            await call()
+            samples.append(time.perf_counter() - started)
+
+        counters = fake.counters()
+        results[name] = dict(
+            percentiles(samples),
+            calls=iterations,
+            round_trips_per_call=round(counters['round_trips'] / iterations, 3),
+            bytes_sent_per_call=round(counters['bytes_sent'] / iterations),
+            bytes_received_per_call=round(counters['bytes_received'] / iterations),
+            api_calls=counters['calls'],
+        )
+    return results
+
+
+async def bench_concurrency(server, fake: FakeGoogleHttp, clients: int, operations: int) -> dict:
+    """`clients` simulated MCP clients each running a read/write/calendar mix"""
+    doc_ids = [server.docs_client.create_doc(f"Client {i}")['doc_id'] for i in range(clients)]
+    fake.reset_counters()
+    samples = []
+
+    async def client(doc_id):
+        mix = [
+            lambda: server.add_content_to_doc(doc_id, PARAGRAPH),
+            lambda: server.read_doc(doc_id),
+            lambda: server.get_calendar_events(10),
+        ]
+        for i in range(operations):
+            started = time.perf_counter()
+            await mix[i % len(mix)]()
+            samples.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(doc_id) for doc_id in doc_ids))
+    elapsed = time.perf_counter() - started
+
+    counters = fake.counters()
+    return dict(
+        percentiles(samples),
+        clients=clients,
+        operations=clients * operations,
+        seconds=round(elapsed, 3),
+        throughput_per_s=round(clients * operations / elapsed, 2),
+        round_trips=counters['round_trips'],
+    )
+
+
+def bench_cold_start(runs: int) -> dict:
+    """Seconds for a fresh interpreter to import the server, i.e. until it can answer initialize"""
+    code = (
+        "import time; started = time.perf_counter(); import server; "
+        "print(time.perf_counter() - started)"
+    )
+    imports, totals = [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-c', code],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        totals.append(time.perf_counter() - started)
+        imports.append(float(output.strip().splitlines()[-1]))
+    return {
+        'runs': runs,
+        'import_ms': round(statistics.median(imports) * 1000, 3),
+        'process_ms': round(statistics.median(totals) * 1000, 3),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> dict:
+    fake = FakeGoogleHttp(
+        latency=args.latency_ms / 1000,
+        error_rate=args.error_rate,
+        quota_rate=args.quota_rate,
+        seed=args.seed,
+    )
+    fake.seed_events(args.events)
+
+    report = {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'config': {
+            'iterations': args.iterations,
+            'latency_ms': args.latency_ms,
+            'error_rate': args.error_rate,
+            'quota_rate': args.quota_rate,
+            'events': args.events,
+        },
+    }
+
+    server = install_fake_clients(fake)
+
+    async def main():
+        report['tools'] = await bench_tools(server, fake, args.iterations, args.tool)
+        report['concurrency'] = [
+            await bench_concurrency(server, fake, clients, args.operations)
+            for clients in args.clients
+        ]
+
+    asyncio.run(main())
+
+    if args.cold_start:
+        report['cold_start'] = bench_cold_start(args.cold_start)
+    return report
+
+
+def compare(old: dict, new: dict) -> str:
+    """Side-by-side p50/p99 and round trips for two reports"""
+    lines = [f"{'tool':<36} {'p50 ms':>18} {'p99 ms':>18} {'round trips':>16}"]
+    for name, after in new.get('tools', {}).items():
+        before = old.get('tools', {}).get(name)
+        if before is None:
+            continue
+        lines.append(
+            f"{name:<36} "
+            f"{before['p50_ms']:>8} -> {after['p50_ms']:<7} "
+            f"{before['p99_ms']:>8} -> {after['p99_ms']:<7} "
+            f"{before['round_trips_per_call']:>6} -> {after['round_trips_per_call']:<6}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the MCP tools against an in-process fake of the Google APIs")
+    parser.add_argument('--iterations', type=int, default=50, help="Calls per tool")
+    parser.add_argument('--tool', action='append', help="Only run this tool scenario (repeatable)")
+    parser.add_argument('--clients', type=int, nargs='*', default=[1, 4, 16], help="Concurrent client counts to try")
+    parser.add_argument('--operations', type=int, default=30, help="Calls per concurrent client")
+    parser.add_argument('--latency-ms', type=float, default=5.0, help="Simulated API latency per round trip")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of calls answered with a 503")
+    parser.add_argument('--quota-rate', type=float, default=0.0, help="Share of calls answered with a 429")
+    parser.add_argument('--events', type=int, default=200, help="Calendar events to seed")
+    parser.add_argument('--cold-start', type=int, default=3, help="Fresh-process import runs (0 to skip)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="Print the difference between two reports and exit")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f_old, open(args.compare[1]) as f_new:
+            print(compare(json.load(f_old), json.load(f_new)))
+        return
+
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,68 +1,207 @@
 from authentication import authenticate, CREDENTIALS_FILE, TOKEN_FILE
+from event_store import EventStore
+import contextvars
 import datetime
+import itertools
 import os.path
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from discovery import build_service
+from transport import get_http
+from scheduler import get_scheduler, CircuitOpenError, PRIORITY_LOW
+from deadlines import DeadlineExceeded, check as check_deadline
+import metrics
+from logs import get_logger, HOT
+from dotenv import load_dotenv
+
+load_dotenv()
+
+log = get_logger('calendar')
+
+
+# Answer get_calendar_events from a local copy kept current with sync tokens.
+# Set CALENDAR_EVENT_STORE=0 to always ask the API instead.
+EVENT_STORE_ENABLED = os.getenv('CALENDAR_EVENT_STORE', '1').lower() not in ('0', 'false', 'no', 'off')
+
+# Optional SQLite file so the local copy survives restarts
+EVENT_STORE_PATH = os.getenv('CALENDAR_STORE_PATH')
+
+# How old the local copy may get before a read triggers an incremental sync
+SYNC_INTERVAL_SECONDS = float(os.getenv('CALENDAR_SYNC_INTERVAL', 30))
+
+# Page size for sync requests (the API maximum)
+SYNC_PAGE_SIZE = 250
+
+# Event properties get_calendar_events shows; API reads ask for nothing else
+EVENT_FIELDS = 'id,summary,start,end,location,htmlLink'
+LIST_FIELDS = f'nextPageToken,items({EVENT_FIELDS})'
+# Syncs also need the sync token, and status to tell deletions apart
+SYNC_FIELDS = f'nextPageToken,nextSyncToken,items({EVENT_FIELDS},status)'
+
+# Inserts per batch HTTP call (the Calendar API allows up to 50)
+BATCH_SIZE = 50
+
+# Batch HTTP calls createEvents keeps in flight at once
+BATCH_CONCURRENCY = int(os.getenv('CALENDAR_BATCH_CONCURRENCY', 4))
 
 
 class CalendarClient:
-    def __init__(self):
-        self.creds = authenticate()
-        self.service = build('calendar', 'v3', credentials=self.creds)
+    def __init__(self, http=None, scheduler=None, store_path=EVENT_STORE_PATH):
+        # Every service shares the pooled, thread-safe transport unless one is passed in
+        if http is None:
+            self.creds = authenticate()
+            http = get_http(self.creds)
+        else:
+            self.creds = getattr(http, 'credentials', None)
+        self.http = http
+        self.service = build_service('calendar', 'v3', http=http)
+        # Built once; googleapiclient rebuilds the resource on every .events() call
+        self._events = self.service.events()
+        self.scheduler = scheduler or get_scheduler()
+        self.store = EventStore(store_path) if EVENT_STORE_ENABLED else None
+        self._sync_lock = threading.Lock()
+
+    def _execute(self, request, kind: str, **kwargs):
+        """Run a Calendar API request through the shared quota scheduler"""
+        return self.scheduler.execute(request, 'calendar', kind, **kwargs)
+
+    def sync(self, force_full: bool = False):
+        """Bring the local event store up to date.
+
+        Uses the stored sync token when there is one, so only changed events
+        come back. A full sync happens the first time, when forced, or when the
+        API answers 410 Gone because the token has expired.
+        """
+        with self._sync_lock:
+            if not force_full and self.store.sync_token:
+                try:
+                    events, sync_token = self._list_all(syncToken=self.store.sync_token)
+                    self.store.apply_changes(events, sync_token)
+                    self.store.last_sync = time.time()
+                    return
+                except HttpError as error:
+                    if error.resp.status != 410:
+                        raise
+                    log.info("Calendar sync token expired, doing a full sync")
+                    self.store.clear()
+
+            horizon = datetime.datetime.now(tz=datetime.timezone.utc)
+            events, sync_token = self._list_all(timeMin=horizon.isoformat())
+            self.store.replace_all(events, sync_token, horizon)
+            self.store.last_sync = time.time()
+
+    def _list_all(self, **params):
+        """Page through events.list and return (events, nextSyncToken)"""
+        events = []
+        page_token = None
+        while True:
+            result = self._execute(self._events.list(
+                calendarId="primary",
+                singleEvents=True,
+                maxResults=SYNC_PAGE_SIZE,
+                pageToken=page_token,
+                fields=SYNC_FIELDS,
+                **params
+            ), 'read')
+            events.extend(result.get('items', []))
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return events, result.get('nextSyncToken')
+
+    def iter_events(self, time_min: str = None, time_max: str = None, page_size: int = SYNC_PAGE_SIZE):
+        """Yield events from the API in start order, fetching one page at a time.
+
+        Only EVENT_FIELDS are requested, and the next page is only fetched once
+        the caller has consumed this one, so stopping early (e.g. with
+        itertools.islice) saves the remaining round trips and memory stays
+        bounded by the page size however large the calendar is.
+
+        Args:
+            time_min (str): RFC 3339 lower bound on event end times
+            time_max (str): RFC 3339 upper bound on event start times
+            page_size (int): Events per request, at most SYNC_PAGE_SIZE
+        """
+        page_token = None
+        while True:
+            result = self._execute(self._events.list(
+                calendarId="primary",
+                timeMin=time_min,
+                timeMax=time_max,
+                maxResults=min(max(1, page_size), SYNC_PAGE_SIZE),
+                singleEvents=True,
+                orderBy="startTime",
+                pageToken=page_token,
+                fields=LIST_FIELDS,
+            ), 'read')
+            yield from result.get('items', [])
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return
+
+    def _fetch(self, num: int, time_min: str = None, time_max: str = None) -> list:
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        start = _parse_time(time_min) if time_min else now
+        end = _parse_time(time_max) if time_max else None
+
+        # The store only holds events that hadn't ended when it was first synced
+        if self.store is None or start < now:
+            events = self.iter_events(start.isoformat(), end.isoformat() if end else None, page_size=num)
+            return list(itertools.islice(events, num))
+
+        stale = time.time() - self.store.last_sync > SYNC_INTERVAL_SECONDS
+        metrics.record_cache('calendar_events', not stale)
+        if stale:
+            try:
+                self.sync()
+            except (CircuitOpenError, DeadlineExceeded) as error:
+                if not self.store.last_sync:
+                    raise
+                # Calendar is down or slow: the last synced copy beats no answer
+                log.warning("Serving events from the local store without syncing: %s", error)
+        return self.store.upcoming(num, now, time_min=start, time_max=end)
     
     # return the next x # of events
-    def GetEvents(self, num: int):
+    def GetEvents(self, num: int, time_min: str = None, time_max: str = None):
         """
-    Get the next 'num' upcoming events from the primary calendar.
+    Get the next 'num' events from the primary calendar.
+
+    Upcoming events are served from the local event store, which only goes to
+    the network for an incremental sync once it is older than
+    CALENDAR_SYNC_INTERVAL seconds. Windows starting in the past are paged
+    from the API (see iter_events) until 'num' events have been read.
     
     Args:
         num (int): Number of events to retrieve
+        time_min (str): Only events ending after this ISO 8601 time (default: now)
+        time_max (str): Only events starting before this ISO 8601 time
         
     Returns:
-        list: List of event dictionaries, or empty list if no events found
+        list: List of event dictionaries, or a message string if none were found
     """
-        now = datetime.datetime.now(tz=datetime.timezone.utc).isoformat()
-    
         try:
-            events_result = (
-                self.service.events()
-                .list(
-                calendarId="primary",
-                timeMin=now,
-                maxResults=num,
-                singleEvents=True,
-                orderBy="startTime",
-            )
-            .execute()
-        )
-        
-            events = events_result.get('items', [])
+            events = self._fetch(num, time_min, time_max)
         
             if not events:
-                print("No upcoming events found.")
+                log.debug("No upcoming events found")
                 return 'no upcoming events found'
         
-            # Print events for debugging/display purposes
-            print(f"Found {len(events)} upcoming event(s):")
+            log.debug("Found %d upcoming event(s)", len(events))
             for i, event in enumerate(events, 1):
                 start = event['start'].get('dateTime', event['start'].get('date'))
-                print(f"{i}. {start} - {event['summary']}")
+                log.debug("%d. %s - %s", i, start, event.get('summary'), extra=HOT)
         
             # Return the events list so it can be used by other functions
             return events
         
         except HttpError as error:
-            print(f"An error occurred: {error}")
+            log.error("Error fetching events: %s", error)
             return 'error fetching events'
     
 
-
-
     def createEvent(self, event: dict):
         """
     Create a Google Calendar event using the provided event dictionary.
@@ -82,45 +221,144 @@ class CalendarClient:
         bool: True if event created successfully, False otherwise
     """
 
-        # Ensure credentials exist
-        if self.creds is None:
-            self.creds = authenticate()
-
-        if self.service is None and self.creds is not None:
-            self.service = build("calendar", "v3", credentials=self.creds)
+        # Ensure we have a service (a client built on a passed-in transport may have no creds)
+        if self.service is None:
+            if self.creds is None:
+                self.creds = authenticate()
+            self.http = get_http(self.creds)
+            self.service = build_service("calendar", "v3", http=self.http)
+            self._events = self.service.events()
 
-    # Validate required fields
-        if not event.get('summary'):
-            print("Missing required parameter: summary")
-            return False
-    
-        if not event.get('start') or not event.get('start', {}).get('dateTime'):
-            print("Missing required parameter: start.dateTime")
-            return False
-    
-        if not event.get('end') or not event.get('end', {}).get('dateTime'):
-            print("Missing required parameter: end.dateTime")
+        event_body, error = build_event_body(event)
+        if error:
+            log.warning("%s", error)
             return False
 
         try:
-            # Validate datetime formats
-            start_iso = event['start']['dateTime']
-            end_iso = event['end']['dateTime']
-        
-            start_dt = datetime.datetime.fromisoformat(start_iso)
-            end_dt = datetime.datetime.fromisoformat(end_iso)
+            result = self._execute(self._events.insert(calendarId='primary', body=event_body), 'write')
+            self._remember_created(event_body, result)
+            log.info("Event created: %s", result.get("htmlLink"))
+            return result.get("htmlLink")
+        except Exception as e:
+            log.error("Error creating event: %s", e)
+            return 'error creating the new calendar event'
 
-            if end_dt <= start_dt:
-                print("Error: End time must be after start time")
-                return False
+    def _remember_created(self, event_body: dict, result: dict):
+        if self.store is None:
+            return
+        if event_body.get('recurrence'):
+            # The store holds single instances, so let the next sync expand these
+            self.store.last_sync = 0
+        else:
+            self.store.upsert(result)
 
-        except ValueError as e:
-            print(f"Invalid datetime format: {e}")
-            return False
+    def createEvents(self, events: list) -> list:
+        """
+    Create many events with batch HTTP requests.
+
+    Every event is validated locally first (see build_event_body), then the
+    valid ones go out in batches of BATCH_SIZE inserts per HTTP call, up to
+    BATCH_CONCURRENCY batches at a time. Each batch takes one quota token per
+    insert from the scheduler, so concurrency never outruns the quota.
+
+    Args:
+        events (list): Event dicts, as for createEvent
+
+    Returns:
+        list: One dict per input, in the same order: 'success' plus 'id' and
+            'link', or 'error'
+    """
+        results = [None] * len(events)
+        bodies = {}
+        for i, event in enumerate(events):
+            body, error = build_event_body(event) if isinstance(event, dict) else (None, "Event must be a dict")
+            if error:
+                results[i] = {'success': False, 'error': error}
+            else:
+                bodies[i] = body
+
+        def on_insert(request_id, response, exception):
+            i = int(request_id)
+            if exception is not None:
+                results[i] = {'success': False, 'error': str(exception)}
+                return
+            self._remember_created(bodies[i], response)
+            results[i] = {'success': True, 'id': response.get('id'), 'link': response.get('htmlLink')}
+
+        indexes = sorted(bodies)
+        chunks = [indexes[start:start + BATCH_SIZE] for start in range(0, len(indexes), BATCH_SIZE)]
+        if len(chunks) == 1:
+            self._run_batch(chunks[0], bodies, on_insert)
+        elif chunks:
+            with ThreadPoolExecutor(max_workers=min(BATCH_CONCURRENCY, len(chunks)), thread_name_prefix='calendar-batch') as pool:
+                for chunk in chunks:
+                    # Each batch carries the caller's context, and with it the tool deadline
+                    pool.submit(contextvars.copy_context().run, self._run_batch, chunk, bodies, on_insert)
+
+        created = sum(1 for r in results if r['success'])
+        log.info("Created %d of %d events", created, len(events))
+        return results
+
+    def _run_batch(self, chunk: list, bodies: dict, callback):
+        handled = set()
+
+        def tracked(request_id, response, exception):
+            handled.add(request_id)
+            callback(request_id, response, exception)
+
+        batch = self.service.new_batch_http_request(callback=tracked)
+        for i in chunk:
+            batch.add(self._events.insert(calendarId='primary', body=bodies[i]), request_id=str(i))
+        try:
+            # Out of time: report this chunk as failed, unsent
+            check_deadline("before the next batch")
+            self._execute(batch, 'write', priority=PRIORITY_LOW, cost=len(chunk))
+        except Exception as e:
+            # The HTTP call itself failed, so anything without a reply failed too
+            for i in chunk:
+                if str(i) not in handled:
+                    callback(str(i), None, e)
 
 
+def _parse_time(value: str) -> datetime.datetime:
+    """ISO 8601 string to an aware datetime; times without an offset are taken as UTC"""
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
+
+
+def build_event_body(event: dict):
+    """Validate an event dict and build the events.insert body from it.
+
+    Returns:
+        tuple: (body, None), or (None, error message) if the event is invalid
+    """
+    # Validate required fields
+    if not event.get('summary'):
+        return None, "Missing required parameter: summary"
+
+    if not event.get('start') or not event.get('start', {}).get('dateTime'):
+        return None, "Missing required parameter: start.dateTime"
+
+    if not event.get('end') or not event.get('end', {}).get('dateTime'):
+        return None, "Missing required parameter: end.dateTime"
+
+    try:
+        # Validate datetime formats
+        start_dt = datetime.datetime.fromisoformat(event['start']['dateTime'])
+        end_dt = datetime.datetime.fromisoformat(event['end']['dateTime'])
+    except ValueError as e:
+        return None, f"Invalid datetime format: {e}"
+
+    try:
+        if end_dt <= start_dt:
+            return None, "End time must be after start time"
+    except TypeError:
+        return None, "Start and end must both have, or both omit, a UTC offset"
+
     # Build the event body with all provided fields
-        event_body = {
+    event_body = {
         "summary": event['summary'],
         "start": {
             "dateTime": event['start']['dateTime'],
@@ -131,27 +369,10 @@ class CalendarClient:
             "timeZone": event['end'].get('timeZone', 'UTC'),
         },
     }
-    
-    # Add optional fields if provided
-        if event.get('description'):
-            event_body['description'] = event['description']
-    
-        if event.get('location'):
-            event_body['location'] = event['location']
 
-        if event.get('attendees'):
-            event_body['attendees'] = event['attendees']
-    
-        if event.get('recurrence'):
-            event_body['recurrence'] = event['recurrence']
-    
-        if event.get('reminders'):
-            event_body['reminders'] = event['reminders']
+    # Add optional fields if provided
+    for field in ('description', 'location', 'attendees', 'recurrence', 'reminders'):
+        if event.get(field):
+            event_body[field] = event[field]
 
-        try:
-            result = self.service.events().insert(calendarId='primary', body=event_body).execute()
-            print(f'Event created: {result.get("htmlLink")}')
-            return result.get("htmlLink")
-        except Exception as e:
-            print(f'Error creating event: {e}')
-            return 'error creating the new calendar event'
\ No newline at end of file
+    return event_body, None
@@ -0,0 +1,118 @@
+import asyncio
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# Write-behind is opt-in: set DOCS_WRITE_BEHIND=1 in your .env file
+WRITE_BEHIND_ENABLED = os.getenv('DOCS_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes', 'on')
+
+# How long to hold appends to a document before flushing them
+WRITE_BEHIND_WINDOW_MS = int(os.getenv('DOCS_WRITE_BEHIND_WINDOW_MS', 250))
+
+# Flush early once this many bytes are buffered for one document
+WRITE_BEHIND_MAX_BYTES = int(os.getenv('DOCS_WRITE_BEHIND_MAX_BYTES', 64 * 1024))
+
+
+class _Buffer:
+    def __init__(self, client):
+        self.client = client
+        self.pieces = []
+        self.futures = []
+        self.size = 0
+        self.timer = None
+
+
+class AppendCoalescer:
+    """Buffers end-of-document appends and writes them as one combined insert.
+
+    Appends to the same document that arrive within the window are joined the
+    same way separate appends would be (blank line between each) and handed to
+    flush_fn as a single string, together with the client they were queued
+    for, so a flush never goes out through a client swapped in since. Every
+    caller waits for the flush that carries its text and gets that flush's
+    result. Flushes for one document run one at a time, in the order they
+    were started.
+
+    Args:
+        flush_fn: async callable (document_id, text, client) -> result dict
+        window_ms (int): How long to wait for more appends after the first one
+        max_bytes (int): Flush straight away once a buffer reaches this size
+    """
+
+    def __init__(self, flush_fn, window_ms: int = WRITE_BEHIND_WINDOW_MS, max_bytes: int = WRITE_BEHIND_MAX_BYTES):
+        self.flush_fn = flush_fn
+        self.window = window_ms / 1000
+        self.max_bytes = max_bytes
+        self._buffers = {}
+        self._locks = {}
+        self._last_flush = {}
+
+    async def append(self, document_id: str, text: str, client=None) -> dict:
+        """Queue text for the end of the document and wait until client has written it."""
+        loop = asyncio.get_running_loop()
+
+        buf = self._buffers.get(document_id)
+        if buf is not None and buf.client is not client:
+            # Different client (e.g. reauthenticated): what it queued goes out first, through it
+            self._start_flush(document_id)
+            buf = None
+        if buf is None:
+            buf = _Buffer(client)
+            buf.timer = loop.call_later(self.window, self._start_flush, document_id)
+            self._buffers[document_id] = buf
+
+        future = loop.create_future()
+        buf.pieces.append(text)
+        buf.futures.append(future)
+        buf.size += len(text.encode('utf-8'))
+
+        if buf.size >= self.max_bytes:
+            self._start_flush(document_id)
+
+        return await future
+
+    async def flush(self, document_id: str = None):
+        """Write out buffered appends now and wait for them (all documents if none given)."""
+        doc_ids = [document_id] if document_id else list(set(self._buffers) | set(self._last_flush))
+        for doc_id in doc_ids:
+            self._start_flush(doc_id)
+            task = self._last_flush.get(doc_id)
+            if task is not None:
+                await asyncio.shield(task)
+
+    def pending(self) -> dict:
+        """Number of buffered appends per document."""
+        return {doc_id: len(buf.pieces) for doc_id, buf in self._buffers.items()}
+
+    def _start_flush(self, document_id: str):
+        buf = self._buffers.pop(document_id, None)
+        if buf is None:
+            return
+        buf.timer.cancel()
+
+        task = asyncio.ensure_future(self._flush(document_id, buf))
+        self._last_flush[document_id] = task
+        task.add_done_callback(lambda t: self._forget(document_id, t))
+
+    async def _flush(self, document_id: str, buf: _Buffer):
+        lock = self._locks.setdefault(document_id, asyncio.Lock())
+        async with lock:
+            try:
+                result = await self.flush_fn(document_id, '\n\n'.join(buf.pieces), buf.client)
+                result = dict(result, coalesced=len(buf.pieces))
+            except Exception as e:
+                result = {'success': False, 'error': str(e)}
+
+            for future in buf.futures:
+                if not future.done():
+                    future.set_result(result)
+
+    def _forget(self, document_id: str, task):
+        # Drop per-document state once nothing else is queued behind this flush
+        if self._last_flush.get(document_id) is task:
+            del self._last_flush[document_id]
+            lock = self._locks.get(document_id)
+            if lock is not None and not lock.locked():
+                del self._locks[document_id]
@@ -0,0 +1,79 @@
+import contextvars
+import functools
+import inspect
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# Seconds a tool call may spend on Google API calls, quota waits and retries
+# included, before it gives up with an error (0 for no limit)
+TOOL_DEADLINE_SECONDS = float(os.getenv('MCP_TOOL_DEADLINE_SECONDS', 30))
+
+# The same for bulk tools (batches, exports, streamed inserts), which wait on
+# quota for many calls in a row; long enough to finish, but still bounded
+BULK_TOOL_DEADLINE_SECONDS = float(os.getenv('MCP_BULK_TOOL_DEADLINE_SECONDS', 600))
+
+# time.monotonic() by which the current tool call must be done, or None.
+# Worker pools copy contextvars, so this follows the call onto its thread.
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised instead of starting, or waiting any longer for, a call that can't finish in time."""
+
+
+def expires_at():
+    """time.monotonic() by which the current tool call must finish, or None."""
+    return _deadline.get()
+
+
+def remaining():
+    """Seconds left for the current tool call, or None if it has no deadline."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check(doing: str):
+    """Raise DeadlineExceeded if the current tool call is out of time."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"Ran out of time {doing} (tool deadline exceeded)")
+
+
+def _enter(seconds):
+    deadline = time.monotonic() + seconds
+    outer = _deadline.get()
+    # A nested deadline can only tighten the one we are already under
+    if outer is not None:
+        deadline = min(deadline, outer)
+    return _deadline.set(deadline)
+
+
+def with_deadline(fn, seconds: float = TOOL_DEADLINE_SECONDS):
+    """Wrap an MCP tool so every Google API call it makes shares one deadline (none if seconds is falsy)"""
+    if not seconds:
+        return fn
+
+    if not inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        def sync_wrapper(*args, **kwargs):
+            token = _enter(seconds)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _deadline.reset(token)
+
+        return sync_wrapper
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        token = _enter(seconds)
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            _deadline.reset(token)
+
+    return wrapper
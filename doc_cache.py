@@ -0,0 +1,93 @@
+import os
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+
+# Total size of the rendered documents we keep in memory, in bytes
+DOC_CACHE_BYTES = int(os.getenv('DOCS_READ_CACHE_BYTES', 32 * 1024 * 1024))
+
+
+def _entry_size(entry: dict) -> int:
+    return sum(len(value.encode('utf-8')) for value in entry.values() if isinstance(value, str))
+
+
+class DocumentCache:
+    """LRU of rendered documents keyed by (document_id, revisionId), bounded by size.
+
+    A revisionId names one exact state of a document's content, so an entry
+    never goes stale; it only stops being the latest. Each entry also carries
+    the Drive `version` it was checked against, which is what lets a reader
+    confirm it is current with a tiny metadata call instead of a full get.
+
+    Args:
+        max_bytes (int): Evict least recently used entries above this size
+    """
+
+    def __init__(self, max_bytes: int = DOC_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    def latest(self, document_id: str):
+        """The newest entry we hold for the document, or None."""
+        with self._lock:
+            key = self._latest.get(document_id)
+            if key is None or key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def get(self, document_id: str, revision_id: str):
+        with self._lock:
+            entry = self._entries.get((document_id, revision_id))
+            if entry is not None:
+                self._entries.move_to_end((document_id, revision_id))
+            return entry
+
+    def put(self, document_id: str, revision_id: str, entry: dict):
+        if not revision_id:
+            return
+        key = (document_id, revision_id)
+        size = _entry_size(entry)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= _entry_size(old)
+            self._entries[key] = entry
+            self._latest[document_id] = key
+            self.size += size
+
+            while self.size > self.max_bytes:
+                (old_doc, old_rev), old = self._entries.popitem(last=False)
+                self.size -= _entry_size(old)
+                if self._latest.get(old_doc) == (old_doc, old_rev):
+                    del self._latest[old_doc]
+
+    def record(self, hit: bool):
+        metrics.record_cache('docs_read', hit)
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
@@ -0,0 +1,167 @@
+import bisect
+import datetime
+import json
+import sqlite3
+import threading
+
+
+def event_time(when: dict) -> datetime.datetime:
+    """Turn an event's start/end dict into an aware datetime (all-day events start at UTC midnight)"""
+    if when.get('dateTime'):
+        value = datetime.datetime.fromisoformat(when['dateTime'])
+    else:
+        value = datetime.datetime.fromisoformat(when['date'])
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+class EventStore:
+    """Local copy of a calendar's events, kept current by events.list sync tokens.
+
+    Holds every event that had not ended at `horizon` (the timeMin of the last
+    full sync), ordered by start time. Events that have ended are pruned as
+    queries pass them. With a path the store is mirrored to SQLite, so a restart
+    only needs an incremental sync instead of a full download.
+
+    Args:
+        path (str): Optional SQLite file to persist events and the sync token in
+    """
+
+    def __init__(self, path: str = None):
+        self._events = {}
+        self._order = []
+        self._lock = threading.RLock()
+        self.sync_token = None
+        self.horizon = None
+        self.last_sync = 0
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS events (id TEXT PRIMARY KEY, body TEXT NOT NULL)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            self._db.commit()
+            self._load()
+
+    def __len__(self):
+        return len(self._events)
+
+    def _load(self):
+        meta = dict(self._db.execute('SELECT key, value FROM meta'))
+        self.sync_token = meta.get('sync_token')
+        if meta.get('horizon'):
+            self.horizon = datetime.datetime.fromisoformat(meta['horizon'])
+        for (body,) in self._db.execute('SELECT body FROM events'):
+            self._put(json.loads(body))
+
+    def _sort_key(self, event: dict):
+        return (event_time(event['start']), event['id'])
+
+    def _put(self, event: dict):
+        self._drop(event['id'])
+        self._events[event['id']] = event
+        bisect.insort(self._order, self._sort_key(event))
+
+    def _drop(self, event_id: str) -> bool:
+        old = self._events.pop(event_id, None)
+        if old is None:
+            return False
+        key = self._sort_key(old)
+        i = bisect.bisect_left(self._order, key)
+        if i < len(self._order) and self._order[i] == key:
+            del self._order[i]
+        return True
+
+    def replace_all(self, events: list, sync_token: str, horizon: datetime.datetime):
+        """Swap in the result of a full sync."""
+        with self._lock:
+            self._events = {}
+            self._order = []
+            for event in events:
+                if event.get('status') != 'cancelled':
+                    self._put(event)
+            self.sync_token = sync_token
+            self.horizon = horizon
+
+            if self._db:
+                with self._db:
+                    self._db.execute('DELETE FROM events')
+                    self._db.executemany(
+                        'INSERT INTO events (id, body) VALUES (?, ?)',
+                        [(e['id'], json.dumps(e)) for e in self._events.values()]
+                    )
+                    self._save_meta()
+
+    def apply_changes(self, events: list, sync_token: str):
+        """Apply the changed (or cancelled) events from an incremental sync."""
+        with self._lock:
+            removed, changed = [], []
+            for event in events:
+                if event.get('status') == 'cancelled':
+                    self._drop(event['id'])
+                    removed.append(event['id'])
+                else:
+                    self._put(event)
+                    changed.append(event)
+            self.sync_token = sync_token
+
+            if self._db:
+                with self._db:
+                    self._db.executemany('DELETE FROM events WHERE id = ?', [(i,) for i in removed])
+                    self._db.executemany(
+                        'INSERT OR REPLACE INTO events (id, body) VALUES (?, ?)',
+                        [(e['id'], json.dumps(e)) for e in changed]
+                    )
+                    self._save_meta()
+
+    def upsert(self, event: dict):
+        """Add an event we created ourselves, ahead of the next sync."""
+        self.apply_changes([event], self.sync_token)
+
+    def clear(self):
+        """Forget everything, e.g. after the server expired our sync token (410)."""
+        self.replace_all([], None, None)
+
+    def _save_meta(self):
+        self._db.executemany(
+            'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+            [
+                ('sync_token', self.sync_token),
+                ('horizon', self.horizon.isoformat() if self.horizon else None),
+            ]
+        )
+
+    def upcoming(self, num: int, now: datetime.datetime = None,
+                 time_min: datetime.datetime = None, time_max: datetime.datetime = None) -> list:
+        """The next `num` events that have not ended yet, ordered by start time.
+
+        Like events.list, time_min drops events that end by then and time_max
+        drops events that start at or after it.
+        """
+        now = now or datetime.datetime.now(tz=datetime.timezone.utc)
+        results, ended = [], []
+
+        with self._lock:
+            for start, event_id in self._order:
+                if time_max is not None and start >= time_max:
+                    break
+                event = self._events[event_id]
+                end = event_time(event['end'])
+                if end <= now:
+                    ended.append(event_id)
+                    continue
+                if time_min is not None and end <= time_min:
+                    continue
+                results.append(event)
+                if len(results) >= num:
+                    break
+
+            # Ended events can never show up again, so stop walking past them
+            for event_id in ended:
+                self._drop(event_id)
+            if ended and self._db:
+                with self._db:
+                    self._db.executemany('DELETE FROM events WHERE id = ?', [(i,) for i in ended])
+
+        return results
@@ -0,0 +1,91 @@
+import json
+import os
+import tempfile
+import threading
+
+
+# Kept inside the export directory, so an archive carries its own history
+MANIFEST_NAME = '.export_manifest.json'
+
+# Progress is saved after this many exports, so an interrupted run loses little
+SAVE_EVERY = 20
+
+
+class ExportManifest:
+    """Which documents an export directory holds, and as of which modifiedTime.
+
+    Lets the next run skip documents that haven't changed since they were
+    exported, and lets an interrupted run pick up where it stopped: finished
+    files are recorded as they land, and the manifest is saved every
+    SAVE_EVERY of them and at the end. File names are stored relative to the
+    directory, so the archive can be moved.
+
+    Args:
+        directory (str): The export directory
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self._docs = {}
+        self._unsaved = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') == 1:
+            self._docs = data.get('docs', {})
+
+    def is_current(self, document_id: str, modified_time: str, format: str) -> bool:
+        """True if the document was exported in this format and hasn't changed since."""
+        with self._lock:
+            entry = self._docs.get(document_id)
+        return (
+            entry is not None
+            and entry['modifiedTime'] == modified_time
+            and entry['format'] == format
+            and os.path.exists(os.path.join(self.directory, entry['file']))
+        )
+
+    def record(self, document_id: str, modified_time: str, format: str, file: str, size: int):
+        """Remember a finished export.
+
+        Returns:
+            str: The file this document was previously exported to, if it had
+                another name (e.g. the document was renamed), else None
+        """
+        with self._lock:
+            previous = self._docs.get(document_id, {}).get('file')
+            self._docs[document_id] = {
+                'modifiedTime': modified_time,
+                'format': format,
+                'file': file,
+                'bytes': size,
+            }
+            self._unsaved += 1
+            due = self._unsaved >= SAVE_EVERY
+        if due:
+            self.save()
+        return previous if previous != file else None
+
+    def save(self):
+        """Write the manifest now (atomically)."""
+        with self._lock:
+            if not self._unsaved:
+                return
+            self._unsaved = 0
+            data = json.dumps({'version': 1, 'docs': self._docs})
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.export_manifest.')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._docs)
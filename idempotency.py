@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+
+# SQLite file remembering results by idempotency key (empty to keep them in memory only)
+IDEMPOTENCY_STORE_PATH = os.getenv(
+    'IDEMPOTENCY_STORE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'idempotency.db')
+)
+
+# How long a key's result is remembered, in seconds
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv('IDEMPOTENCY_TTL_SECONDS', 24 * 60 * 60))
+
+# A call still marked running after this long is assumed dead (e.g. its worker crashed)
+PENDING_TIMEOUT_SECONDS = 300
+
+# Expired keys are deleted every this many stored results
+PURGE_EVERY = 100
+
+# How often a caller waiting on another process's call checks for its result
+POLL_SECONDS = 0.1
+
+
+class IdempotencyKeyReused(ValueError):
+    """Raised when a key comes back with different arguments than it was first used with."""
+
+
+def fingerprint(arguments: dict) -> str:
+    """Stable hash of a tool call's arguments."""
+    return hashlib.sha256(json.dumps(arguments, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class IdempotencyStore:
+    """Results of calls made with an idempotency key, kept for a TTL.
+
+    The first call with a key marks it running, makes the call and stores the
+    result. Repeats get that result back without calling anything. A repeat
+    that arrives while the first call is still running waits for it, whether
+    it runs in this process or another worker sharing the SQLite file. Failed
+    calls are forgotten, so retrying them really retries.
+
+    Args:
+        path (str): SQLite file, or None to keep results in memory
+        ttl (float): Seconds a result is kept
+    """
+
+    def __init__(self, path: str = IDEMPOTENCY_STORE_PATH, ttl: float = IDEMPOTENCY_TTL_SECONDS):
+        self.path = path or ':memory:'
+        self.ttl = ttl
+        self.hits = 0
+        self.waits = 0
+        self.misses = 0
+        self._stored = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, state TEXT NOT NULL, '
+            'result TEXT, started REAL NOT NULL, expires REAL NOT NULL)'
+        )
+        self._purge()
+
+    async def run(self, key: str, arguments_hash: str, call, keep=None):
+        """Return call()'s result for this key, calling it at most once per TTL.
+
+        Args:
+            key (str): Idempotency key, already scoped to the user and tool
+            arguments_hash (str): fingerprint() of the call's arguments
+            call: Coroutine function making the real call
+            keep: Optional predicate; results it rejects are not remembered
+        """
+        waited = False
+        while True:
+            state, result = self._claim(key, arguments_hash)
+            if state == 'run':
+                break
+            if state == 'done':
+                if waited:
+                    self.waits += 1
+                else:
+                    self.hits += 1
+                metrics.record_cache('idempotency', True)
+                return result
+            if state == 'mismatch':
+                raise IdempotencyKeyReused(f"Idempotency key {key.rsplit('/', 1)[-1]!r} was already used with different arguments")
+
+            # Someone else is running it: wait for them, then look again
+            waited = True
+            running = self._inflight.get(key)
+            if running is not None:
+                await asyncio.shield(running)
+            else:
+                await asyncio.sleep(POLL_SECONDS)
+
+        self.misses += 1
+        metrics.record_cache('idempotency', False)
+        done = asyncio.get_running_loop().create_future()
+        self._inflight[key] = done
+        try:
+            result = await call()
+            if keep is None or keep(result):
+                self._complete(key, result)
+            else:
+                self._release(key)
+            return result
+        except BaseException:
+            self._release(key)
+            raise
+        finally:
+            del self._inflight[key]
+            done.set_result(None)
+
+    def _claim(self, key: str, arguments_hash: str):
+        now = time.time()
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._db.execute(
+                    'SELECT fingerprint, state, result, started, expires FROM results WHERE key = ?', (key,)
+                ).fetchone()
+                if row is not None and row[4] <= now:
+                    row = None
+                if row is None:
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO results (key, fingerprint, state, result, started, expires) '
+                        'VALUES (?, ?, ?, NULL, ?, ?)',
+                        (key, arguments_hash, 'running', now, now + self.ttl)
+                    )
+                    return 'run', None
+
+                stored_hash, state, result, started, _ = row
+                if stored_hash != arguments_hash:
+                    return 'mismatch', None
+                if state == 'done':
+                    return 'done', json.loads(result)
+                if now - started > PENDING_TIMEOUT_SECONDS and key not in self._inflight:
+                    # Take over from a call that never finished
+                    self._db.execute('UPDATE results SET started = ? WHERE key = ?', (now, key))
+                    return 'run', None
+                return 'running', None
+            finally:
+                self._db.execute('COMMIT')
+
+    def _complete(self, key: str, result):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE results SET state = 'done', result = ?, expires = ? WHERE key = ?",
+                (json.dumps(result), now + self.ttl, key)
+            )
+        self._stored += 1
+        if self._stored % PURGE_EVERY == 0:
+            self._purge()
+
+    def _release(self, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM results WHERE key = ? AND state = 'running'", (key,))
+
+    def _purge(self):
+        with self._lock:
+            self._db.execute('DELETE FROM results WHERE expires <= ?', (time.time(),))
+
+    def stats(self) -> dict:
+        with self._lock:
+            (stored,) = self._db.execute('SELECT COUNT(*) FROM results').fetchone()
+        return {
+            'keys': stored,
+            'running': len(self._inflight),
+            'hits': self.hits,
+            'waits': self.waits,
+            'misses': self.misses,
+            'ttl_seconds': self.ttl,
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    """The process-wide store, opened on first use (expired keys are purged then)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = IdempotencyStore()
+        return _store
+
+
+def _forget_store():
+    # A SQLite connection must not be shared with a forked child
+    global _store
+    _store = None
+
+
+os.register_at_fork(after_in_child=_forget_store)
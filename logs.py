@@ -0,0 +1,179 @@
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+
+# "json" for one JSON object per line, "text" for a plain readable line
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+
+# Write to this file (rotated) instead of stderr
+LOG_FILE = os.getenv('LOG_FILE')
+LOG_FILE_MAX_BYTES = int(os.getenv('LOG_FILE_MAX_BYTES', 10 * 1024 * 1024))
+LOG_FILE_BACKUPS = int(os.getenv('LOG_FILE_BACKUPS', 5))
+
+# Share of hot-path messages (logged with extra=HOT) that are kept
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 0.01))
+
+# Records waiting for the writer thread; when full, new records are dropped
+# rather than making the caller wait
+LOG_QUEUE_SIZE = 10_000
+
+ROOT_LOGGER = 'docs_mcp'
+
+# Pass as extra= on per-item or per-call messages to have them sampled
+HOT = {'hot': True}
+
+request_id = contextvars.ContextVar('request_id', default='-')
+
+
+class _ContextFilter(logging.Filter):
+    """Stamps the request id on each record, and samples hot-path records"""
+
+    def filter(self, record):
+        if getattr(record, 'hot', False) and random.random() >= LOG_SAMPLE_RATE:
+            return False
+        record.request_id = request_id.get()
+        return True
+
+
+class _JsonFormatter(logging.Formatter):
+    RESERVED = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'request_id', 'hot'}
+
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', '-'),
+            'message': record.getMessage(),
+        }
+        # Anything passed with extra= is kept as a structured field
+        for key, value in vars(record).items():
+            if key not in self.RESERVED and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: when the queue is full the record is dropped and counted"""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+
+_listener = None
+_queue_handler = None
+_setup_lock = threading.Lock()
+
+
+def _writer_handler() -> logging.Handler:
+    if LOG_FILE:
+        handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE,
+            maxBytes=LOG_FILE_MAX_BYTES,
+            backupCount=LOG_FILE_BACKUPS,
+            encoding='utf-8'
+        )
+    else:
+        # Never stdout: under the stdio transport that is the MCP protocol stream
+        handler = logging.StreamHandler(sys.stderr)
+
+    if LOG_FORMAT == 'json':
+        handler.setFormatter(_JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'))
+    return handler
+
+
+def setup_logging():
+    """Route the docs_mcp loggers through a queue to a background writer thread (once)"""
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        records = queue.Queue(LOG_QUEUE_SIZE)
+        _queue_handler = _DroppingQueueHandler(records)
+        _queue_handler.addFilter(_ContextFilter())
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(LOG_LEVEL)
+        root.addHandler(_queue_handler)
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(records, _writer_handler(), respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+        os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def _restart_after_fork():
+    # The writer thread doesn't survive fork(), and the queue's lock may have
+    # been held by it at that moment, so a forked worker gets fresh ones
+    global _listener
+    records = queue.Queue(LOG_QUEUE_SIZE)
+    _queue_handler.queue = records
+    _listener = logging.handlers.QueueListener(records, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the docs_mcp hierarchy, e.g. get_logger('docs') -> docs_mcp.docs"""
+    setup_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def stats() -> dict:
+    return {
+        'level': LOG_LEVEL,
+        'destination': LOG_FILE or 'stderr',
+        'dropped': _DroppingQueueHandler.dropped,
+    }
+
+
+def with_request_id(fn):
+    """Wrap an MCP tool so each call (and the log lines it causes) gets its own request id"""
+    if not inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        def sync_wrapper(*args, **kwargs):
+            token = request_id.set(uuid.uuid4().hex[:12])
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                request_id.reset(token)
+
+        return sync_wrapper
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        token = request_id.set(uuid.uuid4().hex[:12])
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            request_id.reset(token)
+
+    return wrapper
@@ -0,0 +1,553 @@
+import re
+
+
+# Font used for `inline code` and fenced code blocks
+CODE_FONT = 'Courier New'
+
+# Indent for > blockquotes, in points
+QUOTE_INDENT_PT = 36
+
+BULLET_PRESET = 'BULLET_DISC_CIRCLE_SQUARE'
+NUMBERED_PRESET = 'NUMBERED_DECIMAL_ALPHA_ROMAN'
+
+# Inherited text styles we clear on inserted text, so it doesn't pick up
+# the bold/link/etc. of whatever it was inserted next to
+RESET_TEXT_FIELDS = 'bold,italic,underline,strikethrough,link,weightedFontFamily'
+
+HEADING_RE = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+LIST_RE = re.compile(r'^(\s*)([-*+]|\d+[.)])\s+(.*)$')
+FENCE_RE = re.compile(r'^\s*(```|~~~)')
+QUOTE_RE = re.compile(r'^\s*>\s?(.*)$')
+RULE_RE = re.compile(r'^\s*([-*_])(\s*\1){2,}\s*$')
+TABLE_SEPARATOR_RE = re.compile(r'^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?\s*$')
+
+INLINE_RE = re.compile(
+    r'`(?P<code>[^`]+)`'
+    r'|\[(?P<link_text>[^\]]+)\]\((?P<url>[^)\s]+)\)'
+    r'|\*\*\*(?P<bold_italic>.+?)\*\*\*'
+    r'|\*\*(?P<bold>.+?)\*\*'
+    r'|__(?P<bold_u>.+?)__'
+    r'|(?<![\w*])\*(?P<italic>[^*\s](?:[^*]*[^*\s])?)\*(?![\w*])'
+    r'|(?<![\w_])_(?P<italic_u>[^_\s](?:[^_]*[^_\s])?)_(?![\w_])'
+)
+
+
+def utf16_len(text: str) -> int:
+    """Length of text in UTF-16 code units, which is how the Docs API counts indexes"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def parse_inline(text: str):
+    """Strip inline Markdown from one line of text.
+
+    Returns:
+        tuple: (plain_text, spans) where each span is (start, end, style_name, value)
+            with offsets in UTF-16 units from the start of plain_text
+    """
+    plain = []
+    spans = []
+    offset = 0
+    position = 0
+
+    for match in INLINE_RE.finditer(text):
+        before = text[position:match.start()]
+        plain.append(before)
+        offset += utf16_len(before)
+        position = match.end()
+
+        kind = match.lastgroup
+        if kind == 'code':
+            # Code spans are literal, no nested formatting
+            inner, inner_spans = match.group('code'), []
+            styles = [('code', None)]
+        elif kind in ('link_text', 'url'):
+            inner, inner_spans = parse_inline(match.group('link_text'))
+            styles = [('link', match.group('url'))]
+        else:
+            inner, inner_spans = parse_inline(match.group(kind))
+            styles = {
+                'bold_italic': [('bold', None), ('italic', None)],
+                'bold': [('bold', None)],
+                'bold_u': [('bold', None)],
+                'italic': [('italic', None)],
+                'italic_u': [('italic', None)],
+            }[kind]
+
+        length = utf16_len(inner)
+        for style, value in styles:
+            spans.append((offset, offset + length, style, value))
+        for start, end, style, value in inner_spans:
+            spans.append((offset + start, offset + end, style, value))
+        plain.append(inner)
+        offset += length
+
+    plain.append(text[position:])
+    return ''.join(plain), spans
+
+
+def _split_table_row(line: str) -> list:
+    line = line.strip()
+    if line.startswith('|'):
+        line = line[1:]
+    if line.endswith('|'):
+        line = line[:-1]
+    return [cell.strip() for cell in line.split('|')]
+
+
+def parse_blocks(markdown: str) -> list:
+    """Group Markdown lines into blocks.
+
+    Returns a list of tuples, one per block:
+        ('paragraph', text, named_style)   named_style is e.g. 'HEADING_2' or None
+        ('quote', text)
+        ('code', [line, ...])
+        ('list', ordered, [(level, text), ...])
+        ('table', [[cell, ...], ...])
+    """
+    lines = markdown.replace('\r\n', '\n').split('\n')
+    blocks = []
+    paragraph = []
+    i = 0
+
+    def end_paragraph():
+        if paragraph:
+            blocks.append(('paragraph', ' '.join(paragraph), None))
+            paragraph.clear()
+
+    while i < len(lines):
+        line = lines[i]
+        stripped = line.strip()
+
+        if not stripped:
+            end_paragraph()
+            i += 1
+            continue
+
+        if FENCE_RE.match(line):
+            end_paragraph()
+            fence = FENCE_RE.match(line).group(1)
+            code = []
+            i += 1
+            while i < len(lines) and not lines[i].strip().startswith(fence):
+                code.append(lines[i])
+                i += 1
+            blocks.append(('code', code or ['']))
+            i += 1
+            continue
+
+        heading = HEADING_RE.match(line)
+        if heading:
+            end_paragraph()
+            blocks.append(('paragraph', heading.group(2), f"HEADING_{len(heading.group(1))}"))
+            i += 1
+            continue
+
+        if RULE_RE.match(line):
+            # Docs has no insertable horizontal rule; treat it as a block break
+            end_paragraph()
+            i += 1
+            continue
+
+        if stripped.startswith('|') and i + 1 < len(lines) and TABLE_SEPARATOR_RE.match(lines[i + 1]):
+            end_paragraph()
+            rows = [_split_table_row(line)]
+            i += 2
+            while i < len(lines) and lines[i].strip().startswith('|'):
+                rows.append(_split_table_row(lines[i]))
+                i += 1
+            width = max(len(row) for row in rows)
+            blocks.append(('table', [row + [''] * (width - len(row)) for row in rows]))
+            continue
+
+        item = LIST_RE.match(line)
+        if item:
+            end_paragraph()
+            ordered = item.group(2)[0].isdigit()
+            items = []
+            while i < len(lines):
+                item = LIST_RE.match(lines[i])
+                if not item:
+                    break
+                indent = item.group(1).expandtabs(4)
+                items.append((len(indent) // 2, item.group(3)))
+                i += 1
+            blocks.append(('list', ordered, items))
+            continue
+
+        quote = QUOTE_RE.match(line)
+        if quote:
+            end_paragraph()
+            text = []
+            while i < len(lines) and QUOTE_RE.match(lines[i]):
+                text.append(QUOTE_RE.match(lines[i]).group(1).strip())
+                i += 1
+            blocks.append(('quote', ' '.join(t for t in text if t)))
+            continue
+
+        paragraph.append(stripped)
+        i += 1
+
+    end_paragraph()
+    return blocks
+
+
+class _Emitter:
+    """Tracks the insertion cursor while turning blocks into Docs requests."""
+
+    def __init__(self, index: int, separate: bool):
+        self.start = index
+        self.cursor = index
+        self.inserts = []
+        self.styles = []
+        self.bullets = []
+        self.tabs_removed = 0
+        self.pending = []
+        self.pending_start = index
+        # True when the cursor sits at the start of a fresh paragraph
+        self.fresh = not separate
+        self.content_start = None
+
+        if separate:
+            # End the paragraph we were inserted into and leave a blank line
+            self._write('\n\n')
+            self.fresh = True
+
+    def _write(self, text: str):
+        if not self.pending:
+            self.pending_start = self.cursor
+        self.pending.append(text)
+        self.cursor += utf16_len(text)
+
+    def flush_text(self):
+        if self.pending:
+            self.inserts.append({
+                'insertText': {
+                    'location': {'index': self.pending_start},
+                    'text': ''.join(self.pending)
+                }
+            })
+            self.pending = []
+
+    def paragraph(self, text: str):
+        """Write one paragraph; returns (start, end) of its text."""
+        if not self.fresh:
+            self._write('\n')
+        start = self.cursor
+        if self.content_start is None:
+            self.content_start = start
+        self._write(text)
+        self.fresh = False
+        return start, self.cursor
+
+    def text_style(self, start: int, end: int, style: str, value=None):
+        if end <= start:
+            return
+        if style == 'code':
+            text_style = {'weightedFontFamily': {'fontFamily': CODE_FONT}}
+            fields = 'weightedFontFamily'
+        elif style == 'link':
+            text_style = {'link': {'url': value}}
+            fields = 'link'
+        else:
+            text_style = {style: True}
+            fields = style
+        self.styles.append({
+            'updateTextStyle': {
+                'range': {'startIndex': start, 'endIndex': end},
+                'textStyle': text_style,
+                'fields': fields
+            }
+        })
+
+    def paragraph_style(self, start: int, end: int, paragraph_style: dict, fields: str):
+        self.styles.append({
+            'updateParagraphStyle': {
+                'range': {'startIndex': start, 'endIndex': max(end, start + 1)},
+                'paragraphStyle': paragraph_style,
+                'fields': fields
+            }
+        })
+
+    def inline(self, markdown_text: str, prefix: str = ''):
+        """Write a paragraph of inline Markdown; returns (start, end) of the whole paragraph."""
+        plain, spans = parse_inline(markdown_text)
+        start, end = self.paragraph(prefix + plain)
+        text_start = start + utf16_len(prefix)
+        for span_start, span_end, style, value in spans:
+            self.text_style(text_start + span_start, text_start + span_end, style, value)
+        return start, end
+
+    def table(self, rows: list):
+        self.flush_text()
+        if self.content_start is None:
+            # insertTable puts a newline in front of the table
+            self.content_start = self.cursor + 1
+
+        row_count, column_count = len(rows), len(rows[0])
+        self.inserts.append({
+            'insertTable': {
+                'rows': row_count,
+                'columns': column_count,
+                'location': {'index': self.cursor}
+            }
+        })
+
+        # The table starts after the newline insertTable adds. Each row is a
+        # row marker plus, per cell, a cell marker and the cell's empty paragraph.
+        table_start = self.cursor + 1
+        row_size = 1 + 2 * column_count
+
+        cells = []
+        for r, row in enumerate(rows):
+            for c, cell in enumerate(row):
+                plain, spans = parse_inline(cell)
+                cells.append((table_start + 3 + r * row_size + 2 * c, plain, spans, r == 0))
+
+        # Fill from the last cell back, so earlier cell indexes stay valid
+        for index, plain, spans, header in reversed(cells):
+            if plain:
+                self.inserts.append({'insertText': {'location': {'index': index}, 'text': plain}})
+
+        shift = 0
+        for index, plain, spans, header in cells:
+            final = index + shift
+            length = utf16_len(plain)
+            if header:
+                self.text_style(final, final + length, 'bold')
+            for span_start, span_end, style, value in spans:
+                self.text_style(final + span_start, final + span_end, style, value)
+            shift += length
+
+        table_size = 2 + row_count * row_size
+        self.cursor += 1 + table_size + shift
+        self.pending_start = self.cursor
+        # Text after the table lands in the paragraph that follows it
+        self.fresh = True
+
+    def requests(self) -> list:
+        self.flush_text()
+        head = []
+        if self.content_start is not None and self.cursor > self.content_start:
+            head = [
+                {
+                    'updateParagraphStyle': {
+                        'range': {'startIndex': self.content_start, 'endIndex': self.cursor},
+                        'paragraphStyle': {'namedStyleType': 'NORMAL_TEXT'},
+                        'fields': 'namedStyleType'
+                    }
+                },
+                {
+                    'updateTextStyle': {
+                        'range': {'startIndex': self.content_start, 'endIndex': self.cursor},
+                        'textStyle': {},
+                        'fields': RESET_TEXT_FIELDS
+                    }
+                },
+            ]
+        # Bullets strip the leading tabs that set nesting, which shifts every
+        # index after them, so they go last and from the bottom of the page up
+        return self.inserts + head + self.styles + list(reversed(self.bullets))
+
+
+def compile_markdown(markdown: str, index: int, separate: bool = False, trailing_newline: bool = False):
+    """Compile Markdown into one list of Docs batchUpdate requests.
+
+    Works in a single pass over the blocks, computing every index up front:
+    text and tables are inserted in document order, then paragraph and text
+    styles are applied, then bullets. Supports headings, paragraphs, bold,
+    italic, inline code, links, fenced code blocks, blockquotes, nested
+    bulleted/numbered lists and pipe tables.
+
+    Args:
+        markdown (str): The Markdown source
+        index (int): Where to insert. Either just before the newline that ends
+            a paragraph (appending) or at the start of a paragraph
+        separate (bool): Start with a blank line, for appending after existing text
+        trailing_newline (bool): End with a newline, for inserting in front of
+            existing text
+
+    Returns:
+        tuple: (requests, length) where length is how many UTF-16 units the
+            document grows by once every request has been applied
+    """
+    emit = _Emitter(index, separate)
+
+    for block in parse_blocks(markdown):
+        kind = block[0]
+
+        if kind == 'paragraph':
+            _, text, named_style = block
+            start, end = emit.inline(text)
+            if named_style:
+                emit.paragraph_style(start, end, {'namedStyleType': named_style}, 'namedStyleType')
+
+        elif kind == 'quote':
+            start, end = emit.inline(block[1])
+            indent = {'magnitude': QUOTE_INDENT_PT, 'unit': 'PT'}
+            emit.paragraph_style(start, end, {'indentStart': indent, 'indentFirstLine': indent}, 'indentStart,indentFirstLine')
+
+        elif kind == 'code':
+            first = None
+            for line in block[1]:
+                start, end = emit.paragraph(line)
+                first = start if first is None else first
+            emit.text_style(first, end, 'code')
+
+        elif kind == 'list':
+            _, ordered, items = block
+            first = None
+            for level, text in items:
+                start, end = emit.inline(text, prefix='\t' * level)
+                first = start if first is None else first
+                emit.tabs_removed += level
+            emit.bullets.append({
+                'createParagraphBullets': {
+                    'range': {'startIndex': first, 'endIndex': max(end, first + 1)},
+                    'bulletPreset': NUMBERED_PRESET if ordered else BULLET_PRESET
+                }
+            })
+
+        elif kind == 'table':
+            emit.table(block[1])
+
+    if trailing_newline and not emit.fresh:
+        emit._write('\n')
+
+    length = emit.cursor - emit.start - emit.tabs_removed
+    return emit.requests(), length
+
+
+# Fonts we read back as `code`
+MONOSPACE_FONTS = {CODE_FONT, 'Courier', 'Consolas', 'Roboto Mono', 'Source Code Pro', 'Inconsolata'}
+
+HEADING_PREFIXES = {'TITLE': '#', 'SUBTITLE': '##'}
+HEADING_PREFIXES.update({f"HEADING_{n}": '#' * n for n in range(1, 7)})
+
+
+def _text_runs(paragraph: dict):
+    for element in paragraph.get('elements', []):
+        run = element.get('textRun')
+        if run and run.get('content'):
+            yield run['content'], run.get('textStyle', {})
+
+
+def _is_code(style: dict) -> bool:
+    return style.get('weightedFontFamily', {}).get('fontFamily') in MONOSPACE_FONTS
+
+
+def _cell_text(cell: dict) -> str:
+    parts = []
+    for element in cell.get('content', []):
+        for content, _ in _text_runs(element.get('paragraph', {})):
+            parts.append(content)
+    return ' '.join(''.join(parts).split())
+
+
+def render_text(document: dict) -> str:
+    """Plain text of a documents().get() response; table rows come out tab-separated"""
+    out = []
+    for element in document.get('body', {}).get('content', []):
+        if 'paragraph' in element:
+            out.extend(content for content, _ in _text_runs(element['paragraph']))
+        elif 'table' in element:
+            for row in element['table'].get('tableRows', []):
+                out.append('\t'.join(_cell_text(cell) for cell in row.get('tableCells', [])) + '\n')
+    return ''.join(out)
+
+
+def _inline_markdown(content: str, style: dict) -> str:
+    # Keep markers against the text, e.g. "**bold** " rather than "**bold **"
+    stripped = content.strip()
+    if not stripped:
+        return content
+    lead = content[:len(content) - len(content.lstrip())]
+    trail = content[len(content.rstrip()):]
+
+    if _is_code(style):
+        stripped = f"`{stripped}`"
+    else:
+        if style.get('bold') and style.get('italic'):
+            stripped = f"***{stripped}***"
+        elif style.get('bold'):
+            stripped = f"**{stripped}**"
+        elif style.get('italic'):
+            stripped = f"*{stripped}*"
+    url = style.get('link', {}).get('url')
+    if url:
+        stripped = f"[{stripped}]({url})"
+    return lead + stripped + trail
+
+
+def _is_ordered(document: dict, bullet: dict) -> bool:
+    levels = (document.get('lists', {})
+              .get(bullet.get('listId'), {})
+              .get('listProperties', {})
+              .get('nestingLevels', []))
+    level = bullet.get('nestingLevel', 0)
+    if level >= len(levels):
+        return False
+    glyph = levels[level].get('glyphType')
+    return bool(glyph) and glyph not in ('GLYPH_TYPE_UNSPECIFIED', 'NONE')
+
+
+def render_markdown(document: dict) -> str:
+    """Markdown for a documents().get() response, the inverse of compile_markdown.
+
+    Headings, bold, italic, monospace runs, links, lists and tables survive;
+    other formatting is dropped. Consecutive all-monospace paragraphs become
+    a fenced code block.
+    """
+    blocks = []
+    previous = None
+
+    def add(kind: str, text: str):
+        nonlocal previous
+        # List items and code lines stay together; everything else gets a blank line
+        if blocks and not (kind == previous and kind in ('list', 'code')):
+            blocks.append('')
+        if kind == 'code' and previous != 'code':
+            blocks.append('```')
+        elif kind != 'code' and previous == 'code':
+            blocks.insert(len(blocks) - 1, '```')
+        blocks.append(text)
+        previous = kind
+
+    for element in document.get('body', {}).get('content', []):
+        if 'table' in element:
+            rows = [
+                [_cell_text(cell).replace('|', '\\|') for cell in row.get('tableCells', [])]
+                for row in element['table'].get('tableRows', [])
+            ]
+            if rows:
+                lines = ['| ' + ' | '.join(rows[0]) + ' |', '|' + '---|' * len(rows[0])]
+                lines.extend('| ' + ' | '.join(row) + ' |' for row in rows[1:])
+                add('table', '\n'.join(lines))
+            continue
+
+        paragraph = element.get('paragraph')
+        if paragraph is None:
+            continue
+        runs = [(content.rstrip('\n'), style) for content, style in _text_runs(paragraph)]
+        plain = ''.join(content for content, _ in runs)
+        if not plain.strip():
+            continue
+
+        if all(_is_code(style) for content, style in runs if content.strip()):
+            add('code', plain)
+            continue
+
+        text = ''.join(_inline_markdown(content, style) for content, style in runs).strip()
+        bullet = paragraph.get('bullet')
+        named_style = paragraph.get('paragraphStyle', {}).get('namedStyleType')
+
+        if bullet is not None:
+            marker = '1.' if _is_ordered(document, bullet) else '-'
+            add('list', '  ' * bullet.get('nestingLevel', 0) + f"{marker} {text}")
+        elif named_style in HEADING_PREFIXES:
+            add('heading', f"{HEADING_PREFIXES[named_style]} {plain.strip()}")
+        else:
+            add('paragraph', text)
+
+    if previous == 'code':
+        blocks.append('```')
+    return '\n'.join(blocks) + '\n' if blocks else ''
@@ -0,0 +1,279 @@
+import bisect
+import functools
+import inspect
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# Serve Prometheus text on http://<METRICS_HOST>:<METRICS_PORT>/metrics when set
+METRICS_PORT = os.getenv('METRICS_PORT')
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
+# Latency bucket bounds in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_text(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, '') for name in self.labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_label_text(self.labels, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram; observing is a bisect and three additions under a lock."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][slot] += 1
+            state[1] += value
+            state[2] += 1
+
+    def quantile(self, q: float, **labels):
+        """Estimate of the q-quantile (the upper bound of the bucket it falls in)"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            if not state or not state[2]:
+                return None
+            counts, total = list(state[0]), state[2]
+        rank, seen = q * total, 0
+        for i, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float('inf')
+        return float('inf')
+
+    def series(self) -> dict:
+        with self._lock:
+            return {key: (list(state[0]), state[1], state[2]) for key, state in self._values.items()}
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self.series().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                labels = _label_text(self.labels, key, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, labels, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labels, **kwargs)
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: tuple = ()) -> Counter:
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str, labels: tuple = ()) -> Gauge:
+        return self._get(Gauge, name, help_text, labels)
+
+    def histogram(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+tool_calls = registry.counter('mcp_tool_calls_total', 'MCP tool calls', ('tool', 'outcome'))
+tool_latency = registry.histogram('mcp_tool_latency_seconds', 'MCP tool call latency', ('tool',))
+tool_in_flight = registry.gauge('mcp_tool_in_flight', 'MCP tool calls running now', ('tool',))
+
+api_calls = registry.counter('google_api_calls_total', 'Google API HTTP calls, by method and status', ('method', 'status'))
+api_latency = registry.histogram('google_api_latency_seconds', 'Google API call latency (one attempt)', ('method',))
+api_in_flight = registry.gauge('google_api_in_flight', 'Google API calls on the wire now', ('api',))
+api_retries = registry.counter('google_api_retries_total', 'Google API calls retried, by status', ('api', 'status'))
+api_rate_limited = registry.counter('google_api_rate_limited_total', 'Google API quota errors (429 or quota 403)', ('api',))
+quota_wait = registry.histogram('quota_wait_seconds', 'Time spent waiting for a quota token', ('bucket',))
+circuit_state = registry.gauge('google_api_circuit_state', 'Circuit breaker state per API (0 closed, 1 half-open, 2 open)', ('api',))
+circuit_rejected = registry.counter('google_api_circuit_rejected_total', 'Google API calls failed fast by an open circuit', ('api',))
+
+cache_requests = registry.counter('cache_requests_total', 'Cache lookups, by cache and hit/miss', ('cache', 'result'))
+
+user_clients_evicted = registry.counter('user_clients_evicted_total', 'Per-user client sets dropped for size or idleness')
+
+
+def record_cache(cache: str, hit: bool):
+    cache_requests.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def is_error_result(result) -> bool:
+    # Tools report failures as a "❌ ..." message rather than raising
+    return isinstance(result, str) and result.lstrip().startswith('❌')
+
+
+def instrument_tool(fn):
+    """Wrap an MCP tool to record calls, errors, latency and in-flight count"""
+    name = fn.__name__
+
+    if not inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        def sync_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = 'error'
+            try:
+                result = fn(*args, **kwargs)
+                outcome = 'error' if is_error_result(result) else 'ok'
+                return result
+            finally:
+                tool_latency.observe(time.perf_counter() - started, tool=name)
+                tool_calls.inc(tool=name, outcome=outcome)
+
+        return sync_wrapper
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        tool_in_flight.inc(tool=name)
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = await fn(*args, **kwargs)
+            outcome = 'error' if is_error_result(result) else 'ok'
+            return result
+        finally:
+            tool_latency.observe(time.perf_counter() - started, tool=name)
+            tool_calls.inc(tool=name, outcome=outcome)
+            tool_in_flight.dec(tool=name)
+
+    return wrapper
+
+
+def summary() -> str:
+    """Short human-readable digest: per-tool and per-method counts and latency estimates"""
+    lines = ["Tools:"]
+    for (tool,), (_, total, count) in sorted(tool_latency.series().items()):
+        errors = tool_calls.value(tool=tool, outcome='error')
+        lines.append(
+            f"• {tool}: {count} calls, {errors:g} errors, mean {total / count * 1000:.1f} ms, "
+            f"p99 <= {tool_latency.quantile(0.99, tool=tool) * 1000:g} ms"
+        )
+    lines.append("Google API methods:")
+    for (method,), (_, total, count) in sorted(api_latency.series().items()):
+        lines.append(
+            f"• {method}: {count} calls, mean {total / count * 1000:.1f} ms, "
+            f"p99 <= {api_latency.quantile(0.99, method=method) * 1000:g} ms"
+        )
+    return "\n".join(lines)
+
+
+_server = None
+
+
+def start_http_server(port: int = None, host: str = METRICS_HOST):
+    """Serve /metrics in Prometheus text format on a background thread (once)"""
+    global _server
+    if _server is not None:
+        return _server
+
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # stdout is the MCP protocol stream under stdio
+            pass
+
+    _server = ThreadingHTTPServer((host, int(port or METRICS_PORT)), Handler)
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name='metrics-http', daemon=True).start()
+    return _server
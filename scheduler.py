@@ -0,0 +1,446 @@
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from dotenv import load_dotenv
+
+import metrics
+from deadlines import DeadlineExceeded, expires_at, remaining
+from transport import HTTP_TIMEOUT
+
+load_dotenv()
+
+
+# Per-user per-minute quotas for each (api, read/write) class. Defaults follow
+# the published per-user limits; override with e.g. DOCS_WRITE_QPM=120
+DEFAULT_QUOTAS = {
+    ('docs', 'read'): 300,
+    ('docs', 'write'): 60,
+    ('calendar', 'read'): 600,
+    ('calendar', 'write'): 600,
+    ('drive', 'read'): 1000,
+    ('drive', 'write'): 1000,
+}
+
+# How many seconds of quota a bucket may hold, i.e. the largest burst
+BURST_SECONDS = float(os.getenv('QUOTA_BURST_SECONDS', 10))
+
+# Retries for 429 / 5xx responses before the error is raised
+MAX_RETRIES = int(os.getenv('GOOGLE_API_MAX_RETRIES', 5))
+
+# Exponential backoff bounds in seconds (full jitter is applied on top)
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 32.0
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# 403s with these reasons are quota errors too (Calendar uses them instead of 429)
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+# Consecutive failures (5xx, timeouts, connection errors) that open an API's circuit
+CIRCUIT_FAILURES = int(os.getenv('GOOGLE_API_CIRCUIT_FAILURES', 5))
+
+# Seconds an open circuit fails calls fast before letting a probe through
+CIRCUIT_OPEN_SECONDS = float(os.getenv('GOOGLE_API_CIRCUIT_OPEN_SECONDS', 30))
+
+# Calls let through at once while half-open, to find out if the API is back
+CIRCUIT_PROBES = 1
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+
+# Share of each quota this process may use; worker processes split it evenly
+_quota_share = 1.0
+
+
+def set_quota_share(share: float):
+    """Limit this process to a share of every quota, e.g. 1/N for one of N workers.
+
+    Applies to buckets created afterwards, so call it before the first request.
+    """
+    global _quota_share
+    _quota_share = share
+
+
+def _quota(api: str, kind: str) -> float:
+    default = DEFAULT_QUOTAS.get((api, kind), 600)
+    try:
+        quota = float(os.getenv(f"{api.upper()}_{kind.upper()}_QPM", default))
+    except ValueError:
+        quota = float(default)
+    return quota * _quota_share
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at a per-minute rate, with a priority wait queue.
+
+    On quota errors the refill rate is halved (down to a tenth of the quota)
+    and the bucket pauses for the server's Retry-After; every success then
+    wins back a little of the rate until it is at the quota again.
+    """
+
+    def __init__(self, name: str, per_minute: float):
+        self.name = name
+        self.quota = per_minute / 60.0
+        self.rate = self.quota
+        self.capacity = max(1.0, self.quota * BURST_SECONDS)
+        self.tokens = self.capacity
+        self.paused_until = 0.0
+        self.throttled = 0
+
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _wait_time(self, cost: float, now: float) -> float:
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def acquire(self, cost: float = 1, priority: int = PRIORITY_NORMAL, deadline: float = None):
+        """Block until `cost` tokens are available; higher priority callers go first.
+
+        Raises:
+            DeadlineExceeded: If the tokens aren't ours by `deadline` (time.monotonic())
+        """
+        cost = min(cost, self.capacity)
+        ticket = (priority, next(self._seq))
+
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._waiters[0] == ticket:
+                        wait = self._wait_time(cost, now)
+                        if wait <= 0:
+                            self.tokens -= cost
+                            return
+                    else:
+                        wait = None
+                    if deadline is not None:
+                        left = deadline - now
+                        if left <= 0:
+                            raise DeadlineExceeded(f"Ran out of time waiting for {self.name} quota (tool deadline exceeded)")
+                        wait = left if wait is None else min(wait, left)
+                    self._cond.wait(wait)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    def throttle(self, pause: float):
+        """Back off after a quota error."""
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.quota / 10, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+            self.paused_until = max(self.paused_until, now + pause)
+            self.throttled += 1
+
+    def recover(self):
+        """Win back some of the rate after a success."""
+        if self.rate < self.quota:
+            with self._cond:
+                self.rate = min(self.quota, self.rate + self.quota / 20)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def stats(self) -> dict:
+        return {
+            'quota_per_minute': round(self.quota * 60),
+            'rate_per_minute': round(self.rate * 60),
+            'tokens': round(self.tokens, 2),
+            'waiting': self.waiting,
+            'throttled': self.throttled,
+        }
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an API whose circuit is open."""
+
+
+class CircuitBreaker:
+    """Fails calls to an API fast while it is down, instead of letting each one time out.
+
+    Closed: calls go through. CIRCUIT_FAILURES failures in a row open it.
+    Open: calls raise CircuitOpenError straight away for CIRCUIT_OPEN_SECONDS.
+    Half-open: up to CIRCUIT_PROBES calls go through as probes; a success
+    closes the circuit, a failure opens it again. Only signs of an outage
+    count as failures; a 4xx means the API answered, and quota errors are
+    left to the token buckets.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 'closed', 'half-open', 'open'
+
+    def __init__(self, api: str, failures: int = CIRCUIT_FAILURES, open_seconds: float = CIRCUIT_OPEN_SECONDS):
+        self.api = api
+        self.threshold = max(1, failures)
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0
+        self._open_until = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str):
+        self.state = state
+        metrics.circuit_state.set((self.CLOSED, self.HALF_OPEN, self.OPEN).index(state), api=self.api)
+
+    def allow(self):
+        """Let a call through, or raise CircuitOpenError. Pair every allowed call with record()."""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() >= self._open_until:
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.HALF_OPEN and self._probes < CIRCUIT_PROBES:
+                self._probes += 1
+                return
+            self.rejected += 1
+            wait = max(0.0, self._open_until - time.monotonic())
+        metrics.circuit_rejected.inc(api=self.api)
+        raise CircuitOpenError(
+            f"The Google {self.api} API is failing ({self.failures} errors in a row); "
+            f"not calling it for {wait:.0f}s more"
+        )
+
+    def record(self, ok):
+        """Outcome of an allowed call: True (it answered), False (outage) or None (tells us nothing)."""
+        with self._lock:
+            probe = self.state == self.HALF_OPEN
+            if probe:
+                self._probes = max(0, self._probes - 1)
+            if ok is None:
+                return
+            if ok:
+                self.failures = 0
+                if self.state != self.CLOSED:
+                    self._set_state(self.CLOSED)
+                return
+            self.failures += 1
+            if probe or (self.state == self.CLOSED and self.failures >= self.threshold):
+                self.opened += 1
+                self._open_until = time.monotonic() + self.open_seconds
+                self._set_state(self.OPEN)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'opened': self.opened,
+                'rejected': self.rejected,
+                'retry_in': round(max(0.0, self._open_until - time.monotonic()), 1) if self.state == self.OPEN else 0,
+            }
+
+
+# One breaker per API for the whole process: an outage hits every user alike
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(api: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(api)
+        if breaker is None:
+            breaker = _breakers[api] = CircuitBreaker(api)
+        return breaker
+
+
+def breaker_stats() -> dict:
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {api: breaker.stats() for api, breaker in breakers.items()}
+
+
+def _retry_after(error) -> float:
+    value = getattr(error, 'resp', {}).get('retry-after')
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _replay_safe(request, kind: str) -> bool:
+    """Whether sending the request again can't apply it twice.
+
+    A 5xx doesn't say whether a write went through. Reads are safe to repeat,
+    and so are writes Google deduplicates (a requestId) or refuses once the
+    document has moved on (writeControl.requiredRevisionId); anything else,
+    batches included, could land twice.
+    """
+    if kind == 'read':
+        return True
+    try:
+        body = json.loads(getattr(request, 'body', None) or '{}')
+    except (TypeError, ValueError):
+        return False
+    if not isinstance(body, dict):
+        return False
+    return bool(body.get('requestId') or (body.get('writeControl') or {}).get('requiredRevisionId'))
+
+
+def _is_rate_limited(error) -> bool:
+    status = error.resp.status
+    if status == 429:
+        return True
+    return status == 403 and any(reason in str(error) for reason in RATE_LIMIT_REASONS)
+
+
+class RequestScheduler:
+    """Single gate that every Google API call goes through.
+
+    Each call takes a token from its (api, read/write) bucket first, waiting in
+    priority order when the bucket is empty. 429s and quota 403s are retried
+    with exponential backoff and full jitter, honouring Retry-After; 5xx
+    responses are too, but only for requests that can't apply twice (see
+    _replay_safe).
+    Calls to an API whose circuit breaker is open fail straight away, and no
+    wait or retry runs past the calling tool's deadline (see deadlines.py).
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.retries = 0
+
+    def bucket(self, api: str, kind: str) -> TokenBucket:
+        key = (api, kind)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(f"{api}.{kind}", _quota(api, kind))
+                self._buckets[key] = bucket
+            return bucket
+
+    def execute(self, request, api: str, kind: str, priority: int = PRIORITY_NORMAL, cost: int = 1):
+        """Execute a googleapiclient request (or batch) within quota.
+
+        Args:
+            request: Anything with .execute(), e.g. service.documents().get(...)
+            api (str): 'docs', 'calendar' or 'drive'
+            kind (str): 'read' or 'write'
+            priority (int): PRIORITY_HIGH, PRIORITY_NORMAL or PRIORITY_LOW
+            cost (int): Quota units used, e.g. the number of calls in a batch
+        """
+        from googleapiclient.errors import HttpError
+
+        bucket = self.bucket(api, kind)
+        breaker = get_breaker(api)
+        # Batches have no single method; individual calls carry e.g. 'docs.documents.get'
+        method = getattr(request, 'methodId', None) or f"{api}.batch"
+        attempt = 0
+        delay = 0.0
+        while True:
+            if delay:
+                time.sleep(delay)
+            breaker.allow()
+            # True: the API answered; False: it looks down; None: no news either way
+            ok = None
+            try:
+                waited = time.perf_counter()
+                bucket.acquire(cost, priority, expires_at())
+                metrics.quota_wait.observe(time.perf_counter() - waited, bucket=bucket.name)
+
+                metrics.api_in_flight.inc(api=api)
+                # The transport cuts the socket timeout down to what's left of the deadline
+                left = remaining()
+                started = time.perf_counter()
+                try:
+                    result = request.execute()
+                except HttpError as error:
+                    status = error.resp.status
+                    metrics.api_calls.inc(method=method, status=str(status))
+                    rate_limited = _is_rate_limited(error)
+                    if rate_limited:
+                        metrics.api_rate_limited.inc(api=api)
+                    else:
+                        ok = status < 500
+
+                    # A rate-limited call was refused, so it never applies twice
+                    retryable = rate_limited or (status in RETRY_STATUSES and _replay_safe(request, kind))
+                    if not retryable or attempt >= MAX_RETRIES:
+                        raise
+
+                    delay = _retry_after(error)
+                    if delay is None:
+                        delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+                    left = remaining()
+                    if left is not None and delay >= left:
+                        # Waiting to retry would take us past the deadline
+                        raise
+                    if rate_limited:
+                        bucket.throttle(delay)
+
+                    attempt += 1
+                    self.retries += 1
+                    metrics.api_retries.inc(api=api, status=str(status))
+                    continue
+                except DeadlineExceeded:
+                    metrics.api_calls.inc(method=method, status='deadline')
+                    raise
+                except TimeoutError:
+                    if left is not None and left < HTTP_TIMEOUT:
+                        # Cut short by the tool's deadline, not a sign the API is down
+                        metrics.api_calls.inc(method=method, status='deadline')
+                        raise
+                    ok = False
+                    metrics.api_calls.inc(method=method, status='exception')
+                    raise
+                except Exception:
+                    # Connection errors: the API didn't answer
+                    ok = False
+                    metrics.api_calls.inc(method=method, status='exception')
+                    raise
+                finally:
+                    metrics.api_latency.observe(time.perf_counter() - started, method=method)
+                    metrics.api_in_flight.dec(api=api)
+
+                ok = True
+                metrics.api_calls.inc(method=method, status='200')
+                bucket.recover()
+                return result
+            finally:
+                breaker.record(ok)
+
+    def stats(self) -> dict:
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {
+            'retries': self.retries,
+            'queue_depth': sum(b.waiting for b in buckets.values()),
+            'buckets': {b.name: b.stats() for b in buckets.values()},
+            'circuits': breaker_stats(),
+        }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RequestScheduler:
+    """The process-wide scheduler shared by every client."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler()
+        return _scheduler
@@ -0,0 +1,240 @@
+import atexit
+import fcntl
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+from dotenv import load_dotenv
+from token_store import TOKEN_STORE_PATH
+
+load_dotenv()
+
+
+# Where the index is kept between runs; set to an empty value to keep it in memory only.
+# It holds terms from private documents, so it lives with the OAuth tokens by default.
+SEARCH_INDEX_PATH = os.getenv(
+    'DOCS_SEARCH_INDEX_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(TOKEN_STORE_PATH)), 'search_index.json')
+)
+
+# Also index documents we read, not just ones we write (0 to disable)
+INDEX_READS = os.getenv('DOCS_SEARCH_INDEX_READS', '1') != '0'
+
+# Writes are saved at most this often, so a burst of appends costs one file write
+SAVE_DELAY_SECONDS = 2.0
+
+# Characters kept per document to show alongside results
+PREVIEW_CHARS = 160
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> list:
+    return TOKEN_RE.findall(text.lower())
+
+
+def _count(tokens: list) -> dict:
+    counts = {}
+    for token in tokens:
+        counts[token] = counts.get(token, 0) + 1
+    return counts
+
+
+class SearchIndex:
+    """BM25 inverted index over the documents this server has written or read.
+
+    Kept current from the text passing through GoogleDocsClient: creates and
+    reads replace a document's entry, appends add to it. Searching never calls
+    a Google API. Only per-document term counts are saved; postings are
+    rebuilt from them on load.
+
+    Worker processes can share one file: a save merges into what is on disk
+    under a lock, so each worker only overwrites the documents it changed
+    itself, and picks up the ones the others have indexed meanwhile.
+
+    Args:
+        path (str): JSON file to persist the index in, or None for memory only
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self._docs = {}
+        self._postings = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+        self._save_timer = None
+        # Documents changed here since the last save
+        self._dirty = set()
+
+        if path:
+            for document_id, doc in self._read().items():
+                self._insert(document_id, doc)
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('docs', {})
+        except (OSError, ValueError, AttributeError):
+            # A missing or damaged index is rebuilt as documents are touched again
+            return {}
+
+    def _insert(self, document_id: str, doc: dict):
+        self._docs[document_id] = doc
+        self._total_length += doc['length']
+        for term, tf in doc['terms'].items():
+            self._postings.setdefault(term, {})[document_id] = tf
+
+    def _remove(self, document_id: str):
+        doc = self._docs.pop(document_id, None)
+        if doc is None:
+            return None
+        self._total_length -= doc['length']
+        for term in doc['terms']:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(document_id, None)
+                if not postings:
+                    del self._postings[term]
+        return doc
+
+    def replace(self, document_id: str, text: str, title: str = None):
+        """Index the whole content of a document, dropping what we had for it."""
+        with self._lock:
+            old = self._remove(document_id)
+            if title is None and old is not None:
+                title = old['title']
+            title = title or ''
+            tokens = tokenize(title) + tokenize(text)
+            self._insert(document_id, {
+                'title': title,
+                'preview': ' '.join(text.split())[:PREVIEW_CHARS],
+                'length': len(tokens),
+                'terms': _count(tokens),
+            })
+            self._dirty.add(document_id)
+        self._schedule_save()
+
+    def add(self, document_id: str, text: str):
+        """Index text appended to a document."""
+        tokens = tokenize(text)
+        if not tokens:
+            return
+        with self._lock:
+            doc = self._remove(document_id) or {'title': '', 'preview': '', 'length': 0, 'terms': {}}
+            terms = dict(doc['terms'])
+            for term, tf in _count(tokens).items():
+                terms[term] = terms.get(term, 0) + tf
+            preview = doc['preview'] or ' '.join(text.split())[:PREVIEW_CHARS]
+            self._insert(document_id, dict(doc, preview=preview, length=doc['length'] + len(tokens), terms=terms))
+            self._dirty.add(document_id)
+        self._schedule_save()
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """Documents ranked by BM25 score for the query, best first.
+
+        Returns:
+            list: Dicts with 'doc_id', 'title', 'score' and 'preview'
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            count = len(self._docs)
+            if not count or not terms:
+                return []
+            average = (self._total_length / count) or 1
+
+            scores = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for document_id, tf in postings.items():
+                    length = self._docs[document_id]['length']
+                    score = idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / average))
+                    scores[document_id] = scores.get(document_id, 0.0) + score
+
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+            return [
+                {
+                    'doc_id': document_id,
+                    'title': self._docs[document_id]['title'],
+                    'score': round(score, 3),
+                    'preview': self._docs[document_id]['preview'],
+                }
+                for document_id, score in ranked
+            ]
+
+    def _schedule_save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(SAVE_DELAY_SECONDS, self.save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def save(self):
+        """Merge our changes into the file on disk now (atomically)."""
+        if not self.path:
+            return
+        with self._lock:
+            self._save_timer = None
+            changed = {document_id: self._docs.get(document_id) for document_id in self._dirty}
+            self._dirty = set()
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            with open(self.path + '.lock', 'a') as lock:
+                # Held across read-merge-replace, so no worker's save is lost
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                docs = self._read()
+                for document_id, doc in changed.items():
+                    if doc is not None:
+                        docs[document_id] = doc
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.search_index.')
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(json.dumps({'version': 1, 'docs': docs}))
+                os.replace(tmp_path, self.path)
+        except OSError:
+            with self._lock:
+                self._dirty.update(changed)
+            return
+
+        # Take in what other workers indexed, unless it changed here since
+        with self._lock:
+            for document_id, doc in docs.items():
+                if document_id not in self._dirty and self._docs.get(document_id) != doc:
+                    self._remove(document_id)
+                    self._insert(document_id, doc)
+
+    def stats(self) -> dict:
+        return {
+            'documents': len(self._docs),
+            'terms': len(self._postings),
+            'path': self.path,
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_search_index() -> SearchIndex:
+    """The process-wide index, loaded from SEARCH_INDEX_PATH on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SearchIndex(SEARCH_INDEX_PATH or None)
+            # Don't lose appends still waiting on the save timer
+            atexit.register(_index.save)
+        return _index
@@ -1,9 +1,34 @@
-from mcp.server.fastmcp import FastMCP
-import sys
-import os
 import time
 
-from authentication import TOKEN_FILE, CREDENTIALS_FILE
+# Startup phases are measured from here (see debug://startup-timings)
+_process_start = time.perf_counter()
+
+from mcp.server.fastmcp import FastMCP, Context
+import asyncio
+import contextlib
+import functools
+import hmac
+import inspect
+import ipaddress
+import sys
+import os
+import threading
+
+from authentication import TOKEN_FILE, CREDENTIALS_FILE, DEFAULT_USER, credential_manager
+from user_clients import get_user_clients
+from idempotency import get_idempotency_store, fingerprint, IdempotencyKeyReused
+from workers import get_pool, pool_stats, PoolSaturatedError
+from coalescer import AppendCoalescer, WRITE_BEHIND_ENABLED
+import discovery
+import transport
+import metrics
+import logs
+import scheduler
+import serving
+from logs import get_logger, with_request_id, HOT
+from deadlines import with_deadline, TOOL_DEADLINE_SECONDS, BULK_TOOL_DEADLINE_SECONDS
+
+log = get_logger('server')
 
 # Add current directory to path to ensure imports work
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -18,32 +43,258 @@ CREDENTIALS_PATH = CREDENTIALS_FILE
 
 TOKEN_PATH = TOKEN_FILE
 
-# Now import your custom modules
-try:
-    from docs import GoogleDocsClient
-    print("Successfully imported GoogleDocsClient")
-except ImportError as e:
-    print(f"Failed to import GoogleDocsClient: {e}")
-    GoogleDocsClient = None
-
-try:
-    from cal import CalendarClient
-    print('success importing calendarclient')
-except ImportError as e:
-    print(f'failed to import calendar client {e}')
-    CalendarClient = None
+# "lazy" (default): build the Google clients the first time a tool needs them.
+# "eager": start building them in the background as soon as the server starts.
+# Either way nothing blocks initialize/tools/list.
+STARTUP_MODE = os.getenv('STARTUP_MODE', 'lazy').lower()
+
+# HTTP header naming the user a request acts for. Set it from a trusted
+# authenticating proxy; requests without it (and stdio) act as the default user
+USER_HEADER = os.getenv('MCP_USER_HEADER', 'X-User-Id')
+
+# Shared secret the authenticating proxy sends in PROXY_SECRET_HEADER. When set,
+# every HTTP request must carry it. Without it the HTTP transports only listen
+# on a loopback MCP_HOST, where nothing but a local proxy can reach them.
+PROXY_SECRET = os.getenv('MCP_PROXY_SECRET')
+PROXY_SECRET_HEADER = os.getenv('MCP_PROXY_SECRET_HEADER', 'X-Proxy-Secret')
+
+# Most events get_calendar_events lists in one call (one API page)
+MAX_LISTED_EVENTS = 250
+
+# Same threshold docs.py uses to switch to chunked inserts (docs is imported lazily)
+MAX_CHUNK_CHARS = int(os.getenv('DOCS_MAX_CHUNK_CHARS', 100_000))
+
+# export_docs writes here; a tool call can only pick a subdirectory of it
+EXPORT_DIR = os.getenv('DOCS_EXPORT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exports'))
+
+# Exported files listed by name in export_docs' reply; the rest are counted
+MAX_LISTED_EXPORTS = 20
+
+# Seconds per startup phase, in the order they happened
+startup_timings = {}
+
+
+def _record_phase(name, started):
+    startup_timings[name] = time.perf_counter() - started
+
+
+_record_phase('imports', _process_start)
+_setup_start = time.perf_counter()
+
+# The client modules pull in googleapiclient, so they are only imported
+# when a tool first needs them
+GoogleDocsClient = None
+CalendarClient = None
+
+
+def _load_docs_client_class():
+    global GoogleDocsClient
+    if GoogleDocsClient is None:
+        started = time.perf_counter()
+        try:
+            from docs import GoogleDocsClient as client_class
+            GoogleDocsClient = client_class
+            log.debug("Imported GoogleDocsClient")
+        except ImportError as e:
+            log.error("Failed to import GoogleDocsClient: %s", e)
+        _record_phase('docs_import', started)
+    return GoogleDocsClient
+
+
+def _load_calendar_client_class():
+    global CalendarClient
+    if CalendarClient is None:
+        started = time.perf_counter()
+        try:
+            from cal import CalendarClient as client_class
+            CalendarClient = client_class
+            log.debug("Imported CalendarClient")
+        except ImportError as e:
+            log.error("Failed to import CalendarClient: %s", e)
+        _record_phase('calendar_import', started)
+    return CalendarClient
+
+@contextlib.asynccontextmanager
+async def _lifespan(server):
+    # `mcp run server.py` (the Claude Desktop setup) imports this module and
+    # never calls main(), so the per-process startup runs from here too
+    _start_worker(0)
+    yield
+
 
 # Initialize FastMCP Server
-mcp = FastMCP("google-docs-mcp")
+mcp = FastMCP("google-docs-mcp", lifespan=_lifespan)
+
+
+def instrumented_tool(deadline: float = TOOL_DEADLINE_SECONDS):
+    """mcp.tool() that also records metrics, gives each call a request id for logging
+    and bounds the time its Google API calls may take (BULK_TOOL_DEADLINE_SECONDS for bulk tools)"""
+    def decorator(fn):
+        return mcp.tool()(metrics.instrument_tool(with_request_id(with_deadline(_busy_when_saturated(fn), deadline))))
+    return decorator
+
+
+def _busy_when_saturated(fn):
+    # A full worker pool is back-pressure, not a failure: tell the client to retry
+    if not inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        def sync_wrapper(*args, **kwargs):
+            try:
+                return fn(*args, **kwargs)
+            except PoolSaturatedError:
+                return SERVER_BUSY
+
+        return sync_wrapper
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await fn(*args, **kwargs)
+        except PoolSaturatedError:
+            return SERVER_BUSY
+    return wrapper
 
 
 docs_client = None
 last_auth_check = 0
 
+# Process that has already run _start_worker (forked workers each run it once)
+_started_pid = None
+
 
 calendar_client = None
 
+# Serializes client construction so concurrent first calls only authenticate once
+_init_lock = threading.Lock()
+
+# Each Google service gets its own bounded worker pool, so a slow Docs call
+# never holds up a Calendar call (see workers.py for the env knobs)
+docs_pool = get_pool('docs')
+calendar_pool = get_pool('calendar')
+
+
+class RequestUserError(RuntimeError):
+    """Raised when an HTTP request's user can't be established."""
+
 
+def _request_user():
+    """User named by the current request's USER_HEADER, or None for the default user
+
+    Raises:
+        RequestUserError: If an HTTP request carries no headers to go by, or
+            didn't come through the proxy holding PROXY_SECRET
+    """
+    if serving.MCP_TRANSPORT == 'stdio':
+        return None
+    try:
+        request_context = mcp.get_context().request_context
+    except (LookupError, ValueError):
+        # Not serving a request, e.g. the background warm-up
+        return None
+    request = request_context.request
+    if request is None:
+        raise RequestUserError(
+            f"The {serving.MCP_TRANSPORT} transport passed no HTTP request, so the calling user is unknown"
+        )
+    if PROXY_SECRET and not hmac.compare_digest(request.headers.get(PROXY_SECRET_HEADER, ''), PROXY_SECRET):
+        raise RequestUserError("The request did not come through the authenticating proxy")
+    return request.headers.get(USER_HEADER) or None
+
+
+def _check_user_header_trust(host: str):
+    """Refuse to take user ids from anyone who can reach a public address"""
+    if PROXY_SECRET:
+        return
+    try:
+        loopback = host == 'localhost' or ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        loopback = False
+    if not loopback:
+        raise SystemExit(
+            f"Refusing to serve on {host}: anyone who can reach it could act as any user via {USER_HEADER}. "
+            f"Set MCP_PROXY_SECRET (sent by your proxy in {PROXY_SECRET_HEADER}) or listen on 127.0.0.1."
+        )
+
+
+DOCS_UNAVAILABLE = "❌ Google Docs client is not available. Try using `refresh_auth` or restarting the MCP server."
+CALENDAR_UNAVAILABLE = "❌ Calendar client is not available. Try using `refresh_auth` or restarting the MCP server."
+SERVER_BUSY = "❌ Server busy, try again shortly"
+
+
+async def _docs_client(unavailable: str = DOCS_UNAVAILABLE):
+    """(client, None) for this request's user, or (None, error message)"""
+    try:
+        user = _request_user()
+    except RequestUserError as e:
+        return None, f"❌ **Error:** {e}"
+    if user is None:
+        if not docs_client and not await docs_pool.run(initialize_docs_client):
+            return None, unavailable
+        return docs_client, None
+    try:
+        return await docs_pool.run(get_user_clients().docs, user), None
+    except PoolSaturatedError:
+        return None, SERVER_BUSY
+    except Exception as e:
+        return None, f"❌ **No Google access for user {user}:** {e}"
+
+
+async def _calendar_client(unavailable: str = CALENDAR_UNAVAILABLE):
+    """(client, None) for this request's user, or (None, error message)"""
+    try:
+        user = _request_user()
+    except RequestUserError as e:
+        return None, f"❌ **Error:** {e}"
+    if user is None:
+        if not calendar_client and not await calendar_pool.run(initialize_calendar_client):
+            return None, unavailable
+        return calendar_client, None
+    try:
+        return await calendar_pool.run(get_user_clients().calendar, user), None
+    except PoolSaturatedError:
+        return None, SERVER_BUSY
+    except Exception as e:
+        return None, f"❌ **No Google access for user {user}:** {e}"
+
+
+async def _idempotent(tool: str, idempotency_key: str, arguments: dict, call, keep=None):
+    """Run call() once per idempotency key; repeats get the first result back without an API call"""
+    if not idempotency_key:
+        return await call()
+    if keep is None:
+        # Failures aren't remembered, so retrying them really retries
+        keep = lambda result: not metrics.is_error_result(result)
+    try:
+        key = f"{_request_user() or DEFAULT_USER}/{tool}/{idempotency_key}"
+        return await get_idempotency_store().run(key, fingerprint(arguments), call, keep=keep)
+    except (IdempotencyKeyReused, RequestUserError) as e:
+        return f"❌ **Error:** {e}"
+
+
+def _progress_reporter(ctx):
+    """Callback for worker threads that sends MCP progress notifications on the event loop"""
+    if ctx is None:
+        return None
+    loop = asyncio.get_running_loop()
+
+    def report(done, total):
+        asyncio.run_coroutine_threadsafe(ctx.report_progress(done, total), loop)
+
+    return report
+
+
+async def _flush_appends(document_id, text, client):
+    # The client the appends were queued for, not whatever docs_client is by now
+    return await docs_pool.run(
+        client.add_info_to_existing_doc,
+        document_id=document_id,
+        information=text,
+        position='end'
+    )
+
+# Opt-in write-behind for hot documents: appends are buffered briefly and
+# written as one insert (DOCS_WRITE_BEHIND=1, see coalescer.py)
+write_behind = AppendCoalescer(_flush_appends) if WRITE_BEHIND_ENABLED else None
 
 
 @mcp.resource("debug://fs-inspect")
@@ -52,7 +303,7 @@ def fs_inspect():
     files = os.listdir(cwd)
     return f"CWD: {cwd}\nFiles: {files}"
 
-@mcp.tool()
+@instrumented_tool()
 def get_debugging_info():
     return fs_inspect()
 
@@ -64,6 +315,8 @@ def debugging_info():
     • Client initialized: {docs_client is not None}
     • Last auth check: {time.ctime(last_auth_check) if last_auth_check else 'Never'}
     • Token file exists: {os.path.exists(TOKEN_PATH)}
+    • Shared credentials: {credential_manager.status()}
+    • Per-user clients: {get_user_clients().stats()}
     • Credentials configured: {os.getenv(CREDENTIALS_PATH) is not None}
     
     If there are issues:
@@ -76,70 +329,160 @@ def debugging_info():
     """
 
 
+@mcp.resource("debug://startup-timings")
+def startup_timings_info():
+    lines = ["Startup phase timings:"]
+    for phase, seconds in startup_timings.items():
+        lines.append(f"• {phase}: {seconds * 1000:.1f} ms")
+    for service, seconds in discovery.build_timings.items():
+        lines.append(f"• build {service}: {seconds * 1000:.1f} ms")
+    return "\n".join(lines)
+
+
+@mcp.resource("debug://quota-scheduler")
+def quota_scheduler_info():
+    from scheduler import get_scheduler
+
+    stats = get_scheduler().stats()
+    lines = [f"Quota scheduler: {stats['queue_depth']} calls waiting, {stats['retries']} retries so far"]
+    for name, bucket in stats['buckets'].items():
+        lines.append(
+            f"• {name}: {bucket['rate_per_minute']}/{bucket['quota_per_minute']} per min, "
+            f"{bucket['tokens']} tokens, {bucket['waiting']} waiting, throttled {bucket['throttled']}x"
+        )
+    return "\n".join(lines)
+
+
+@mcp.resource("debug://circuit-breakers")
+def circuit_breakers_info():
+    lines = [
+        f"Circuit breakers: open after {scheduler.CIRCUIT_FAILURES} failures in a row, "
+        f"probe again after {scheduler.CIRCUIT_OPEN_SECONDS:g}s; tool deadline "
+        + (f"{TOOL_DEADLINE_SECONDS:g}s" if TOOL_DEADLINE_SECONDS else "off")
+    ]
+    circuits = scheduler.breaker_stats()
+    if not circuits:
+        lines.append("• No Google API calls yet")
+    for api, stats in circuits.items():
+        state = stats['state']
+        if state == 'open':
+            state += f" (probing in {stats['retry_in']:g}s)"
+        lines.append(
+            f"• {api}: {state}, {stats['failures']} failures in a row, "
+            f"opened {stats['opened']}x, {stats['rejected']} calls failed fast"
+        )
+    return "\n".join(lines)
+
+
+@mcp.resource("debug://worker-pools")
+def worker_pools_info():
+    lines = ["Google API worker pools:"]
+    for name, stats in pool_stats().items():
+        lines.append(f"• {name}: {stats['pending']} pending / {stats['max_queue']} max queued, {stats['max_workers']} workers")
+    http = transport.http_stats()
+    if http:
+        lines.append(f"• http: {http['open']} connections open ({http['idle']} idle) of {http['pool_size']}, timeout {http['timeout']}s")
+    if write_behind:
+        buffered = write_behind.pending()
+        lines.append(f"• write-behind: {sum(buffered.values())} appends buffered across {len(buffered)} documents")
+    logging_stats = logs.stats()
+    lines.append(f"• logging: level {logging_stats['level']} to {logging_stats['destination']}, {logging_stats['dropped']} records dropped")
+    if docs_client is not None:
+        cache = docs_client.doc_cache.stats()
+        lines.append(
+            f"• read cache: {cache['entries']} docs, {cache['bytes']} / {cache['max_bytes']} bytes, "
+            f"{cache['hits']} hits, {cache['misses']} misses"
+        )
+    return "\n".join(lines)
+
+
+@mcp.resource("metrics://prometheus")
+def metrics_prometheus():
+    return metrics.registry.render_prometheus()
+
+
+@mcp.resource("metrics://summary")
+def metrics_summary():
+    return metrics.summary()
+
+
 def initialize_docs_client(force_refresh=False):
     """Initialize the Google Docs client with comprehensive error handling"""
     global docs_client, last_auth_check
     
     if not force_refresh and docs_client is not None:
         return True
-    
-    if GoogleDocsClient is None:
-        print("❌ GoogleDocsClient class not available due to import error")
+
+    with _init_lock:
+        if not force_refresh and docs_client is not None:
+            return True
+        return _initialize_docs_client()
+
+
+def _initialize_docs_client():
+    global docs_client, last_auth_check
+
+    if _load_docs_client_class() is None:
+        log.error("GoogleDocsClient class not available due to import error")
         return False
     
     try:
-        print("🔄 Attempting to initialize Google Docs client...")
+        log.info("Initializing Google Docs client")
         
         # Check if token file exists and is recent
         token_file = TOKEN_PATH
         if os.path.exists(token_file):
             token_age = time.time() - os.path.getmtime(token_file)
-            print(f"📝 Token file age: {token_age/60:.1f} minutes")
+            log.debug("Token file age: %.1f minutes", token_age / 60)
         
+        started = time.perf_counter()
         docs_client = GoogleDocsClient()
+        _record_phase('docs_client', started)
         last_auth_check = time.time()
-        print("✅ Google Docs client initialized successfully")
+        log.info("Google Docs client initialized")
         return True
         
     except FileNotFoundError as e:
-        print(f"❌ Credentials file not found: {e}")
-        print("💡 Make sure your .env file has the correct CREDENTIALS_PATH")
+        log.error("Credentials file not found: %s (check CREDENTIALS_PATH in your .env file)", e)
         return False
     except Exception as e:
-        print(f"❌ Failed to initialize Google Docs client: {e}")
-        print(f"   Error type: {type(e).__name__}")
+        log.error("Failed to initialize Google Docs client: %s: %s", type(e).__name__, e)
         
         # If it's an auth error, suggest refreshing
         if "credentials" in str(e).lower() or "auth" in str(e).lower():
-            print("💡 This looks like an authentication issue. Try:")
-            print("   1. Restarting the MCP server")
-            print("   2. Running the OAuth flow again")
-            print("   3. Using the refresh_auth tool")
+            log.warning("This looks like an authentication issue: restart the MCP server, run the OAuth flow again or use the refresh_auth tool")
         
         return False
 
-# Try to initialize the client on startup
-print("🚀 Initial client initialization...")
-client_initialized = initialize_docs_client()
-
-@mcp.tool()
-def refresh_auth() -> str:
+@instrumented_tool()
+async def refresh_auth() -> str:
     """Force refresh the authentication and reinitialize the client"""
     global docs_client
     
-    print("🔄 Forcing authentication refresh...")
+    try:
+        user = _request_user()
+    except RequestUserError as e:
+        return f"❌ **Error:** {e}"
+    if user is not None:
+        # Rebuilt from the token store on the user's next call
+        get_user_clients().drop(user)
+        return f"✅ Authentication for {user} will be reloaded from the token store on the next call."
+    
+    log.info("Forcing authentication refresh")
     
-    # Clear the current client
+    # Clear the current client and re-read the token file
     docs_client = None
+    credential_manager.reset()
     
     # Try to reinitialize
-    if initialize_docs_client(force_refresh=True):
+    if await docs_pool.run(initialize_docs_client, force_refresh=True):
         return """✅ Authentication refreshed successfully!
 
 The Google Docs client has been reinitialized. You can now use all document tools:
 • create_google_doc
 • add_content_to_doc  
-• create_doc_with_content"""
+• create_doc_with_content
+• create_docs_batch"""
     else:
         return """❌ Authentication refresh failed.
 
@@ -151,16 +494,19 @@ Please check:
 
 You may need to run the OAuth flow again or restart the MCP server."""
 
-@mcp.tool()
-def create_google_doc(title: str) -> str:
-    """Create a new Google Document with a specified title"""
-    global docs_client
+@instrumented_tool()
+async def create_google_doc(title: str, idempotency_key: str = None) -> str:
+    """Create a new Google Document with a specified title
     
-    # Try to reinitialize if client is None
-    if not docs_client:
-        print("🔄 Docs client not available, attempting to reinitialize...")
-        if not initialize_docs_client():
-            return """❌ Google Docs client is not available. 
+    Args:
+        title: The title for the new Google Document
+        idempotency_key: Optional unique string for this request; retrying with the same key returns the first result instead of creating another document
+    """
+    return await _idempotent('create_google_doc', idempotency_key, {'title': title}, lambda: _create_google_doc(title))
+
+
+async def _create_google_doc(title: str) -> str:
+    client, error = await _docs_client("""❌ Google Docs client is not available. 
 
 🔧 **Quick Fixes:**
 1. **Restart the MCP server** - This often resolves authentication state issues
@@ -168,11 +514,13 @@ def create_google_doc(title: str) -> str:
 3. **Use refresh_auth tool** - Force authentication refresh
 4. **Verify credentials** - Check your .env file and credentials.json
 
-If the problem persists, you may need to complete the OAuth flow again."""
+If the problem persists, you may need to complete the OAuth flow again.""")
+    if client is None:
+        return error
     
     try:
-        print(f"📝 Creating document with title: {title}")
-        result = docs_client.create_doc(title)
+        log.debug("Creating document with title: %s", title, extra=HOT)
+        result = await docs_pool.run(client.create_doc, title)
         
         if result['success']:
             return f"""✅ Google Doc Created Successfully!
@@ -195,6 +543,8 @@ The document is ready for editing. You can access it using the URL above."""
             else:
                 return f"❌ **Error creating document:** {error_msg}"
     
+    except PoolSaturatedError:
+        return SERVER_BUSY
     except Exception as e:
         error_str = str(e)
         if "credentials" in error_str.lower() or "auth" in error_str.lower():
@@ -207,33 +557,56 @@ The document is ready for editing. You can access it using the URL above."""
         else:
             return f"❌ **Error executing create_google_doc:** {error_str}"
 
-@mcp.tool()
-def add_content_to_doc(document_id: str, content: str, position: str = "end") -> str:
+# Large content is streamed in chunks at write quota, so it gets the bulk deadline
+@instrumented_tool(deadline=BULK_TOOL_DEADLINE_SECONDS)
+async def add_content_to_doc(document_id: str, content: str, position: str = "end", format: str = "text", ctx: Context = None) -> str:
     """Add content to an existing Google Document
     
     Args:
         document_id: The ID of the Google Document to update
         content: The content to add to the document
         position: Where to add the content ("beginning" or "end", default: "end")
-    """
-    global docs_client
-    
+        format: "text" (default) or "markdown" to turn headings, lists, bold, links, code and tables into Docs formatting
 
-    
-    if not docs_client:
-        if not initialize_docs_client():
-            return "❌ Google Docs client is not available. Try using `refresh_auth` or restarting the MCP server."
+    Very large content is written in chunks, with progress notifications.
+    """
+    client, error = await _docs_client()
+    if client is None:
+        return error
+    # Write-behind buffers for the default user's client only
+    buffered = write_behind if client is docs_client else None
     
     # Validate position parameter
     if position not in ["beginning", "end"]:
         return "❌ **Error:** Position must be either 'beginning' or 'end'"
     
+    if format not in ["text", "markdown"]:
+        return "❌ **Error:** Format must be either 'text' or 'markdown'"
+    
     try:
-        result = docs_client.add_info_to_existing_doc(
-            document_id=document_id,
-            information=content,
-            position=position
-        )
+        if format == "markdown":
+            if buffered:
+                await buffered.flush(document_id)
+            result = await docs_pool.run(
+                client.add_markdown_to_doc,
+                document_id=document_id,
+                markdown=content,
+                position=position
+            )
+        # Big payloads are streamed in chunks, so they skip the write-behind buffer
+        elif buffered and position == "end" and len(content) <= MAX_CHUNK_CHARS:
+            result = await buffered.append(document_id, content, client)
+        else:
+            if buffered:
+                # Keep per-document ordering with anything still buffered
+                await buffered.flush(document_id)
+            result = await docs_pool.run(
+                client.add_info_to_existing_doc,
+                document_id=document_id,
+                information=content,
+                position=position,
+                on_progress=_progress_reporter(ctx)
+            )
         
         if result['success']:
             return f"""✅ Content Added Successfully!
@@ -245,44 +618,102 @@ def add_content_to_doc(document_id: str, content: str, position: str = "end") ->
 
 The content has been added to your document."""
         else:
+            if result.get('resumable'):
+                return f"""❌ **Error adding content:** {result['error']}
+
+📦 **Chunks written:** {result['chunks_committed']} of {result['chunks']}
+🔁 Call `add_content_to_doc` again with the same content to continue from where it stopped."""
             return f"❌ **Error adding content:** {result['error']}"
     
+    except PoolSaturatedError:
+        return SERVER_BUSY
     except Exception as e:
         return f"❌ **Error executing add_content_to_doc:** {str(e)}"
 
-@mcp.tool()
-def create_doc_with_content(title: str, content: str) -> str:
+@instrumented_tool()
+async def replace_doc_content(document_id: str, content: str) -> str:
+    """Replace the text of an existing Google Document, sending only what changed
+
+    Use this to rewrite a document (e.g. a regenerated draft): the current text
+    is compared with the new text and only the differing words and lines are
+    deleted or inserted, so unchanged text keeps its formatting and comments.
+    Works on documents made of plain paragraphs (no tables or images).
+
+    Args:
+        document_id: The ID of the Google Document to update
+        content: The complete new text of the document
+    """
+    client, error = await _docs_client()
+    if client is None:
+        return error
+
+    try:
+        if write_behind and client is docs_client:
+            # Buffered appends must land before we diff against the document
+            await write_behind.flush(document_id)
+        result = await docs_pool.run(client.replace_doc_content, document_id, content)
+    except PoolSaturatedError:
+        return SERVER_BUSY
+    except Exception as e:
+        return f"❌ **Error executing replace_doc_content:** {str(e)}"
+
+    if not result['success']:
+        return f"❌ **Error replacing content:** {result['error']}"
+    if not result['edits']:
+        return f"""✅ Document already matches the new content - nothing to change.
+
+🔗 **URL:** {result['url']}"""
+    return f"""✅ Document Content Replaced!
+
+📝 **Updated:** Document ID {document_id}
+✏️ **Edits:** {result['edits']} range(s) changed
+➖ **Characters removed:** {result['deleted']}
+➕ **Characters inserted:** {result['inserted']}
+🔗 **URL:** {result['url']}"""
+
+# Large content is streamed in chunks at write quota, so it gets the bulk deadline
+@instrumented_tool(deadline=BULK_TOOL_DEADLINE_SECONDS)
+async def create_doc_with_content(title: str, content: str, format: str = "text", idempotency_key: str = None, ctx: Context = None) -> str:
     """Create a new Google Document with initial content
     
     Args:
         title: The title for the new Google Document
         content: Initial content to add to the document
+        format: "text" (default) or "markdown" to turn headings, lists, bold, links, code and tables into Docs formatting
+        idempotency_key: Optional unique string for this request; retrying with the same key returns the first result instead of creating another document
     """
-    global docs_client
+    return await _idempotent(
+        'create_doc_with_content',
+        idempotency_key,
+        {'title': title, 'content': content, 'format': format},
+        lambda: _create_doc_with_content(title, content, format, ctx)
+    )
+
+
+async def _create_doc_with_content(title: str, content: str, format: str, ctx: Context) -> str:
+    client, error = await _docs_client()
+    if client is None:
+        return error
     
-    # Smart auth refresh
-    
-    
-    if not docs_client:
-        if not initialize_docs_client():
-            return "❌ Google Docs client is not available. Try using `refresh_auth` or restarting the MCP server."
+    if format not in ["text", "markdown"]:
+        return "❌ **Error:** Format must be either 'text' or 'markdown'"
     
     try:
-        # First create the document
-        create_result = docs_client.create_doc(title)
+        # Create and fill in one go - the new doc is empty, so there is nothing to read first
+        create_result = await docs_pool.run(
+            client.create_doc_with_content,
+            title,
+            content,
+            on_progress=_progress_reporter(ctx),
+            markdown=format == "markdown"
+        )
         
         if not create_result['success']:
             return f"❌ **Error creating document:** {create_result['error']}"
         
-        # Then add content to it
         doc_id = create_result['doc_id']
-        add_result = docs_client.add_info_to_existing_doc(
-            document_id=doc_id,
-            information=content,
-            position="beginning"
-        )
         
-        if add_result['success']:
+        if 'content_error' not in create_result:
             return f"""✅ Google Doc Created with Content!
 
 📄 **Title:** {create_result['title']}
@@ -291,44 +722,339 @@ def create_doc_with_content(title: str, content: str) -> str:
 🔗 **URL:** {create_result['url']}
 
 Your document has been created and populated with the provided content."""
+        elif create_result.get('resumable'):
+            return f"""⚠️ Document created but content addition stopped part way:
+
+📄 **Title:** {create_result['title']}
+🆔 **Document ID:** {doc_id}
+🔗 **URL:** {create_result['url']}
+❌ **Content Error:** {create_result['content_error']}
+📦 **Chunks written:** {create_result['chunks_committed']} of {create_result['chunks']}
+🔁 Call `add_content_to_doc` with this document ID, the same content and position "beginning" to continue from where it stopped."""
         else:
             return f"""⚠️ Document created but content addition failed:
 
 📄 **Title:** {create_result['title']}
 🆔 **Document ID:** {doc_id}
 🔗 **URL:** {create_result['url']}
-❌ **Content Error:** {add_result['error']}
+❌ **Content Error:** {create_result['content_error']}
 
 You can manually add content to the document using the URL above."""
     
+    except PoolSaturatedError:
+        return SERVER_BUSY
     except Exception as e:
         return f"❌ **Error executing create_doc_with_content:** {str(e)}"
 
+# Bulk work waits on quota for many calls in a row, so it gets the longer bulk deadline
+@instrumented_tool(deadline=BULK_TOOL_DEADLINE_SECONDS)
+async def create_docs_batch(documents: list[dict]) -> str:
+    """Create many Google Documents with content in a few batched HTTP calls
+    
+    Args:
+        documents: List of {"title": ..., "content": ...} dicts ("content" is optional)
+    """
+    client, error = await _docs_client()
+    if client is None:
+        return error
+    
+    if not documents:
+        return "❌ **Error:** No documents given"
+    
+    try:
+        results = await docs_pool.run(client.create_docs_batch, documents)
+    except PoolSaturatedError:
+        return SERVER_BUSY
+    except Exception as e:
+        return f"❌ **Error executing create_docs_batch:** {str(e)}"
+    
+    created = sum(1 for r in results if r['success'] and 'content_error' not in r)
+    lines = [f"📚 **Created {created} of {len(results)} documents**", ""]
+    for i, (item, result) in enumerate(zip(documents, results), 1):
+        title = item.get('title') if isinstance(item, dict) else None
+        if not result['success']:
+            lines.append(f"{i}. ❌ {title or '(no title)'} - {result['error']}")
+        elif 'content_error' in result:
+            lines.append(f"{i}. ⚠️ {result['title']} - created but content failed: {result['content_error']} ({result['url']})")
+        else:
+            lines.append(f"{i}. ✅ {result['title']} - {result['url']}")
+    return "\n".join(lines)
+
+@instrumented_tool()
+async def read_doc(document_id: str, format: str = "text") -> str:
+    """Read the contents of a Google Document
+    
+    Args:
+        document_id: The ID of the Google Document to read
+        format: "text" (default) or "markdown" to keep headings, lists, bold, links, code and tables
+    
+    Unchanged documents are served from a local cache.
+    """
+    client, error = await _docs_client()
+    if client is None:
+        return error
+    
+    if format not in ["text", "markdown"]:
+        return "❌ **Error:** Format must be either 'text' or 'markdown'"
+    
+    try:
+        if write_behind and client is docs_client:
+            # Don't read around appends we are still holding back
+            await write_behind.flush(document_id)
+        result = await docs_pool.run(client.read_doc, document_id, as_markdown=format == "markdown")
+    except PoolSaturatedError:
+        return SERVER_BUSY
+    except Exception as e:
+        return f"❌ **Error executing read_doc:** {str(e)}"
+    
+    if not result['success']:
+        return f"❌ **Error reading document:** {result['error']}"
+    
+    return f"""📄 **{result['title']}**
+🔗 {result['url']}
+
+{result['content']}"""
+
+@instrumented_tool()
+async def search_docs(query: str, limit: int = 10) -> str:
+    """Search the documents this server has created, written to or read
+    
+    Args:
+        query: Words to look for
+        limit: Most results to return (default 10)
+    
+    Answers from a local index without calling Google, so documents this
+    server has never touched are not found.
+    """
+    from search_index import get_search_index
+    
+    if not query.strip():
+        return "❌ **Error:** Query is empty"
+    
+    try:
+        user = _request_user()
+    except RequestUserError as e:
+        return f"❌ **Error:** {e}"
+    if user is None:
+        index = get_search_index()
+    else:
+        # Each user only searches what they have touched
+        client, error = await _docs_client()
+        if client is None:
+            return error
+        index = client.search_index
+    
+    results = index.search(query, limit=max(1, limit))
+    if not results:
+        return f"🔍 No documents found for: {query}"
+    
+    lines = [f"🔍 **{len(results)} documents found for:** {query}", ""]
+    for i, result in enumerate(results, 1):
+        lines.append(f"{i}. **{result['title'] or '(untitled)'}** (score {result['score']})")
+        lines.append(f"   🆔 {result['doc_id']} - https://docs.google.com/document/d/{result['doc_id']}/edit")
+        if result['preview']:
+            lines.append(f"   {result['preview']}")
+    return "\n".join(lines)
+
+@instrumented_tool()
+async def create_doc_from_template(template_id: str, title: str = None, replacements: dict[str, str] = None, idempotency_key: str = None) -> str:
+    """Create a new Google Document by copying a template and filling in its {{placeholders}}
+
+    Args:
+        template_id: ID of the template document (its formatting is kept)
+        title: Title for the new document (default: the template's title)
+        replacements: Placeholder name -> text, e.g. {"client": "Acme", "date": "1 May"}
+        idempotency_key: Optional unique string for this request; retrying with the same key returns the first result instead of creating another document
+    """
+    return await _idempotent(
+        'create_doc_from_template',
+        idempotency_key,
+        {'template_id': template_id, 'title': title, 'replacements': replacements},
+        lambda: _create_doc_from_template(template_id, title, replacements)
+    )
+
+
+async def _create_doc_from_template(template_id: str, title: str, replacements: dict) -> str:
+    client, error = await _docs_client()
+    if client is None:
+        return error
+
+    try:
+        result = await docs_pool.run(client.create_doc_from_template, template_id, title, replacements)
+    except PoolSaturatedError:
+        return SERVER_BUSY
+    except Exception as e:
+        return f"❌ **Error executing create_doc_from_template:** {str(e)}"
+
+    if not result['success']:
+        return f"❌ **Error creating document from template:** {result['error']}"
+
+    if 'content_error' in result:
+        return f"""⚠️ Document copied but placeholders were not filled in:
+
+📄 **Title:** {result['title']}
+🆔 **Document ID:** {result['doc_id']}
+🔗 **URL:** {result['url']}
+❌ **Content Error:** {result['content_error']}"""
+
+    filled = ", ".join(f"{name} ({count})" for name, count in result['replaced'].items() if count)
+    lines = [
+        "✅ Google Doc Created from Template!",
+        "",
+        f"📄 **Title:** {result['title']}",
+        f"🆔 **Document ID:** {result['doc_id']}",
+        f"🔗 **URL:** {result['url']}",
+        f"📝 **Filled in:** {filled or 'nothing'}",
+    ]
+    if result['unused']:
+        lines.append(f"⚠️ **Not in the template:** {', '.join(result['unused'])}")
+    if result['unfilled']:
+        lines.append(f"⚠️ **Left unfilled:** {', '.join('{{' + name + '}}' for name in result['unfilled'])}")
+    return "\n".join(lines)
+
+# Bulk work waits on quota for many calls in a row, so it gets the longer bulk deadline
+@instrumented_tool(deadline=BULK_TOOL_DEADLINE_SECONDS)
+async def export_docs(document_ids: list[str] = None, format: str = "markdown", directory: str = None, ctx: Context = None) -> str:
+    """Export Google Documents to Markdown or text files on the server's disk
+
+    Only documents changed since they were last exported to the same directory
+    are downloaded again, and an interrupted export picks up where it stopped
+    when run again.
+
+    Args:
+        document_ids: Documents to export (default: every Google Doc in the account)
+        format: "markdown" (default) or "text"
+        directory: Subdirectory of the export folder to write to (default: the export folder itself)
+    """
+    client, error = await _docs_client()
+    if client is None:
+        return error
+
+    if format not in ("markdown", "text"):
+        return "❌ **Error:** Format must be either 'markdown' or 'text'"
+
+    root = os.path.realpath(EXPORT_DIR)
+    target = os.path.realpath(os.path.join(root, directory or ''))
+    if os.path.commonpath([root, target]) != root:
+        return "❌ **Error:** directory must stay inside the export folder"
+
+    try:
+        result = await docs_pool.run(
+            client.export_docs,
+            target,
+            document_ids,
+            format,
+            on_progress=_progress_reporter(ctx)
+        )
+    except PoolSaturatedError:
+        return SERVER_BUSY
+    except Exception as e:
+        return f"❌ **Error executing export_docs:** {str(e)}"
+
+    exported = result['exported']
+    lines = [
+        f"📦 **Exported {len(exported)} document(s)** ({result['bytes']} bytes) to {target}",
+        f"⏭️ **Unchanged since last export:** {result['skipped']}",
+    ]
+    for item in exported[:MAX_LISTED_EXPORTS]:
+        lines.append(f"• {item['file']}")
+    if len(exported) > MAX_LISTED_EXPORTS:
+        lines.append(f"• … and {len(exported) - MAX_LISTED_EXPORTS} more")
+    if result['failed']:
+        lines.append(f"❌ **Failed:** {len(result['failed'])} (run export_docs again to retry them)")
+        for item in result['failed'][:MAX_LISTED_EXPORTS]:
+            lines.append(f"• {item['doc_id']} - {item['error']}")
+    return "\n".join(lines)
+
 def main():
     """Main function to run the MCP server"""
-    print("🚀 Starting Google Docs MCP Server...")
-    print("📋 Available tools:")
+    # Logs go to stderr (or LOG_FILE), never stdout, which is the MCP protocol stream
+    log.info("🚀 Starting Google Docs MCP Server...")
+    log.info("📋 Available tools:")
     
     tools = [
         "• create_google_doc - Create a new Google Document",
         "• add_content_to_doc - Add content to existing document", 
-        "• create_doc_with_content - Create document with initial content"
+        "• create_doc_with_content - Create document with initial content",
+        "• replace_doc_content - Rewrite a document, sending only the changes",
+        "• create_docs_batch - Create many documents with content at once",
+        "• create_doc_from_template - Copy a template and fill in its placeholders",
+        "• export_docs - Export documents to Markdown or text files, incrementally",
+        "• read_doc - Read a document as text or Markdown",
+        "• search_docs - Search documents this server has touched",
+        "• create_calendar_events - Create many calendar events at once"
     ]
     
     for tool in tools:
-        print(f"  {tool}")
+        log.info(f"  {tool}")
     
-    if docs_client:
-        print("✅ Google Docs client ready!")
-    else:
-        print("⚠️  Client will initialize on first use or use `refresh_auth`")
-    
-    print(f"\n🎯 Server ready!")
-    print("💡 Example: 'Create a new Google doc called Meeting Notes'")
-    print("🔧 If you have auth issues, restart the server, or check credentials path & token path")
+    _record_phase('server_ready', _process_start)
+    log.info("⏱️  Startup: " + ", ".join(f"{phase} {seconds * 1000:.1f} ms" for phase, seconds in startup_timings.items()))
     
+    log.info("🎯 Server ready!")
+    log.info("💡 Example: 'Create a new Google doc called Meeting Notes'")
+    log.info("🔧 If you have auth issues, restart the server, or check credentials path & token path")
+
+    if serving.MCP_TRANSPORT == 'stdio':
+        _start_worker(0)
+        # Run the FastMCP server
+        mcp.run()
+        return
+
+    _check_user_header_trust(serving.MCP_HOST)
+
+    # Load what every session and worker shares before any worker starts
+    _load_docs_client_class()
+    _load_calendar_client_class()
+    discovery.preload(('docs', 'v1'), ('drive', 'v3'), ('calendar', 'v3'))
+    serving.serve_http(mcp, on_worker_start=_start_worker, on_shutdown=_drain_writes)
+
+
+def _start_worker(index, workers=1):
+    """Per-process startup: background threads don't survive a fork, so each worker starts its own"""
+    global _started_pid
+    # main() and serve_http get here before the first session; the lifespan
+    # hook then runs again for every session (every request when stateless)
+    if _started_pid == os.getpid():
+        return
+    _started_pid = os.getpid()
+
+    if workers > 1:
+        # Each worker gets an even share of the per-user quotas (serve_http
+        # may start fewer workers than MCP_WORKERS asks for)
+        scheduler.set_quota_share(1 / workers)
+
+    if STARTUP_MODE == 'eager':
+        # Warm the clients without holding up initialize/tools/list
+        threading.Thread(target=_warm_clients, name='client-warmup', daemon=True).start()
+        log.info("🔄 Warming up Google clients in the background")
+    else:
+        log.info("⚠️  Client will initialize on first use or use `refresh_auth`")
+
+    if metrics.METRICS_PORT:
+        # One endpoint per worker: METRICS_PORT, METRICS_PORT + 1, ...
+        port = int(metrics.METRICS_PORT) + index
+        try:
+            metrics.start_http_server(port)
+        except OSError as e:
+            # Serve tools anyway, but don't leave an unscraped METRICS_PORT unexplained
+            log.warning("METRICS_PORT is set but the metrics endpoint could not start on %s:%d: %s",
+                        metrics.METRICS_HOST, port, e)
+        else:
+            log.info(f"📈 Prometheus metrics on http://{metrics.METRICS_HOST}:{port}/metrics")
+
+
+async def _drain_writes():
+    # Appends still buffered by write-behind go out before the worker exits
+    if write_behind is not None:
+        await write_behind.flush()
 
 
+def _warm_clients():
+    initialize_docs_client()
+    initialize_calendar_client()
+    
+
 
 def initialize_calendar_client(force_refresh=False):
     """Initialize the Google Calendar client with comprehensive error handling"""
@@ -336,49 +1062,79 @@ def initialize_calendar_client(force_refresh=False):
     
     if not force_refresh and calendar_client is not None:
         return True
-    
-    if CalendarClient is None:
-        print("❌ CalendarClient class not available due to import error")
+
+    with _init_lock:
+        if not force_refresh and calendar_client is not None:
+            return True
+        return _initialize_calendar_client()
+
+
+def _initialize_calendar_client():
+    global calendar_client, last_auth_check
+
+    if _load_calendar_client_class() is None:
+        log.error("CalendarClient class not available due to import error")
         return False
     
     try:
-        print("🔄 Attempting to initialize Google Calendar client...")
+        log.info("Initializing Google Calendar client")
         
         # Check if token file exists and is recent
         token_file = TOKEN_PATH
         if os.path.exists(token_file):
             token_age = time.time() - os.path.getmtime(token_file)
-            print(f"📝 Token file age: {token_age/60:.1f} minutes")
+            log.debug("Token file age: %.1f minutes", token_age / 60)
         
+        started = time.perf_counter()
         calendar_client = CalendarClient()
+        _record_phase('calendar_client', started)
         last_auth_check = time.time()
-        print("✅ Google Calendar client initialized successfully")
+        log.info("Google Calendar client initialized")
         return True
     
     except FileNotFoundError as e:
-        print(f"❌ Credentials file not found: {e}")
-        print("💡 Make sure your .env file has the correct CREDENTIALS_PATH")
+        log.error("Credentials file not found: %s (check CREDENTIALS_PATH in your .env file)", e)
         return False
     except Exception as e:
-        print(f"❌ Failed to initialize Google Calendar client: {e}")
-        print(f"   Error type: {type(e).__name__}")
+        log.error("Failed to initialize Google Calendar client: %s: %s", type(e).__name__, e)
         
 #calendar mcp tools
 
-@mcp.tool()
-def get_calendar_events(num_events: int = 10) -> str:
-    """Get the next x number of events from the calendar"""
-    global calendar_client
+@instrumented_tool()
+async def get_calendar_events(num_events: int = 10, time_min: str = None, time_max: str = None) -> str:
+    """Get the next x number of events from the calendar
     
-    if not calendar_client:
-        if not initialize_calendar_client():
-            return "❌ Calendar client is not available. Try using `refresh_auth` or restarting the MCP server."
-        
-        try:
-            events = calendar_client.GetEvents(num_events)
-            return f"✅ Successfully fetched {len(events)} events:\n\n{events}"
-        except Exception as e:
-            return f"❌ Error fetching events: {str(e)}"
+    Args:
+        num_events: How many events to list (at most 250 per call)
+        time_min: Only events ending after this ISO 8601 time, e.g. "2025-06-01T00:00:00Z" (default: now)
+        time_max: Only events starting before this ISO 8601 time
+    """
+    client, error = await _calendar_client()
+    if client is None:
+        return error
+
+    capped = max(1, min(num_events, MAX_LISTED_EVENTS))
+    try:
+        events = await calendar_pool.run(client.GetEvents, capped, time_min, time_max)
+    except ValueError as e:
+        return f"❌ **Error:** time_min and time_max must be ISO 8601 times ({e})"
+    except PoolSaturatedError:
+        return SERVER_BUSY
+    except Exception as e:
+        return f"❌ Error fetching events: {str(e)}"
+
+    if isinstance(events, str):
+        return f"📅 {events[0].upper()}{events[1:]}"
+
+    lines = [f"✅ Successfully fetched {len(events)} events:", ""]
+    for i, event in enumerate(events, 1):
+        start = event['start'].get('dateTime', event['start'].get('date'))
+        where = f" @ {event['location']}" if event.get('location') else ""
+        link = f" ({event['htmlLink']})" if event.get('htmlLink') else ""
+        lines.append(f"{i}. {start} - {event.get('summary', '(no title)')}{where}{link}")
+    if capped < num_events:
+        lines.append(f"\n⚠️ Showing the first {capped}; narrow time_min/time_max to see the rest.")
+    return "\n".join(lines)
 
 
 
@@ -426,30 +1182,76 @@ At the minimum, to create an event you need
 
 
 
-@mcp.tool()
-def create_calendar_event(event : dict):
-
-    global calendar_client
-
-    if not calendar_client:
-        if not initialize_calendar_client():
-            return "Calendar client not intialized, error here"
+@instrumented_tool()
+async def create_calendar_event(event : dict, idempotency_key: str = None):
+    """Create a calendar event (see format://dictionary-for-calendar-events)
+    
+    Args:
+        event: The event dict
+        idempotency_key: Optional unique string for this request; retrying with the same key returns the first result instead of creating another event
+    """
+    return await _idempotent(
+        'create_calendar_event',
+        idempotency_key,
+        {'event': event},
+        lambda: _create_calendar_event(event),
+        # Only a created event's link is worth remembering
+        keep=lambda result: isinstance(result, str) and result.startswith('http')
+    )
+
+
+async def _create_calendar_event(event: dict):
+    client, error = await _calendar_client("Calendar client not intialized, error here")
+    if client is None:
+        return error
     try:
-        create_result = calendar_client.createEvent(event)
+        create_result = await calendar_pool.run(client.createEvent, event)
         if create_result != 'error creating the new calendar event':
             return create_result
+    except PoolSaturatedError:
+        return SERVER_BUSY
     except Exception as e:
-        print('error creating the new calendar event')
+        log.error("Error creating the new calendar event: %s", e)
         return 'error creating the new calendar event'
 
 
 
+# Bulk work waits on quota for many calls in a row, so it gets the longer bulk deadline
+@instrumented_tool(deadline=BULK_TOOL_DEADLINE_SECONDS)
+async def create_calendar_events(events: list[dict]) -> str:
+    """Create many calendar events at once, e.g. a workshop series or a conference agenda
+    
+    Args:
+        events: List of event dicts, each in the format://dictionary-for-calendar-events shape
+    
+    Events are checked locally first, then sent in batches of up to 50 per HTTP call.
+    """
+    client, error = await _calendar_client()
+    if client is None:
+        return error
+    
+    if not events:
+        return "❌ **Error:** No events given"
+    
+    try:
+        results = await calendar_pool.run(client.createEvents, events)
+    except PoolSaturatedError:
+        return SERVER_BUSY
+    except Exception as e:
+        return f"❌ **Error executing create_calendar_events:** {str(e)}"
+    
+    created = sum(1 for r in results if r['success'])
+    lines = [f"📅 **Created {created} of {len(results)} events**", ""]
+    for i, (event, result) in enumerate(zip(events, results), 1):
+        summary = event.get('summary') if isinstance(event, dict) else None
+        if result['success']:
+            lines.append(f"{i}. ✅ {summary} - {result['link']}")
+        else:
+            lines.append(f"{i}. ❌ {summary or '(no summary)'} - {result['error']}")
+    return "\n".join(lines)
 
 
-
-
-    # Run the FastMCP server    
-mcp.run()
+_record_phase('server_setup', _setup_start)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
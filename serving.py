@@ -0,0 +1,213 @@
+import asyncio
+import atexit
+import os
+import signal
+import socket
+import time
+from dotenv import load_dotenv
+
+import logs
+from logs import get_logger
+
+load_dotenv()
+
+log = get_logger('serving')
+
+
+# "stdio" (default) serves the one client that started the process.
+# "streamable-http" or "sse" serve any number of clients over HTTP.
+MCP_TRANSPORT = os.getenv('MCP_TRANSPORT', 'stdio').lower()
+MCP_HOST = os.getenv('MCP_HOST', '127.0.0.1')
+MCP_PORT = int(os.getenv('MCP_PORT', 8000))
+
+# Worker processes forked after the server is loaded, all accepting on one
+# listening socket. More than one makes streamable HTTP stateless, since a
+# client's next request may reach a different worker.
+MCP_WORKERS = int(os.getenv('MCP_WORKERS', 1))
+
+# Connections and requests each worker handles at once; past this new ones get a 503
+MCP_MAX_CONCURRENCY = int(os.getenv('MCP_MAX_CONCURRENCY', 100))
+
+# Seconds in-flight requests get to finish after SIGTERM or Ctrl-C
+MCP_DRAIN_SECONDS = int(os.getenv('MCP_DRAIN_SECONDS', 30))
+
+# Pending connections the kernel queues on the listening socket
+LISTEN_BACKLOG = 2048
+
+HTTP_TRANSPORTS = ('streamable-http', 'sse')
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(LISTEN_BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _app(mcp, transport: str):
+    return mcp.sse_app() if transport == 'sse' else mcp.streamable_http_app()
+
+
+async def _serve(app, sock: socket.socket, host: str, port: int, on_shutdown=None):
+    import uvicorn
+
+    config = uvicorn.Config(
+        app,
+        host=host,
+        port=port,
+        limit_concurrency=MCP_MAX_CONCURRENCY,
+        timeout_graceful_shutdown=MCP_DRAIN_SECONDS,
+        log_level=logs.LOG_LEVEL.lower(),
+        # Requests are already counted and timed in metrics; no per-request lines on stdout
+        access_log=False,
+        log_config=None,
+    )
+    server = uvicorn.Server(config)
+    try:
+        # uvicorn stops accepting on the first SIGTERM/SIGINT and waits for
+        # in-flight requests (up to the graceful timeout) before returning
+        await server.serve(sockets=[sock])
+    finally:
+        if on_shutdown is not None:
+            await on_shutdown()
+
+
+def _run_worker(mcp, transport, sock, host, port, index, workers, on_worker_start, on_shutdown) -> int:
+    try:
+        if on_worker_start is not None:
+            on_worker_start(index, workers)
+        asyncio.run(_serve(_app(mcp, transport), sock, host, port, on_shutdown))
+        return 0
+    except Exception:
+        log.exception("Worker %d failed", index)
+        return 1
+
+
+def _fork_worker(mcp, transport, sock, host, port, index, workers, on_worker_start, on_shutdown) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+
+    # Child: its own process group, so a terminal Ctrl-C reaches only the
+    # parent, which then asks every worker to drain exactly once
+    os.setpgid(0, 0)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    code = _run_worker(mcp, transport, sock, host, port, index, workers, on_worker_start, on_shutdown)
+    # Run this process's exit handlers (token and index saves, log flush),
+    # then leave without unwinding back into the parent's code
+    atexit._run_exitfuncs()
+    os._exit(code)
+
+
+def _signal_all(children: dict, signum: int):
+    for pid in list(children):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+
+def _supervise(mcp, transport, sock, host, port, workers, on_worker_start, on_shutdown):
+    """Fork the workers, restart any that die, and drain them all on SIGTERM/SIGINT"""
+    children = {}
+    stopping = []
+
+    def spawn(index):
+        pid = _fork_worker(mcp, transport, sock, host, port, index, workers, on_worker_start, on_shutdown)
+        children[pid] = index
+
+    def stop(signum, frame):
+        if stopping:
+            return
+        log.info("Draining %d worker(s) (up to %d s)", len(children), MCP_DRAIN_SECONDS)
+        stopping.append(time.monotonic() + MCP_DRAIN_SECONDS + 5)
+        _signal_all(children, signal.SIGTERM)
+
+    for index in range(workers):
+        spawn(index)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    log.info("Started %d workers: %s", workers, ", ".join(str(pid) for pid in children))
+
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            if stopping and time.monotonic() > stopping[0]:
+                log.warning("Workers still busy after the drain timeout; killing them")
+                _signal_all(children, signal.SIGKILL)
+                stopping[0] = float('inf')
+            time.sleep(0.2)
+            continue
+
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue
+        log.warning("Worker %d (pid %d) exited with status %d; restarting it", index, pid, os.waitstatus_to_exitcode(status))
+        # Don't spin if a worker dies straight away every time
+        time.sleep(1)
+        spawn(index)
+
+    sock.close()
+    log.info("All workers stopped")
+
+
+def serve_http(mcp, transport: str = None, host: str = None, port: int = None, workers: int = None,
+               on_worker_start=None, on_shutdown=None):
+    """Serve many MCP clients over streamable HTTP or SSE.
+
+    With one worker the server runs in this process. With more, the socket is
+    bound here and the workers are forked from this process, so the imported
+    client modules and preloaded discovery documents are shared copy-on-write.
+    Each worker then builds its own Google clients and connection pool, which
+    every session it serves shares.
+
+    Args:
+        mcp: The FastMCP server
+        transport (str): 'streamable-http' or 'sse'
+        host (str): Address to listen on
+        port (int): Port to listen on
+        workers (int): Worker processes
+        on_worker_start: Called with the worker index and the number of workers
+            actually started (fewer than asked for with sse or without fork())
+            in each worker before it serves, e.g. to start background threads
+            (which don't survive a fork)
+        on_shutdown: Coroutine function awaited in each worker after draining
+    """
+    transport = transport or MCP_TRANSPORT
+    host = host or MCP_HOST
+    port = port or MCP_PORT
+    workers = max(1, workers or MCP_WORKERS)
+    if transport not in HTTP_TRANSPORTS:
+        raise ValueError(f"transport must be one of {', '.join(HTTP_TRANSPORTS)}, not {transport!r}")
+
+    if workers > 1 and transport == 'sse':
+        # An SSE session lives on the worker holding its stream, and its POSTs could land anywhere
+        log.warning("The sse transport keeps sessions in memory; using 1 worker instead of %d", workers)
+        workers = 1
+    if workers > 1 and not hasattr(os, 'fork'):
+        log.warning("Worker processes need fork(); using 1 worker instead of %d", workers)
+        workers = 1
+    if workers > 1:
+        mcp.settings.stateless_http = True
+
+    sock = _bind(host, port)
+    path = mcp.settings.sse_path if transport == 'sse' else mcp.settings.streamable_http_path
+    log.info(
+        "🌐 Serving %s on http://%s:%d%s (%d worker(s), %d concurrent requests each)",
+        transport, host, port, path, workers, MCP_MAX_CONCURRENCY
+    )
+
+    if workers == 1:
+        if on_worker_start is not None:
+            on_worker_start(0, 1)
+        asyncio.run(_serve(_app(mcp, transport), sock, host, port, on_shutdown))
+        return
+
+    _supervise(mcp, transport, sock, host, port, workers, on_worker_start, on_shutdown)
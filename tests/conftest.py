@@ -0,0 +1,35 @@
+import os
+import tempfile
+
+# Tests must not wait on Google's quotas or touch the real token store, search
+# index, event store or idempotency keys. Set before any server module loads.
+for _name in ('DOCS_READ_QPM', 'DOCS_WRITE_QPM', 'CALENDAR_READ_QPM', 'CALENDAR_WRITE_QPM', 'DRIVE_READ_QPM', 'DRIVE_WRITE_QPM'):
+    os.environ.setdefault(_name, '100000000')
+_data = tempfile.mkdtemp(prefix='docs-mcp-tests-')
+os.environ.setdefault('TOKEN_STORE_PATH', os.path.join(_data, 'tokens.db'))
+os.environ.setdefault('DOCS_SEARCH_INDEX_PATH', '')
+os.environ.setdefault('CALENDAR_STORE_PATH', '')
+os.environ.setdefault('IDEMPOTENCY_STORE_PATH', '')
+os.environ.setdefault('DOCS_EXPORT_DIR', os.path.join(_data, 'exports'))
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import pytest
+
+from benchmarks.fake_google import FakeGoogleHttp
+
+
+@pytest.fixture
+def fake():
+    return FakeGoogleHttp()
+
+
+@pytest.fixture
+def http(fake):
+    from transport import PooledHttp
+    return PooledHttp(None, http_factory=lambda: fake)
+
+
+@pytest.fixture
+def docs_client(http):
+    from docs import GoogleDocsClient
+    return GoogleDocsClient(http=http)
@@ -0,0 +1,26 @@
+import pytest
+
+from docs import split_into_chunks
+from markdown_docs import utf16_len
+
+
+TEXT = "short\n" + "x" * 25 + "\n" + "😀" * 9 + "\n\nmixed 😀 line\nlast line without newline"
+
+
+@pytest.mark.parametrize('max_units', [2, 3, 7, 16, 1000])
+def test_split_into_chunks_stays_within_bound(max_units):
+    chunks = list(split_into_chunks(TEXT, max_units))
+    assert ''.join(chunks) == TEXT
+    assert all(chunks)
+    assert all(utf16_len(chunk) <= max_units for chunk in chunks)
+
+
+def test_split_into_chunks_keeps_lines_that_fit_whole():
+    chunks = list(split_into_chunks("one\ntwo\nthree\n", 8))
+    assert chunks == ["one\ntwo\n", "three\n"]
+
+
+def test_split_into_chunks_makes_progress_at_one_unit():
+    # A character outside the BMP can't fit in one unit; it still comes out whole
+    chunks = list(split_into_chunks("a😀b", 1))
+    assert chunks == ['a', '😀', 'b']
@@ -0,0 +1,119 @@
+import asyncio
+
+from coalescer import AppendCoalescer
+
+
+class Recorder:
+    """flush_fn that records each flush and answers like add_info_to_existing_doc."""
+
+    def __init__(self):
+        self.flushes = []
+
+    async def __call__(self, document_id, text, client):
+        self.flushes.append((document_id, text, client))
+        return {'success': True, 'client': client}
+
+
+def test_flush_goes_through_the_client_appends_were_queued_for():
+    flush = Recorder()
+
+    async def main():
+        coalescer = AppendCoalescer(flush, window_ms=10_000)
+        first = asyncio.ensure_future(coalescer.append('doc', "one", 'client-a'))
+        second = asyncio.ensure_future(coalescer.append('doc', "two", 'client-a'))
+        await asyncio.sleep(0)
+        # Reauthentication swaps the client; later appends use the new one
+        third = asyncio.ensure_future(coalescer.append('doc', "three", 'client-b'))
+        await asyncio.sleep(0)
+        await coalescer.flush('doc')
+        return await first, await second, await third
+
+    first, second, third = asyncio.run(main())
+    assert flush.flushes == [('doc', "one\n\ntwo", 'client-a'), ('doc', "three", 'client-b')]
+    assert first['client'] == second['client'] == 'client-a'
+    assert first['coalesced'] == 2
+    assert third['client'] == 'client-b'
+
+
+def test_pending_appends_survive_refresh_auth(fake, docs_client, monkeypatch):
+    import server
+
+    document_id = fake.seed_document("Hot doc", "Start\n")
+    monkeypatch.setattr(server, 'docs_client', docs_client)
+
+    async def main():
+        coalescer = AppendCoalescer(server._flush_appends, window_ms=10_000)
+        pending = asyncio.ensure_future(coalescer.append(document_id, "queued", server.docs_client))
+        await asyncio.sleep(0)
+        # refresh_auth drops the shared client while the append is still buffered
+        monkeypatch.setattr(server, 'docs_client', None)
+        await coalescer.flush(document_id)
+        return await pending
+
+    result = asyncio.run(main())
+    assert result['success'], result
+    assert fake.documents[document_id]['text'] == "Start\n\nqueued\n"
+
+
+def test_appends_within_the_window_become_one_flush():
+    flush = Recorder()
+
+    async def main():
+        coalescer = AppendCoalescer(flush, window_ms=20)
+        results = await asyncio.gather(*(coalescer.append('doc', f"line {i}") for i in range(5)))
+        return coalescer, results
+
+    coalescer, results = asyncio.run(main())
+    assert flush.flushes == [('doc', "\n\n".join(f"line {i}" for i in range(5)), None)]
+    assert all(result['coalesced'] == 5 for result in results)
+    assert coalescer.pending() == {}
+    assert coalescer._last_flush == {} and coalescer._locks == {}
+
+
+def test_max_bytes_flushes_early():
+    flush = Recorder()
+
+    async def main():
+        coalescer = AppendCoalescer(flush, window_ms=10_000, max_bytes=10)
+        small = asyncio.ensure_future(coalescer.append('doc', "1234"))
+        await asyncio.sleep(0)
+        assert coalescer.pending() == {'doc': 1}
+        # Reaching max_bytes starts the flush without waiting out the window
+        await asyncio.wait_for(coalescer.append('doc', "567890"), timeout=1)
+        return await small
+
+    assert asyncio.run(main())['coalesced'] == 2
+    assert flush.flushes == [('doc', "1234\n\n567890", None)]
+
+
+def test_flush_error_reaches_every_waiter():
+    async def failing(document_id, text, client):
+        raise RuntimeError("quota exceeded")
+
+    async def main():
+        coalescer = AppendCoalescer(failing, window_ms=10)
+        return await asyncio.gather(coalescer.append('doc', "a"), coalescer.append('doc', "b"))
+
+    assert asyncio.run(main()) == [{'success': False, 'error': "quota exceeded"}] * 2
+
+
+def test_flush_all_and_per_document_order():
+    flush = Recorder()
+
+    async def main():
+        coalescer = AppendCoalescer(flush, window_ms=10_000)
+        waiting = [
+            asyncio.ensure_future(coalescer.append('doc-a', "a1")),
+            asyncio.ensure_future(coalescer.append('doc-b', "b1")),
+        ]
+        await asyncio.sleep(0)
+        await coalescer.flush('doc-a')
+        waiting.append(asyncio.ensure_future(coalescer.append('doc-a', "a2")))
+        await asyncio.sleep(0)
+        assert coalescer.pending() == {'doc-b': 1, 'doc-a': 1}
+        await coalescer.flush()
+        await asyncio.gather(*waiting)
+
+    asyncio.run(main())
+    assert [text for doc, text, _ in flush.flushes if doc == 'doc-a'] == ["a1", "a2"]
+    assert sorted(text for _, text, _ in flush.flushes) == ["a1", "a2", "b1"]
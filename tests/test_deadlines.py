@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+import pytest
+
+import deadlines
+import server
+from deadlines import BULK_TOOL_DEADLINE_SECONDS, DeadlineExceeded, check, remaining, with_deadline
+
+
+@pytest.fixture
+def expired():
+    token = deadlines._deadline.set(time.monotonic() - 1)
+    yield
+    deadlines._deadline.reset(token)
+
+
+@pytest.fixture
+def calendar_client(http):
+    from cal import CalendarClient
+    return CalendarClient(http=http)
+
+
+def test_no_deadline_outside_a_tool_call():
+    assert remaining() is None
+    check("doing nothing")
+
+
+def test_with_deadline_sets_and_restores():
+    seen = with_deadline(remaining, 5)()
+    assert 4 < seen <= 5
+    assert remaining() is None
+
+
+def test_nested_deadline_only_tightens():
+    inner = with_deadline(remaining, 60)
+    assert with_deadline(inner, 5)() <= 5
+    assert with_deadline(with_deadline(remaining, 1), 60)() <= 1
+
+
+def test_no_seconds_means_no_wrapper():
+    assert with_deadline(remaining, 0) is remaining
+    assert with_deadline(remaining, None) is remaining
+
+
+def test_check_raises_once_out_of_time(expired):
+    with pytest.raises(DeadlineExceeded, match="before the next batch"):
+        check("before the next batch")
+    assert isinstance(DeadlineExceeded("x"), TimeoutError)
+
+
+def test_async_tools_get_a_deadline_too():
+    async def tool():
+        return remaining()
+
+    assert 4 < asyncio.run(with_deadline(tool, 5)()) <= 5
+
+
+EVENT = {'summary': "Session", 'start': {'dateTime': '2030-05-01T09:00:00Z'}, 'end': {'dateTime': '2030-05-01T10:00:00Z'}}
+
+
+def test_create_docs_batch_stops_at_the_deadline(fake, docs_client, expired):
+    results = docs_client.create_docs_batch([{'title': f"Doc {i}", 'content': "text"} for i in range(3)])
+    assert [r['success'] for r in results] == [False] * 3
+    assert 'deadline' in results[0]['error']
+    assert fake.counters()['round_trips'] == 0
+
+
+def test_create_events_stops_at_the_deadline(fake, calendar_client, expired):
+    results = calendar_client.createEvents([dict(EVENT, summary=f"Session {i}") for i in range(120)])
+    assert not any(r['success'] for r in results)
+    assert 'deadline' in results[0]['error']
+    assert 'calendar.events.insert' not in fake.counters()['calls']
+
+
+def test_export_resumes_after_the_deadline(fake, docs_client, tmp_path):
+    ids = [fake.seed_document(f"Doc {i}", f"Body {i}\n") for i in range(3)]
+
+    token = deadlines._deadline.set(time.monotonic() - 1)
+    try:
+        stopped = docs_client.export_docs(str(tmp_path), ids, 'text')
+    finally:
+        deadlines._deadline.reset(token)
+    assert len(stopped['failed']) == 3
+    assert 'deadline' in stopped['failed'][0]['error']
+
+    finished = docs_client.export_docs(str(tmp_path), ids, 'text')
+    assert len(finished['exported']) == 3
+
+
+def test_bulk_tools_run_under_the_bulk_deadline():
+    seen = []
+
+    @server.instrumented_tool(deadline=BULK_TOOL_DEADLINE_SECONDS)
+    def bulk():
+        seen.append(deadlines.remaining())
+        return "done"
+
+    bulk()
+    assert seen[0] is not None
+    assert deadlines.TOOL_DEADLINE_SECONDS < seen[0] <= BULK_TOOL_DEADLINE_SECONDS
@@ -0,0 +1,59 @@
+from doc_cache import DocumentCache
+
+
+def entry(text, version='1'):
+    return {'title': "Doc", 'revision_id': None, 'text': text, 'markdown': text, 'version': version}
+
+
+def test_latest_follows_the_newest_revision():
+    cache = DocumentCache()
+    cache.put('doc', 'rev-1', entry("old"))
+    cache.put('doc', 'rev-2', entry("new"))
+    assert cache.latest('doc')['text'] == "new"
+    # Older revisions stay readable by id
+    assert cache.get('doc', 'rev-1')['text'] == "old"
+    assert cache.get('doc', 'rev-3') is None
+    assert cache.latest('other') is None
+
+
+def test_evicts_least_recently_used_by_size():
+    # Each entry holds 24 bytes of strings, so two fit
+    cache = DocumentCache(max_bytes=50)
+    cache.put('a', 'rev', entry("a" * 10))
+    cache.put('b', 'rev', entry("b" * 10))
+    cache.get('a', 'rev')
+    cache.put('c', 'rev', entry("c" * 10))
+
+    assert cache.get('b', 'rev') is None and cache.latest('b') is None
+    assert cache.latest('a') is not None and cache.latest('c') is not None
+    assert cache.size <= cache.max_bytes
+
+    # Too big to ever fit: not cached, nothing evicted
+    cache.put('d', 'rev', entry("d" * 100))
+    assert cache.latest('d') is None
+    assert cache.stats()['entries'] == 2
+
+
+def test_entries_without_a_revision_are_not_cached():
+    cache = DocumentCache()
+    cache.put('doc', None, entry("text"))
+    assert cache.latest('doc') is None
+
+
+def test_unchanged_doc_is_read_from_cache(fake, docs_client):
+    document_id = fake.seed_document("Notes", "First line\n")
+    first = docs_client.read_doc(document_id)
+    assert not first['cached']
+
+    fake.reset_counters()
+    again = docs_client.read_doc(document_id, as_markdown=True)
+    assert again['cached']
+    assert again['content'] == first['content']
+    # Only the Drive version check went out
+    assert fake.counters()['calls'] == {'drive.files.get': 1}
+
+    docs_client.add_info_to_existing_doc(document_id, "Second line")
+    edited = docs_client.read_doc(document_id)
+    assert not edited['cached']
+    assert "Second line" in edited['content']
+    assert docs_client.doc_cache.stats()['hits'] == 1
@@ -0,0 +1,55 @@
+import random
+
+import pytest
+
+from docs import diff_edits
+
+
+def apply_edits(old, edits):
+    # Back to front, so earlier offsets still hold
+    text = old
+    for start, end, replacement in reversed(edits):
+        text = text[:start] + replacement + text[end:]
+    return text
+
+
+@pytest.mark.parametrize('old, new', [
+    ('', 'Hello\n'),
+    ('Hello\n', ''),
+    ('one\ntwo\nthree\n', 'one\n2\nthree\n'),
+    ('one\ntwo', 'one\n\ntwo\n'),
+    ('Hi 😀 there\n', 'Hi 😀😀 there\nand a new line\n'),
+    ('😀\n\n😀', '\n😀\n'),
+    ('no newline at the end', 'no newline at all'),
+    ('\n\n\n', '\n'),
+])
+def test_diff_edits_round_trip(old, new):
+    edits = diff_edits(old, new)
+    assert apply_edits(old, edits) == new
+
+
+def test_diff_edits_round_trip_random():
+    rng = random.Random(0)
+    alphabet = ['a', 'b', 'word', ' ', '\n', '😀', 'é', '🎉🎉']
+    for _ in range(500):
+        old = ''.join(rng.choices(alphabet, k=rng.randint(0, 30)))
+        new = ''.join(rng.choices(alphabet, k=rng.randint(0, 30)))
+        assert apply_edits(old, diff_edits(old, new)) == new
+
+
+def test_diff_edits_are_ordered_and_disjoint():
+    old = 'alpha beta\ngamma 😀 delta\nepsilon\n'
+    new = 'alpha BETA\ngamma 😀 delta!\nepsilon\nzeta\n'
+    edits = diff_edits(old, new)
+    ends = [0] + [end for _, end, _ in edits]
+    starts = [start for start, _, _ in edits]
+    assert all(start >= previous_end for start, previous_end in zip(starts, ends))
+    assert all(start <= end for start, end, _ in edits)
+
+
+def test_diff_edits_touch_only_the_change():
+    old = ''.join(f"Paragraph {i}: the quick brown fox jumps over the lazy dog.\n" for i in range(200))
+    new = old.replace("lazy", "sleepy", 1)
+    edits = diff_edits(old, new)
+    assert apply_edits(old, edits) == new
+    assert sum(end - start + len(text) for start, end, text in edits) < 20
@@ -0,0 +1,93 @@
+import datetime
+
+import pytest
+
+from event_store import EventStore
+
+NOW = datetime.datetime(2026, 3, 2, 9, tzinfo=datetime.timezone.utc)
+
+
+def event(event_id, hours_from_now, status='confirmed'):
+    start = NOW + datetime.timedelta(hours=hours_from_now)
+    return {
+        'id': event_id,
+        'status': status,
+        'start': {'dateTime': start.isoformat()},
+        'end': {'dateTime': (start + datetime.timedelta(hours=1)).isoformat()},
+    }
+
+
+def ids(events):
+    return [e['id'] for e in events]
+
+
+@pytest.fixture
+def calendar_client(http):
+    from cal import CalendarClient
+    return CalendarClient(http=http, store_path=None)
+
+
+def test_changes_keep_start_order_and_drop_cancelled():
+    store = EventStore()
+    store.replace_all([event('b', 2), event('a', 1), event('gone', 3, 'cancelled')], 'sync-1', NOW)
+    assert ids(store.upcoming(10, NOW)) == ['a', 'b']
+
+    # Moved, added and deleted elsewhere
+    store.apply_changes([event('a', 4), event('c', 3), event('b', 0, 'cancelled')], 'sync-2')
+    assert ids(store.upcoming(10, NOW)) == ['c', 'a']
+    assert store.sync_token == 'sync-2'
+
+
+def test_upcoming_prunes_ended_events_and_honours_the_window():
+    store = EventStore()
+    store.replace_all([event('past', -3), event('now', 0), event('later', 5)], 'sync-1', NOW - datetime.timedelta(hours=4))
+    later = NOW + datetime.timedelta(hours=5)
+    assert ids(store.upcoming(10, NOW, time_max=later)) == ['now']
+    assert ids(store.upcoming(10, NOW, time_min=later)) == ['later']
+    assert len(store) == 2
+
+
+def test_store_survives_a_restart(tmp_path):
+    path = str(tmp_path / 'events.db')
+    store = EventStore(path)
+    store.replace_all([event('a', 1), event('b', 2)], 'sync-1', NOW)
+    store.apply_changes([event('a', 1, 'cancelled'), event('c', 3)], 'sync-2')
+
+    reopened = EventStore(path)
+    assert ids(reopened.upcoming(10, NOW)) == ['b', 'c']
+    assert reopened.sync_token == 'sync-2'
+    assert reopened.horizon == NOW
+
+
+def test_sync_only_fetches_changes(fake, calendar_client):
+    fake.seed_events(3)
+    calendar_client.sync()
+    assert len(calendar_client.store) == 3
+    token = calendar_client.store.sync_token
+
+    first = sorted(fake.events)[0]
+    fake.cancel_event(first)
+    fake.seed_events(1)
+    fake.reset_counters()
+    calendar_client.sync()
+
+    assert first not in ids(calendar_client.store.upcoming(10))
+    assert len(calendar_client.store) == 3
+    assert calendar_client.store.sync_token != token
+    assert fake.counters()['calls']['calendar.events.list'] == 1
+
+
+def test_expired_sync_token_falls_back_to_a_full_sync(fake, calendar_client):
+    fake.seed_events(2)
+    calendar_client.sync()
+    stale = sorted(fake.events)[0]
+    fake.cancel_event(stale)
+    fake.expire_sync_tokens()
+    fake.reset_counters()
+
+    calendar_client.sync()
+
+    # One 410 for the token, then a full download without the deleted event
+    assert fake.counters()['calls']['calendar.events.list'] == 2
+    assert ids(calendar_client.store.upcoming(10)) == [e for e in sorted(fake.events) if e != stale]
+    assert calendar_client.store.sync_token
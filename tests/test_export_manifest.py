@@ -0,0 +1,55 @@
+import export_manifest
+from export_manifest import ExportManifest
+
+
+def test_current_only_for_the_same_time_format_and_file(tmp_path):
+    manifest = ExportManifest(str(tmp_path))
+    (tmp_path / 'Notes.md').write_text("# Notes")
+    manifest.record('doc', '2024-01-01T00:00:01.000Z', 'markdown', 'Notes.md', 7)
+
+    assert manifest.is_current('doc', '2024-01-01T00:00:01.000Z', 'markdown')
+    assert not manifest.is_current('doc', '2024-01-01T00:00:02.000Z', 'markdown')
+    assert not manifest.is_current('doc', '2024-01-01T00:00:01.000Z', 'pdf')
+    assert not manifest.is_current('other', '2024-01-01T00:00:01.000Z', 'markdown')
+
+    # A deleted file is exported again
+    (tmp_path / 'Notes.md').unlink()
+    assert not manifest.is_current('doc', '2024-01-01T00:00:01.000Z', 'markdown')
+
+
+def test_record_reports_the_file_a_rename_left_behind(tmp_path):
+    manifest = ExportManifest(str(tmp_path))
+    assert manifest.record('doc', 't1', 'markdown', 'Old.md', 1) is None
+    assert manifest.record('doc', 't2', 'markdown', 'New.md', 1) == 'Old.md'
+    assert manifest.record('doc', 't3', 'markdown', 'New.md', 1) is None
+
+
+def test_progress_is_saved_along_the_way(tmp_path, monkeypatch):
+    monkeypatch.setattr(export_manifest, 'SAVE_EVERY', 2)
+    manifest = ExportManifest(str(tmp_path))
+    manifest.record('a', 't', 'markdown', 'a.md', 1)
+    assert len(ExportManifest(str(tmp_path))) == 0
+    manifest.record('b', 't', 'markdown', 'b.md', 1)
+    assert len(ExportManifest(str(tmp_path))) == 2
+
+
+def test_damaged_manifest_exports_everything_again(tmp_path):
+    (tmp_path / export_manifest.MANIFEST_NAME).write_text('{"version": 1, "docs": ')
+    assert len(ExportManifest(str(tmp_path))) == 0
+
+
+def test_export_skips_unchanged_documents(fake, docs_client, tmp_path):
+    first = fake.seed_document("First", "One\n")
+    second = fake.seed_document("Second", "Two\n")
+    directory = str(tmp_path / 'archive')
+
+    result = docs_client.export_docs(directory, format='text')
+    assert {item['doc_id'] for item in result['exported']} == {first, second}
+
+    docs_client.add_info_to_existing_doc(second, "More")
+    fake.reset_counters()
+    result = docs_client.export_docs(directory, format='text')
+
+    assert result['skipped'] == 1
+    assert [item['doc_id'] for item in result['exported']] == [second]
+    assert fake.counters()['calls'].get('drive.files.export') == 1
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from idempotency import IdempotencyKeyReused, IdempotencyStore, fingerprint
+
+
+class Counter:
+    """Coroutine function that counts its calls and returns a new result each time."""
+
+    def __init__(self, fail=False, delay=0):
+        self.calls = 0
+        self.fail = fail
+        self.delay = delay
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("connection reset")
+        return f"https://docs.google.com/document/d/doc-{self.calls}/edit"
+
+
+def run(store, key, call, arguments=None, **kwargs):
+    return asyncio.run(store.run(key, fingerprint(arguments or {'title': "Notes"}), call, **kwargs))
+
+
+def test_repeat_returns_the_first_result():
+    store, call = IdempotencyStore(None), Counter()
+    first = run(store, 'user/create_google_doc/k1', call)
+    assert run(store, 'user/create_google_doc/k1', call) == first
+    assert call.calls == 1
+    assert store.stats()['hits'] == 1
+
+    # Another key is another call
+    assert run(store, 'user/create_google_doc/k2', call) != first
+    assert call.calls == 2
+
+
+def test_reused_key_with_other_arguments_is_refused():
+    store = IdempotencyStore(None)
+    run(store, 'user/create_google_doc/k1', Counter())
+    with pytest.raises(IdempotencyKeyReused, match="'k1'"):
+        run(store, 'user/create_google_doc/k1', Counter(), {'title': "Other"})
+
+
+def test_concurrent_repeat_waits_for_the_running_call():
+    store, call = IdempotencyStore(None), Counter(delay=0.05)
+
+    async def main():
+        key, arguments = 'user/create_google_doc/k1', fingerprint({'title': "Notes"})
+        return await asyncio.gather(store.run(key, arguments, call), store.run(key, arguments, call))
+
+    first, second = asyncio.run(main())
+    assert first == second
+    assert call.calls == 1
+    assert store.stats()['waits'] == 1
+
+
+def test_failures_and_rejected_results_are_not_remembered():
+    store = IdempotencyStore(None)
+    with pytest.raises(ConnectionError):
+        run(store, 'user/create_google_doc/k1', Counter(fail=True))
+    call = Counter()
+    run(store, 'user/create_google_doc/k1', call)
+    assert call.calls == 1
+
+    rejected = Counter()
+    run(store, 'user/create_google_doc/k2', rejected, keep=lambda result: False)
+    run(store, 'user/create_google_doc/k2', rejected, keep=lambda result: False)
+    assert rejected.calls == 2
+    assert store.stats()['keys'] == 1
+
+
+def test_expired_keys_run_again():
+    store, call = IdempotencyStore(None, ttl=0), Counter()
+    run(store, 'user/create_google_doc/k1', call)
+    run(store, 'user/create_google_doc/k1', call)
+    assert call.calls == 2
+
+
+def test_results_are_shared_through_the_file(tmp_path):
+    # Workers share the SQLite file, so a repeat landing on another one is still a hit
+    path = str(tmp_path / 'idempotency.db')
+    call = Counter()
+    first = run(IdempotencyStore(path), 'user/create_google_doc/k1', call)
+    assert run(IdempotencyStore(path), 'user/create_google_doc/k1', call) == first
+    assert call.calls == 1
+
+
+def test_fingerprint_ignores_key_order():
+    assert fingerprint({'a': 1, 'b': [1, 2]}) == fingerprint({'b': [1, 2], 'a': 1})
+    assert fingerprint({'a': 1}) != fingerprint({'a': 2})
+
+
+def test_create_tool_with_a_key_creates_once(fake, docs_client, monkeypatch):
+    import server
+    monkeypatch.setattr(server, 'docs_client', docs_client)
+
+    async def main():
+        first = await server.create_google_doc("Notes", idempotency_key="retry-me")
+        second = await server.create_google_doc("Notes", idempotency_key="retry-me")
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first == second
+    assert fake.counters()['calls']['docs.documents.create'] == 1
@@ -0,0 +1,29 @@
+import asyncio
+
+import server
+from workers import PoolSaturatedError
+
+
+def test_sync_tool_runs_through_instrumented_tool():
+    @server.instrumented_tool()
+    def sync_echo(text: str) -> str:
+        return f"echo {text}"
+
+    assert sync_echo("hi") == "echo hi"
+    assert "CWD:" in server.get_debugging_info()
+
+
+def test_sync_tool_reports_busy_when_saturated():
+    @server.instrumented_tool()
+    def sync_saturated() -> str:
+        raise PoolSaturatedError("docs worker pool is saturated")
+
+    assert sync_saturated() == server.SERVER_BUSY
+
+
+def test_async_tool_reports_busy_when_saturated():
+    @server.instrumented_tool(deadline=None)
+    async def async_saturated() -> str:
+        raise PoolSaturatedError("docs worker pool is saturated")
+
+    assert asyncio.run(async_saturated()) == server.SERVER_BUSY
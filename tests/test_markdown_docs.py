@@ -0,0 +1,117 @@
+from markdown_docs import compile_markdown, parse_blocks, parse_inline, utf16_len
+
+
+def apply_inserts(document, requests):
+    """Apply insertText requests to document text the way Docs does, counting UTF-16 units.
+
+    document is the body text from index 1 on. The tabs that createParagraphBullets
+    turns into nesting levels are left in, so see growth() for the final length.
+    """
+    units = document.encode('utf-16-le')
+    for request in requests:
+        insert = request.get('insertText')
+        if insert is None:
+            continue
+        offset = (insert['location']['index'] - 1) * 2
+        assert 0 <= offset <= len(units)
+        units = units[:offset] + insert['text'].encode('utf-16-le') + units[offset:]
+    return units
+
+
+def growth(document, units):
+    # createParagraphBullets removes the leading tabs it reads nesting levels from
+    return len(units) // 2 - utf16_len(document) - units.decode('utf-16-le').count('\t')
+
+
+def text_at(units, start, end):
+    return units[(start - 1) * 2:(end - 1) * 2].decode('utf-16-le')
+
+
+def ranges(requests):
+    for request in requests:
+        for body in request.values():
+            if 'range' in body:
+                yield body['range']['startIndex'], body['range']['endIndex'], body
+
+
+MARKDOWN = "# Hi 😀\n\n**bold** and *it* with `code`\n\n- one 🎉\n  - two\n1. first\n\n> quoted\n"
+
+
+def test_compile_markdown_indexes_into_empty_document():
+    requests, length = compile_markdown(MARKDOWN, 1)
+    units = apply_inserts('\n', requests)
+
+    # length is the growth in UTF-16 units, emoji counting as two
+    assert growth('\n', units) == length
+    for start, end, _ in ranges(requests):
+        assert 1 <= start < end <= 1 + len(units) // 2
+
+    styled = {
+        next(iter(body['textStyle'])): text_at(units, start, end)
+        for start, end, body in ranges(requests)
+        if body.get('textStyle')
+    }
+    assert styled['bold'] == 'bold'
+    assert styled['italic'] == 'it'
+    assert styled['weightedFontFamily'] == 'code'
+
+    heading = [
+        text_at(units, start, end) for start, end, body in ranges(requests)
+        if body.get('paragraphStyle', {}).get('namedStyleType') == 'HEADING_1'
+    ]
+    assert heading == ['Hi 😀']
+
+
+def test_compile_markdown_indexes_when_appending():
+    existing = 'Existing 😀 text\n'
+    index = utf16_len(existing)  # just before the final newline
+    requests, length = compile_markdown("Then **bold** 🎉", index, separate=True)
+    units = apply_inserts(existing, requests)
+
+    assert growth(existing, units) == length
+    assert text_at(units, 1, index + 1) == 'Existing 😀 text\n'
+    bold = [text_at(units, start, end) for start, end, body in ranges(requests) if body.get('textStyle', {}).get('bold')]
+    assert bold == ['bold']
+
+
+def test_compile_markdown_table_cells_fill_back_to_front():
+    requests, _ = compile_markdown("| a | b |\n|---|---|\n| 😀 | d |\n", 1)
+    table = next(i for i, request in enumerate(requests) if 'insertTable' in request)
+    cells = [
+        request['insertText']['location']['index']
+        for request in requests[table + 1:]
+        if 'insertText' in request
+    ]
+    # Each cell is filled after the ones behind it, so no insert shifts another
+    assert len(cells) == 4
+    assert cells == sorted(cells, reverse=True)
+    assert min(cells) > requests[table]['insertTable']['location']['index']
+
+
+def test_parse_inline_offsets_count_utf16_units():
+    plain, spans = parse_inline("😀 **bold** [link](https://example.com) `x`")
+    assert plain == "😀 bold link x"
+    assert spans == [
+        (3, 7, 'bold', None),
+        (8, 12, 'link', 'https://example.com'),
+        (13, 14, 'code', None),
+    ]
+
+
+def test_parse_blocks():
+    blocks = parse_blocks("# Title\r\n\nText\n\n- a\n  - b\n\n| x | y |\n|---|---|\n| 1 | 2 |\n\n```\n**not bold**\n```\n> quote")
+    assert blocks == [
+        ('paragraph', 'Title', 'HEADING_1'),
+        ('paragraph', 'Text', None),
+        ('list', False, [(0, 'a'), (1, 'b')]),
+        ('table', [['x', 'y'], ['1', '2']]),
+        ('code', ['**not bold**']),
+        ('quote', 'quote'),
+    ]
+
+
+def test_compile_markdown_trailing_newline_counts_in_length():
+    requests, length = compile_markdown("one 😀", 1, trailing_newline=True)
+    units = apply_inserts('Existing\n', requests)
+    assert text_at(units, 1, 1 + length) == "one 😀\n"
+    assert growth('Existing\n', units) == length
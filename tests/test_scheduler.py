@@ -0,0 +1,158 @@
+import json
+import socket
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+import scheduler
+from deadlines import with_deadline
+from scheduler import CircuitBreaker, CircuitOpenError
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    # Breakers are process-wide; give each test its own
+    monkeypatch.setattr(scheduler, '_breakers', {})
+
+
+def fail(breaker, times):
+    for _ in range(times):
+        breaker.allow()
+        breaker.record(False)
+
+
+def test_opens_after_threshold_failures():
+    breaker = CircuitBreaker('docs', failures=3, open_seconds=60)
+    fail(breaker, 2)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    fail(breaker, 1)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    assert breaker.stats()['rejected'] == 1
+
+
+def test_success_and_no_signal_while_closed():
+    breaker = CircuitBreaker('docs', failures=2, open_seconds=60)
+    fail(breaker, 1)
+    breaker.allow()
+    breaker.record(True)
+    assert breaker.failures == 0
+
+    # Outcomes that say nothing about the API's health don't count either way
+    fail(breaker, 1)
+    for _ in range(5):
+        breaker.allow()
+        breaker.record(None)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 1
+
+
+def test_half_open_probe_success_closes():
+    breaker = CircuitBreaker('docs', failures=1, open_seconds=0)
+    fail(breaker, 1)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # open_seconds has passed, so the next call is a probe
+    breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Only CIRCUIT_PROBES calls are let through while the probe is out
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.allow()
+    breaker.record(True)
+
+
+def test_half_open_probe_failure_reopens():
+    breaker = CircuitBreaker('docs', failures=1, open_seconds=0)
+    fail(breaker, 1)
+    breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.stats()['opened'] == 2
+
+
+def test_half_open_probe_without_signal_frees_the_slot():
+    breaker = CircuitBreaker('docs', failures=1, open_seconds=0)
+    fail(breaker, 1)
+    breaker.allow()
+    breaker.record(None)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+class TimingOut:
+    methodId = 'docs.documents.get'
+
+    def execute(self):
+        raise socket.timeout('timed out')
+
+
+def execute_timing_out():
+    with pytest.raises(TimeoutError):
+        scheduler.RequestScheduler().execute(TimingOut(), 'docs', 'read')
+
+
+def test_timeout_cut_short_by_deadline_is_not_a_failure():
+    with_deadline(execute_timing_out, 5)()
+    assert scheduler.get_breaker('docs').failures == 0
+
+
+def test_timeout_without_deadline_is_a_failure():
+    execute_timing_out()
+    assert scheduler.get_breaker('docs').failures == 1
+
+
+class Failing:
+    """Request that answers `status` a number of times before succeeding."""
+
+    methodId = 'docs.documents.batchUpdate'
+
+    def __init__(self, status, body=None, failures=1):
+        self.status = status
+        self.body = json.dumps(body) if body is not None else None
+        self.failures = failures
+        self.calls = 0
+
+    def execute(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise HttpError(httplib2.Response({'status': self.status, 'retry-after': '0'}), b'{}')
+        return {'ok': True}
+
+
+@pytest.mark.parametrize('kind, body', [
+    ('read', None),
+    ('write', {'requests': [], 'writeControl': {'requiredRevisionId': 'rev-1'}}),
+    ('write', {'summary': "Standup", 'requestId': 'req-1'}),
+])
+def test_5xx_is_retried_when_a_repeat_cannot_apply_twice(kind, body):
+    request = Failing(503, body)
+    assert scheduler.RequestScheduler().execute(request, 'docs', kind) == {'ok': True}
+    assert request.calls == 2
+
+
+@pytest.mark.parametrize('body', [None, {'requests': []}, {'title': "Notes"}])
+def test_5xx_on_other_writes_is_returned_at_once(body):
+    # Batches have no body; creates and unconditioned updates may have gone through
+    request = Failing(500, body)
+    with pytest.raises(HttpError):
+        scheduler.RequestScheduler().execute(request, 'docs', 'write')
+    assert request.calls == 1
+    assert scheduler.get_breaker('docs').failures == 1
+
+
+def test_rate_limited_writes_are_still_retried():
+    request = Failing(429, {'title': "Notes"})
+    assert scheduler.RequestScheduler().execute(request, 'docs', 'write') == {'ok': True}
+    assert request.calls == 2
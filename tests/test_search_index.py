@@ -0,0 +1,87 @@
+import json
+
+from search_index import SearchIndex, tokenize
+
+
+def ids(results):
+    return [r['doc_id'] for r in results]
+
+
+def test_ranks_by_bm25():
+    index = SearchIndex()
+    index.replace('notes', "Weekly notes about the budget", "Team notes")
+    index.replace('budget', "Budget budget budget for Q3", "Budget plan")
+    index.replace('other', "Nothing relevant here", "Misc")
+
+    assert ids(index.search("budget")) == ['budget', 'notes']
+    # Title terms count too
+    assert ids(index.search("misc")) == ['other']
+    assert index.search("missing") == [] and index.search("  ") == []
+    assert ids(index.search("budget", limit=1)) == ['budget']
+
+
+def test_appends_add_to_a_document_and_replace_drops_them():
+    index = SearchIndex()
+    index.replace('doc', "", "Standup")
+    index.add('doc', "Action item: migrate the database")
+    result, = index.search("database")
+    assert result['title'] == "Standup"
+    assert result['preview'] == "Action item: migrate the database"
+
+    # A full read replaces what the appends left, keeping the title
+    index.replace('doc', "Fresh content only")
+    assert index.search("database") == []
+    assert index.search("fresh")[0]['title'] == "Standup"
+    assert index.stats()['terms'] == len(set(tokenize("Standup Fresh content only")))
+
+
+def test_save_and_reload(tmp_path):
+    path = str(tmp_path / 'search_index.json')
+    index = SearchIndex(path)
+    index.replace('doc', "Quarterly roadmap", "Roadmap")
+    index.save()
+
+    reloaded = SearchIndex(path)
+    assert ids(reloaded.search("roadmap")) == ['doc']
+    assert json.loads((tmp_path / 'search_index.json').read_text())['version'] == 1
+
+
+def test_damaged_file_starts_empty(tmp_path):
+    path = tmp_path / 'search_index.json'
+    path.write_text('{"docs": {"doc": ')
+    assert len(SearchIndex(str(path))) == 0
+
+
+def test_docs_client_indexes_what_it_writes(fake, http):
+    from docs import GoogleDocsClient
+
+    client = GoogleDocsClient(http=http, search_index=SearchIndex())
+    created = client.create_doc_with_content("Launch plan", "Ship the beta in March")
+    client.add_info_to_existing_doc(created['doc_id'], "Invite the pilot customers")
+    fake.reset_counters()
+
+    assert ids(client.search_index.search("pilot beta")) == [created['doc_id']]
+    # Searching never goes to Google
+    assert fake.counters()['round_trips'] == 0
+
+
+def test_workers_sharing_a_file_keep_each_others_documents(tmp_path):
+    path = str(tmp_path / 'search_index.json')
+    first, second = SearchIndex(path), SearchIndex(path)
+    first.replace('from-first', "Hiring plan", "Hiring")
+    second.replace('from-second', "Offsite agenda", "Offsite")
+    first.save()
+    second.save()
+
+    assert sorted(ids(SearchIndex(path).search("hiring offsite"))) == ['from-first', 'from-second']
+    # Saving also picks up what the other worker indexed
+    assert ids(second.search("hiring")) == ['from-first']
+    first.save()
+    assert ids(first.search("offsite")) == ['from-second']
+
+    # A worker's own newer entry is not replaced by an older one on disk
+    second.replace('from-first', "Hiring plan, revised", "Hiring")
+    first.replace('other', "Unrelated")
+    first.save()
+    second.save()
+    assert SearchIndex(path).search("revised")[0]['doc_id'] == 'from-first'
@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+import scheduler
+import server
+import serving
+
+
+@pytest.fixture
+def no_serve(monkeypatch):
+    # Go through serve_http's setup without binding a port or serving
+    async def serve(app, sock, host, port, on_shutdown):
+        pass
+
+    monkeypatch.setattr(serving, '_bind', lambda host, port: None)
+    monkeypatch.setattr(serving, '_serve', serve)
+    monkeypatch.setattr(serving, '_app', lambda mcp, transport: None)
+
+
+def test_sse_falls_back_to_one_worker_and_says_so(no_serve):
+    started = []
+    serving.serve_http(server.mcp, transport='sse', host='127.0.0.1', port=1, workers=4,
+                       on_worker_start=lambda index, workers: started.append((index, workers)))
+    assert started == [(0, 1)]
+
+
+@pytest.mark.parametrize('workers, share', [(1, None), (4, 0.25)])
+def test_quota_share_follows_the_workers_started(monkeypatch, workers, share):
+    shares = []
+    monkeypatch.setattr(scheduler, 'set_quota_share', shares.append)
+    monkeypatch.setattr(server, 'STARTUP_MODE', 'lazy')
+    monkeypatch.setattr(server.metrics, 'METRICS_PORT', None)
+    monkeypatch.setattr(server, '_started_pid', None)
+    monkeypatch.setattr(serving, 'MCP_WORKERS', 4)
+
+    server._start_worker(0, workers)
+    assert shares == ([] if share is None else [share])
+    assert server._started_pid == os.getpid()
@@ -0,0 +1,51 @@
+import docs
+
+
+def fail_write(client, monkeypatch, on_write: int):
+    """Make the on_write-th batchUpdate from client fail before it is sent."""
+    execute = client._execute
+    writes = []
+
+    def flaky(request, kind, **kwargs):
+        if getattr(request, 'methodId', None) == 'docs.documents.batchUpdate':
+            writes.append(request)
+            if len(writes) == on_write:
+                raise ConnectionError("connection reset")
+        return execute(request, kind, **kwargs)
+
+    monkeypatch.setattr(client, '_execute', flaky)
+
+
+TEXT = ''.join(f"Line {i} of a long document\n" for i in range(12))
+
+
+def test_stream_insert_resumes_after_a_failed_chunk(fake, docs_client, monkeypatch):
+    monkeypatch.setattr(docs, 'MAX_CHUNK_CHARS', 64)
+    document_id = fake.seed_document("Target", "Existing\n")
+    fail_write(docs_client, monkeypatch, on_write=3)
+
+    failed = docs_client.stream_insert(document_id, TEXT, 'end')
+    assert not failed['success']
+    assert failed['resumable']
+    assert failed['chunks_committed'] == 2
+
+    done = docs_client.stream_insert(document_id, TEXT, 'end')
+    assert done['success']
+    assert done['chunks'] == failed['chunks']
+    # Nothing written twice, nothing skipped
+    assert fake.documents[document_id]['text'] == "Existing\n\n" + TEXT + "\n"
+
+
+def test_create_doc_with_content_reports_how_to_resume(fake, docs_client, monkeypatch):
+    monkeypatch.setattr(docs, 'MAX_CHUNK_CHARS', 64)
+    fail_write(docs_client, monkeypatch, on_write=2)
+
+    created = docs_client.create_doc_with_content("New", TEXT)
+    assert created['success']
+    assert created['resumable']
+    assert created['chunks_committed'] == 1
+
+    # What create_doc_with_content tells the client to do next
+    done = docs_client.stream_insert(created['doc_id'], TEXT, 'beginning')
+    assert done['success']
+    assert fake.documents[created['doc_id']]['text'] == TEXT + "\n"
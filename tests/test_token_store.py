@@ -0,0 +1,60 @@
+import datetime
+import os
+import stat
+
+import pytest
+
+from authentication import CredentialManager, MissingTokenError
+from token_store import TokenStore
+
+
+def token(access='ya29.first', expires_in=3600):
+    expiry = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) + datetime.timedelta(seconds=expires_in)
+    return {
+        'token': access,
+        'refresh_token': '1//refresh',
+        'client_id': 'client.apps.googleusercontent.com',
+        'client_secret': 'secret',
+        'expiry': expiry.isoformat() + 'Z',
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TokenStore(str(tmp_path / 'tokens.db'))
+
+
+def test_save_load_and_delete(store):
+    assert store.load('alice') is None
+    store.save('alice', token())
+    store.save('bob', token('ya29.bob'))
+    store.save('alice', token('ya29.second'))
+
+    assert store.load('alice')['token'] == 'ya29.second'
+    assert store.users() == ['alice', 'bob']
+    store.delete('alice')
+    assert store.load('alice') is None
+    assert store.users() == ['bob']
+
+
+def test_file_is_private_and_shared_between_processes(store):
+    assert stat.S_IMODE(os.stat(store.path).st_mode) == 0o600
+
+    # Another worker opening the same file sees the refresh straight away
+    other = TokenStore(store.path)
+    store.save('alice', token('ya29.refreshed'))
+    assert other.load('alice')['token'] == 'ya29.refreshed'
+
+
+def test_credentials_come_from_the_store(store):
+    store.save('alice', token('ya29.alice'))
+    creds = CredentialManager('alice', interactive=False, store=store)
+    try:
+        assert creds.get().token == 'ya29.alice'
+    finally:
+        creds.close()
+
+
+def test_missing_token_without_browser_flow(store):
+    with pytest.raises(MissingTokenError, match="'carol'"):
+        CredentialManager('carol', interactive=False, store=store).get()
@@ -0,0 +1,83 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# SQLite file holding every user's OAuth token, readable only by its owner
+TOKEN_STORE_PATH = os.getenv('TOKEN_STORE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tokens.db'))
+
+# How long a writer waits for another process's lock before giving up, in seconds
+LOCK_TIMEOUT_SECONDS = 10
+
+
+class TokenStore:
+    """OAuth tokens keyed by user id, stored as JSON in SQLite.
+
+    Every write is a single transaction, so a crash never leaves half a token
+    behind, and SQLite's file locking keeps worker processes that share the
+    file from trampling each other. Tokens are plain authorized-user JSON
+    (what google-auth's Credentials.to_json() produces), never pickles.
+
+    Args:
+        path (str): SQLite file, created with owner-only permissions
+    """
+
+    def __init__(self, path: str = TOKEN_STORE_PATH):
+        self.path = path
+        if not os.path.exists(path):
+            os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o600))
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=LOCK_TIMEOUT_SECONDS, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS tokens (user_id TEXT PRIMARY KEY, token TEXT NOT NULL, updated REAL NOT NULL)'
+        )
+
+    def load(self, user_id: str):
+        """The user's token as a dict, or None if we have none."""
+        with self._lock:
+            row = self._db.execute('SELECT token FROM tokens WHERE user_id = ?', (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, user_id: str, token: dict):
+        with self._lock:
+            self._db.execute(
+                'INSERT INTO tokens (user_id, token, updated) VALUES (?, ?, ?) '
+                'ON CONFLICT(user_id) DO UPDATE SET token = excluded.token, updated = excluded.updated',
+                (user_id, json.dumps(token), time.time())
+            )
+
+    def delete(self, user_id: str):
+        with self._lock:
+            self._db.execute('DELETE FROM tokens WHERE user_id = ?', (user_id,))
+
+    def users(self) -> list:
+        with self._lock:
+            return [user_id for (user_id,) in self._db.execute('SELECT user_id FROM tokens ORDER BY user_id')]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_token_store() -> TokenStore:
+    """The process-wide token store, opened on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TokenStore()
+        return _store
+
+
+def _forget_store():
+    # A SQLite connection must not be shared with a forked child
+    global _store
+    _store = None
+
+
+os.register_at_fork(after_in_child=_forget_store)
@@ -0,0 +1,169 @@
+import os
+import queue
+import threading
+from dotenv import load_dotenv
+
+from deadlines import DeadlineExceeded, remaining
+
+load_dotenv()
+
+
+# Most authorized connections kept open at once, shared by every service
+HTTP_POOL_SIZE = int(os.getenv('GOOGLE_HTTP_POOL_SIZE', 8))
+
+# Socket timeout in seconds for each Google API call (shortened to fit a tool's deadline)
+HTTP_TIMEOUT = float(os.getenv('GOOGLE_HTTP_TIMEOUT', 60))
+
+
+class PooledHttp:
+    """Thread-safe drop-in for httplib2.Http, backed by a pool of AuthorizedHttp objects.
+
+    httplib2.Http is not safe to share between threads, so each request checks
+    out its own AuthorizedHttp and hands it back afterwards. The pool is LIFO,
+    so the most recently used (warm, keep-alive) connection is reused first.
+    Pass it to build_service(..., http=...) in place of credentials; the docs
+    and calendar services can share one instance. Inside a tool call with a
+    deadline, waiting for a connection and each socket operation are cut
+    short to the time left.
+
+    Args:
+        credentials: google.auth credentials applied to every request
+        pool_size (int): Most connections open at once; extra callers wait
+        timeout (float): Socket timeout in seconds
+        http_factory: Optional callable returning a fresh httplib2.Http-like
+            object, e.g. a fake for benchmarks
+    """
+
+    def __init__(self, credentials, pool_size: int = HTTP_POOL_SIZE, timeout: float = HTTP_TIMEOUT, http_factory=None):
+        self.credentials = credentials
+        self.pool_size = max(1, pool_size)
+        self.timeout = timeout
+        self._http_factory = http_factory
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _new_http(self):
+        if self._http_factory is not None:
+            return self._http_factory()
+
+        import httplib2
+        import google_auth_httplib2
+
+        return google_auth_httplib2.AuthorizedHttp(
+            self.credentials,
+            http=httplib2.Http(timeout=self.timeout)
+        )
+
+    def _checkout(self, timeout: float = None):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.pool_size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+
+        if create:
+            try:
+                return self._new_http()
+            except BaseException:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise DeadlineExceeded("Ran out of time waiting for a free Google API connection (tool deadline exceeded)") from None
+
+    def _set_timeout(self, http, timeout: float):
+        # httplib2 applies its timeout when it connects, so open sockets are updated too
+        inner = getattr(http, 'http', http)
+        connections = getattr(inner, 'connections', None)
+        if connections is None or inner.timeout == timeout:
+            return
+        inner.timeout = timeout
+        for connection in list(connections.values()):
+            connection.timeout = timeout
+            sock = getattr(connection, 'sock', None)
+            if sock is not None:
+                sock.settimeout(timeout)
+
+    def _discard(self, http):
+        with self._lock:
+            self._created -= 1
+        # AuthorizedHttp wraps the httplib2.Http that owns the sockets
+        inner = getattr(http, 'http', http)
+        close = getattr(inner, 'close', None)
+        if close is not None:
+            close()
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5, connection_type=None):
+        headers = dict(headers or {})
+        # Ask for compressed responses; httplib2 decompresses transparently
+        if not any(key.lower() == 'accept-encoding' for key in headers):
+            headers['accept-encoding'] = 'gzip, deflate'
+
+        timeout = self.timeout
+        left = remaining()
+        if left is not None:
+            if left <= 0:
+                raise DeadlineExceeded("Ran out of time before calling the Google API (tool deadline exceeded)")
+            timeout = min(timeout, left)
+
+        http = self._checkout(None if left is None else timeout)
+        try:
+            self._set_timeout(http, timeout)
+            result = http.request(
+                uri,
+                method,
+                body=body,
+                headers=headers,
+                redirections=redirections,
+                connection_type=connection_type
+            )
+        except BaseException:
+            # The connection may be half-used; don't hand it to the next caller
+            self._discard(http)
+            raise
+        self._idle.put(http)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            'pool_size': self.pool_size,
+            'open': self._created,
+            'idle': self._idle.qsize(),
+            'timeout': self.timeout,
+        }
+
+    def close(self):
+        while True:
+            try:
+                http = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(http)
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_http(credentials) -> PooledHttp:
+    """The process-wide pooled transport for these credentials."""
+    global _shared
+    with _shared_lock:
+        if _shared is None or _shared.credentials is not credentials:
+            if _shared is not None:
+                _shared.close()
+            _shared = PooledHttp(credentials)
+        return _shared
+
+
+def http_stats() -> dict:
+    return _shared.stats() if _shared is not None else {}
@@ -0,0 +1,209 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+import metrics
+from logs import get_logger
+
+load_dotenv()
+
+log = get_logger('user_clients')
+
+
+# Users whose clients are kept warm at once; the least recently used go first
+USER_CLIENTS_MAX = int(os.getenv('USER_CLIENTS_MAX', 32))
+
+# Drop a user's clients after this many seconds without a call
+USER_CLIENTS_IDLE_SECONDS = float(os.getenv('USER_CLIENTS_IDLE_SECONDS', 900))
+
+# Keep-alive connections per user (the shared default transport has GOOGLE_HTTP_POOL_SIZE)
+USER_HTTP_POOL_SIZE = int(os.getenv('USER_HTTP_POOL_SIZE', 2))
+
+
+class _UserEntry:
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.lock = threading.Lock()
+        self.manager = None
+        self.http = None
+        self.scheduler = None
+        self.docs = None
+        self.calendar = None
+        self.last_used = time.monotonic()
+
+    def close(self):
+        if self.manager is not None:
+            self.manager.close()
+        if self.http is not None:
+            self.http.close()
+
+
+class UserClients:
+    """LRU of per-user Google clients, bounded in size and evicted when idle.
+
+    Each user gets their own credentials (from the token store), connection
+    pool and quota scheduler, shared by that user's Docs and Calendar clients,
+    which are built on first use. Rendered documents are cached once for
+    everyone: a cached read is only served after the reader's own Drive call
+    confirms the version, so it never shows a user a document they can't open.
+
+    Args:
+        max_users (int): Most users kept; the least recently used is evicted
+        idle_seconds (float): Evict users with no call for this long
+    """
+
+    def __init__(self, max_users: int = USER_CLIENTS_MAX, idle_seconds: float = USER_CLIENTS_IDLE_SECONDS):
+        self.max_users = max(1, max_users)
+        self.idle_seconds = idle_seconds
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._doc_cache = None
+        self._sweeper = None
+
+    def docs(self, user_id: str):
+        """The user's GoogleDocsClient, built on first use."""
+        entry = self._entry(user_id)
+        with entry.lock:
+            if entry.docs is None:
+                from docs import GoogleDocsClient
+                from search_index import SearchIndex
+
+                self._connect(entry)
+                # Search results must not leak other users' documents, so each
+                # user's index is their own (in memory, dropped on eviction)
+                entry.docs = GoogleDocsClient(
+                    http=entry.http,
+                    scheduler=entry.scheduler,
+                    doc_cache=self._shared_doc_cache(),
+                    search_index=SearchIndex(None),
+                )
+                self._trim()
+            return entry.docs
+
+    def calendar(self, user_id: str):
+        """The user's CalendarClient, built on first use."""
+        entry = self._entry(user_id)
+        with entry.lock:
+            if entry.calendar is None:
+                from cal import CalendarClient
+
+                self._connect(entry)
+                # The event store stays in memory: one SQLite file can't hold many calendars
+                entry.calendar = CalendarClient(http=entry.http, scheduler=entry.scheduler, store_path=None)
+                self._trim()
+            return entry.calendar
+
+    def _connect(self, entry: _UserEntry):
+        if entry.http is not None:
+            return
+        from authentication import CredentialManager
+        from scheduler import RequestScheduler
+        from transport import PooledHttp
+
+        manager = CredentialManager(entry.user_id, interactive=False)
+        try:
+            # Raises MissingTokenError for users who were never authorized
+            creds = manager.get()
+        except Exception:
+            # Unknown users mustn't push real ones out of the cache
+            with self._lock:
+                if self._entries.get(entry.user_id) is entry:
+                    del self._entries[entry.user_id]
+            raise
+        entry.manager = manager
+        entry.http = PooledHttp(creds, pool_size=USER_HTTP_POOL_SIZE)
+        entry.scheduler = RequestScheduler()
+
+    def _shared_doc_cache(self):
+        from doc_cache import DocumentCache
+
+        with self._lock:
+            if self._doc_cache is None:
+                self._doc_cache = DocumentCache()
+            return self._doc_cache
+
+    def _entry(self, user_id: str) -> _UserEntry:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                entry = self._entries[user_id] = _UserEntry(user_id)
+                self._start_sweeper()
+            self._entries.move_to_end(user_id)
+            entry.last_used = time.monotonic()
+            return entry
+
+    def _trim(self):
+        """Evict the least recently used users above max_users (after a user connects successfully)"""
+        with self._lock:
+            evicted = []
+            while len(self._entries) > self.max_users:
+                _, oldest = self._entries.popitem(last=False)
+                evicted.append(oldest)
+        for old in evicted:
+            self._evict(old)
+
+    def _evict(self, entry: _UserEntry):
+        self.evictions += 1
+        metrics.user_clients_evicted.inc()
+        log.info("Evicted clients for user %s", entry.user_id)
+        entry.close()
+
+    def _start_sweeper(self):
+        # Idle users are also dropped when nobody else calls in to push them out
+        if self._sweeper is None:
+            self._sweeper = threading.Thread(target=self._sweep_loop, name='user-clients-sweeper', daemon=True)
+            self._sweeper.start()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(max(1.0, self.idle_seconds / 4))
+            self.evict_idle()
+
+    def evict_idle(self):
+        """Drop every user idle for longer than idle_seconds."""
+        now = time.monotonic()
+        with self._lock:
+            idle = [user_id for user_id, entry in self._entries.items() if now - entry.last_used >= self.idle_seconds]
+            evicted = [self._entries.pop(user_id) for user_id in idle]
+        for entry in evicted:
+            self._evict(entry)
+
+    def drop(self, user_id: str):
+        """Forget one user's clients, so the next call reloads their token from the store."""
+        with self._lock:
+            entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            entry.close()
+
+    def clear(self):
+        with self._lock:
+            evicted = list(self._entries.values())
+            self._entries.clear()
+        for entry in evicted:
+            self._evict(entry)
+
+    def stats(self) -> dict:
+        with self._lock:
+            users = len(self._entries)
+        return {
+            'users': users,
+            'max_users': self.max_users,
+            'idle_seconds': self.idle_seconds,
+            'evictions': self.evictions,
+        }
+
+
+_clients = None
+_clients_lock = threading.Lock()
+
+
+def get_user_clients() -> UserClients:
+    """The process-wide cache of per-user clients."""
+    global _clients
+    with _clients_lock:
+        if _clients is None:
+            _clients = UserClients()
+        return _clients
@@ -0,0 +1,105 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# Default limits per Google service. Override with <SERVICE>_MAX_WORKERS and
+# <SERVICE>_MAX_QUEUE in your .env file, e.g. DOCS_MAX_WORKERS=8
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_QUEUE = 32
+
+
+class PoolSaturatedError(RuntimeError):
+    """Raised when a service pool already has max_queue calls waiting or running."""
+
+
+class ServiceWorkerPool:
+    """Bounded thread pool that runs blocking Google API calls off the event loop.
+
+    Args:
+        name (str): Service name, used for thread names and error messages
+        max_workers (int): Number of calls that may run at the same time
+        max_queue (int): Number of calls that may be running or waiting before
+            new calls are rejected with PoolSaturatedError
+    """
+
+    def __init__(self, name: str, max_workers: int = DEFAULT_MAX_WORKERS, max_queue: int = DEFAULT_MAX_QUEUE):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(self.max_workers, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{name}-api")
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of calls currently running or waiting for a worker."""
+        return self._pending
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on a worker thread and await its result.
+
+        The caller's contextvars are copied to the worker so per-request state
+        follows the call onto the thread.
+        """
+        with self._lock:
+            if self._pending >= self.max_queue:
+                raise PoolSaturatedError(
+                    f"{self.name} worker pool is saturated ({self._pending} calls pending, limit {self.max_queue})"
+                )
+            self._pending += 1
+
+        try:
+            loop = asyncio.get_running_loop()
+            ctx = contextvars.copy_context()
+            return await loop.run_in_executor(self._executor, lambda: ctx.run(fn, *args, **kwargs))
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def stats(self) -> dict:
+        return {
+            'max_workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'pending': self._pending,
+        }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _env_int(key: str, default: int) -> int:
+    try:
+        return int(os.getenv(key, default))
+    except ValueError:
+        return default
+
+
+def get_pool(service: str) -> ServiceWorkerPool:
+    """Get (or lazily create) the worker pool for a Google service like 'docs' or 'calendar'."""
+    with _pools_lock:
+        pool = _pools.get(service)
+        if pool is None:
+            prefix = service.upper()
+            pool = ServiceWorkerPool(
+                service,
+                max_workers=_env_int(f"{prefix}_MAX_WORKERS", DEFAULT_MAX_WORKERS),
+                max_queue=_env_int(f"{prefix}_MAX_QUEUE", DEFAULT_MAX_QUEUE),
+            )
+            _pools[service] = pool
+        return pool
+
+
+def pool_stats() -> dict:
+    """Snapshot of every pool that has been created so far."""
+    with _pools_lock:
+        return {name: pool.stats() for name, pool in _pools.items()}